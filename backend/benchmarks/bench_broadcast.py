@@ -0,0 +1,96 @@
+# Broadcast latency with many connected clients, some of them slow or
+# stalled: per-connection queues and writers vs awaiting each socket in turn.
+# Usage: python benchmarks/bench_broadcast.py [--clients 10000] [--slow 100] [--broadcasts 20]
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from routes.realtime import ConnectionManager
+
+
+class FakeSocket:
+    # Records when each message arrived; slow sockets take `delay` per send
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.arrivals = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        await asyncio.sleep(self.delay)
+        self.arrivals.append(time.perf_counter())
+
+    async def close(self):
+        pass
+
+
+def percentiles(values):
+    if not values:
+        return "n/a"
+    p50, p99 = np.percentile(values, [50, 99])
+    return f"p50 {p50:.1f} ms, p99 {p99:.1f} ms, max {max(values):.1f} ms"
+
+
+async def sequential_broadcast(sockets, message):
+    # What the manager used to do
+    for socket in sockets:
+        try:
+            await socket.send_text(message)
+        except Exception:
+            pass
+
+
+async def main(args):
+    sockets = [FakeSocket(args.slow_delay if i < args.slow else 0.0) for i in range(args.clients)]
+    fast = sockets[args.slow:]
+
+    started = time.perf_counter()
+    await sequential_broadcast(sockets, "x")
+    print(f"sequential, 1 broadcast: {(time.perf_counter() - started) * 1000:.0f} ms until the last client")
+    for socket in sockets:
+        socket.arrivals.clear()
+
+    manager = ConnectionManager()
+    for i, socket in enumerate(sockets):
+        await manager.connect(socket, f"collector_{i}")
+
+    call_ms, sent_at = [], []
+    for _ in range(args.broadcasts):
+        started = time.perf_counter()
+        await manager.broadcast_to_collectors("x")
+        call_ms.append((time.perf_counter() - started) * 1000)
+        sent_at.append(started)
+        await asyncio.sleep(args.interval)
+    await asyncio.sleep(0.5)
+
+    latencies = [
+        (arrival - sent) * 1000
+        for socket in fast
+        for arrival, sent in zip(socket.arrivals, sent_at)
+    ]
+    delivered = sum(len(socket.arrivals) for socket in fast)
+    dropped = sum(connection.dropped for connection in manager.collector_connections)
+    print(f"queued, {args.broadcasts} broadcasts to {args.clients} clients ({args.slow} slow, {args.slow_delay:.2f} s per send):")
+    print(f"  broadcast call: {percentiles(call_ms)}")
+    print(f"  delivery to fast clients: {percentiles(latencies)} ({delivered}/{len(fast) * args.broadcasts} delivered)")
+    print(f"  dropped for slow clients: {dropped}, still connected: {manager.connection_count()}")
+
+    for connection in list(manager.collector_connections):
+        manager.disconnect(connection)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--slow", type=int, default=100)
+    parser.add_argument("--slow-delay", type=float, default=0.05)
+    parser.add_argument("--broadcasts", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,85 @@
+# Throughput of /classify-waste style inference at 1/8/64 concurrent uploads,
+# unbatched (one inference call per upload) vs micro-batched. With --check,
+# exits non-zero if batching is more than --tolerance slower at concurrency 8.
+# Usage: python benchmarks/bench_classifier.py [--requests 512] [--backend numpy] [--check]
+import argparse
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from services.classifier import CATEGORIES, ClassificationService, NumpyClassifier, create_backend
+
+
+def sample_images(count: int, size: int = 224):
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(count):
+        buffer = io.BytesIO()
+        Image.fromarray(rng.integers(0, 255, (size, size, 3), dtype=np.uint8)).save(buffer, format="JPEG")
+        images.append(buffer.getvalue())
+    return images
+
+
+def random_model(path: str):
+    rng = np.random.default_rng(1)
+    features = NumpyClassifier.image_size ** 2 * 3
+    np.savez(path, W=rng.normal(0, 0.01, (features, len(CATEGORIES))), b=np.zeros(len(CATEGORIES)), labels=np.array(CATEGORIES))
+
+
+async def run(service: ClassificationService, images, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(image):
+        async with semaphore:
+            await service.classify(image)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(image) for image in images))
+    return len(images) / (time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--backend", default="numpy", choices=["mock", "numpy"])
+    parser.add_argument("--check", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    images = sample_images(args.requests)
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, "model.npz")
+        random_model(model_path)
+
+        def backend():
+            return NumpyClassifier(model_path) if args.backend == "numpy" else create_backend("mock")
+
+        print(f"{'concurrency':>11} {'unbatched req/s':>16} {'batched req/s':>14}")
+        rates = {}
+        for concurrency in (1, 8, 64):
+            unbatched = ClassificationService(backend())
+            await unbatched.load()
+            batched = ClassificationService(backend())
+            await batched.start()
+            plain_rate = await run(unbatched, images, concurrency)
+            batched_rate = await run(batched, images, concurrency)
+            await batched.stop()
+            rates[concurrency] = (plain_rate, batched_rate)
+            print(f"{concurrency:>11} {plain_rate:>16.1f} {batched_rate:>14.1f}")
+
+    if args.check:
+        plain_rate, batched_rate = rates[8]
+        if batched_rate < plain_rate * (1.0 - args.tolerance):
+            sys.exit(f"Batching regressed throughput at concurrency 8: {batched_rate:.1f} vs {plain_rate:.1f} req/s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+# Memory use of exporting a year of audit logs: the streaming NDJSON export
+# (server-side cursor, one batch at a time) against loading every row first,
+# as a huge ?limit= on the list endpoint would. Seeds the rows if needed.
+# Each mode runs in a fresh process so peak RSS is its own.
+# Usage: python benchmarks/bench_export.py [--rows 1000000]  (needs DATABASE_URL)
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+SEED_BATCH = 20000
+
+
+def peak_rss_mb():
+    # VmHWM, unlike ru_maxrss, starts over in the spawned process
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+async def seed(rows):
+    from sqlalchemy import func, insert
+    from sqlalchemy.future import select
+    from database import AsyncSessionLocal, engine
+    from tables import AuditLog, Base, generate_uuid
+
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    async with AsyncSessionLocal() as db:
+        existing = (await db.execute(select(func.count(AuditLog.id)))).scalar()
+        start = datetime.utcnow() - timedelta(days=365)
+        step = 365 * 86400 / max(rows, 1)
+        for offset in range(existing, rows, SEED_BATCH):
+            await db.execute(insert(AuditLog), [{
+                "id": generate_uuid(), "user_id": None, "action": "GET", "endpoint": f"/api/citizen/stats/user{i % 5000}@example.com",
+                "ip_address": "10.0.0.1", "status_code": 200, "duration_ms": 3.2, "timestamp": start + timedelta(seconds=i * step),
+            } for i in range(offset, min(offset + SEED_BATCH, rows))])
+            await db.commit()
+    await engine.dispose()
+
+
+async def run_export():
+    from sqlalchemy.future import select
+    from services.pagination import ndjson_lines, stream_rows
+    from tables import AuditLog
+
+    columns = list(AuditLog.__table__.columns)
+    query = select(*columns).order_by(AuditLog.timestamp, AuditLog.id)
+    size = 0
+    async for chunk in ndjson_lines([column.key for column in columns], stream_rows(query)):
+        size += len(chunk)
+    return size
+
+
+async def run_load_all():
+    import json
+    from sqlalchemy.future import select
+    from database import AsyncSessionLocal
+    from tables import AuditLog
+
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(select(AuditLog).order_by(AuditLog.timestamp.desc()))).scalars().all()
+        return len(json.dumps([{column.key: getattr(row, column.key) for column in AuditLog.__table__.columns} for row in rows], default=str))
+
+
+def measure(mode, results):
+    import services.pagination  # imports are not part of the measurement
+    baseline = peak_rss_mb()
+    started = time.perf_counter()
+    size = asyncio.run(run_export() if mode == "stream" else run_load_all())
+    results.put((mode, time.perf_counter() - started, size, peak_rss_mb() - baseline))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+    asyncio.run(seed(args.rows))
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    for mode in ("stream", "load_all"):
+        process = context.Process(target=measure, args=(mode, results))
+        process.start()
+        mode, seconds, size, growth = results.get()
+        process.join()
+        print(f"{mode:>8}: {seconds:6.2f} s, {size / 1e6:7.1f} MB of output, peak RSS +{growth:7.1f} MB")
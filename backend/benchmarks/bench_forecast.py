@@ -0,0 +1,55 @@
+# Forecast run over a synthetic year of city-wide history: how long the
+# vectorized compute step takes for a given number of events.
+# Usage: python benchmarks/bench_forecast.py [--events 2000000] [--days 365]
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from services.forecast import (
+    KIND_ACTIVITY, KIND_COLLECTION, KIND_OVERFLOW, KIND_PICKUP, KIND_RECYCLED, KIND_REPORT, compute_forecast,
+)
+
+KINDS = np.array([KIND_PICKUP, KIND_REPORT, KIND_OVERFLOW, KIND_ACTIVITY, KIND_COLLECTION, KIND_RECYCLED], dtype=np.int8)
+KIND_SHARE = [0.35, 0.1, 0.05, 0.3, 0.12, 0.08]
+
+
+def synthetic_history(rng, n, days, now):
+    # ~40x40 km city, a third of the load around a few dozen busy spots
+    center = np.array([28.2096, 83.9856])
+    spots = center + rng.uniform(-0.18, 0.18, (40, 2))
+    clustered = spots[rng.integers(0, len(spots), n // 3)] + rng.normal(0, 0.003, (n // 3, 2))
+    spread = center + rng.uniform(-0.18, 0.18, (n - n // 3, 2))
+    coords = np.vstack((clustered, spread))
+    kind = KINDS[rng.choice(len(KINDS), n, p=KIND_SHARE)]
+    coords[kind == KIND_ACTIVITY] = np.nan
+    seconds = rng.uniform(0, days * 86400, n).astype(np.int64)
+    when = np.datetime64(now, "s") - seconds.astype("timedelta64[s]")
+    return {"lat": coords[:, 0].copy(), "lng": coords[:, 1].copy(), "when": when, "kind": kind}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=2000000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    now = datetime.utcnow()
+    history = synthetic_history(np.random.default_rng(args.seed), args.events, args.days, now)
+    started = time.perf_counter()
+    result = compute_forecast(history, now, history_days=args.days)
+    elapsed = time.perf_counter() - started
+
+    print(f"{result['events']} events over {args.days} days: compute {elapsed:.2f} s")
+    print(f"trend: {result['waste_generation_trend']}, window: {result['optimal_collection_time']}, "
+          f"recycling: {result['recycling_efficiency']}, overflow areas: {len(result['predicted_overflow'])}")
+
+
+if __name__ == "__main__":
+    main()
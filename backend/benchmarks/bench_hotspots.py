@@ -0,0 +1,66 @@
+# Hotspot queries over a synthetic city: cold build, cached queries at
+# several zoom levels, and the cost of folding in newly arrived reports.
+# Usage: python benchmarks/bench_hotspots.py [--points 300000] [--queries 50]
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from services.hotspots import HotspotIndex
+
+CATEGORIES = ["overflow", "illegal_dumping", "missed_pickup", "organic", "recyclable", "hazardous"]
+
+
+def synthetic_points(rng, n, now):
+    # Half the load around a few dumping hotspots, the rest spread over ~20x20 km
+    centers = rng.uniform((-0.08, -0.08), (0.08, 0.08), (12, 2)) + (28.2096, 83.9856)
+    clustered = centers[rng.integers(0, len(centers), n // 2)] + rng.normal(0, 0.002, (n // 2, 2))
+    spread = rng.uniform((-0.1, -0.1), (0.1, 0.1), (n - n // 2, 2)) + (28.2096, 83.9856)
+    coords = np.vstack((clustered, spread))
+    ages = rng.uniform(0, 60, n)
+    categories = rng.integers(0, len(CATEGORIES), n)
+    return [(lat, lng, now - timedelta(days=age), CATEGORIES[c]) for (lat, lng), age, c in zip(coords.tolist(), ages.tolist(), categories.tolist())]
+
+
+def timed(fn, repeat=1):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - started) * 1000.0 / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=300000)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    now = datetime.utcnow()
+    index = HotspotIndex()
+    load_ms, _ = timed(lambda: index.add_points(synthetic_points(rng, args.points, now)))
+    print(f"loaded {len(index)} points in {load_ms:.0f} ms")
+
+    print(f"{'zoom':>5} {'window':>7} {'bbox':>5} {'cold ms':>8} {'warm ms':>8} {'cells':>6}")
+    city = (28.11, 83.88, 28.31, 84.09)
+    street = (28.200, 83.975, 28.220, 83.995)
+    for zoom, window, bbox in ((11, "30d", None), (13, "30d", city), (13, "7d", city), (16, "24h", street), (16, "all", street)):
+        cold_ms, _ = timed(lambda: index.query(bbox=bbox, zoom=zoom, window=window))
+        warm_ms, cells = timed(lambda: index.query(bbox=bbox, zoom=zoom, window=window), args.queries)
+        print(f"{zoom:>5} {window:>7} {'yes' if bbox else 'no':>5} {cold_ms:>8.2f} {warm_ms:>8.2f} {len(cells):>6}")
+
+    # New reports land while the aggregates above are cached
+    batch = synthetic_points(rng, 100, now)
+    update_ms, _ = timed(lambda: index.add_points(batch), 20)
+    query_ms, _ = timed(lambda: index.query(bbox=city, zoom=13, window="30d"), args.queries)
+    print(f"incremental update of 100 reports: {update_ms:.2f} ms, query afterwards: {query_ms:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# Leaderboard index at city scale: build time, memory, rank and window
+# lookups, and applying award batches (as they arrive over pub/sub).
+# Usage: python benchmarks/bench_leaderboard.py [--citizens 1000000] [--batch 50]
+import argparse
+import os
+import sys
+import time
+import uuid
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from services.leaderboard import CreditIndex
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1e6)
+    return np.percentile(samples, [50, 99])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--citizens", type=int, default=1000000)
+    parser.add_argument("--batch", type=int, default=50, help="Awards per applied batch")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    user_ids = [str(uuid.UUID(int=int(value))) for value in rng.integers(0, 2**62, args.citizens)]
+    credits = rng.geometric(0.01, args.citizens)  # long tail, lots of ties
+
+    started = time.perf_counter()
+    index = CreditIndex.build(user_ids, credits)
+    print(f"build {args.citizens} citizens: {time.perf_counter() - started:.2f} s, ~{index.memory_bytes() / 2**20:.0f} MiB")
+
+    probes = rng.integers(0, args.citizens, 1000)
+    p50, p99 = timed(lambda: index.rank(user_ids[probes[rng.integers(0, 1000)]]), 1000)
+    print(f"rank:            p50 {p50:7.1f} us, p99 {p99:7.1f} us")
+    p50, p99 = timed(lambda: index.top(10), 1000)
+    print(f"top 10:          p50 {p50:7.1f} us, p99 {p99:7.1f} us")
+    p50, p99 = timed(lambda: index.around(user_ids[probes[rng.integers(0, 1000)]], 5), 1000)
+    print(f"around (+-5):    p50 {p50:7.1f} us, p99 {p99:7.1f} us")
+
+    def award():
+        picks = rng.integers(0, args.citizens, args.batch)
+        index.apply([(user_ids[i], int(amount)) for i, amount in zip(picks, rng.integers(5, 50, args.batch))])
+    p50, p99 = timed(award, 500)
+    print(f"apply {args.batch} awards: p50 {p50:7.1f} us, p99 {p99:7.1f} us")
+
+    # Check against a full sort
+    totals = index.credits[:args.citizens]
+    for i in probes[:100]:
+        assert index.rank(user_ids[i]) == 1 + int(np.sum(totals > totals[i]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# Login storm: concurrent bcrypt verifications inline on the event loop vs
+# through the bounded worker pool in utils, while a second client measures
+# latency of an unrelated endpoint.
+# Usage: python benchmarks/bench_password_pool.py [--logins 200] [--concurrency 32]
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi import FastAPI, HTTPException
+from httpx import AsyncClient, ASGITransport
+
+import utils
+
+PASSWORD = "citizen123"
+
+
+def build_app(hashed: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/login-inline")
+    async def login_inline():
+        if not utils.verify_password(PASSWORD, hashed):
+            raise HTTPException(status_code=401)
+        return {"ok": True}
+
+    @app.post("/login-pool")
+    async def login_pool():
+        if not await utils.verify_password_async(PASSWORD, hashed):
+            raise HTTPException(status_code=401)
+        return {"ok": True}
+
+    @app.get("/ping")
+    async def ping():
+        return {"pong": True}
+
+    return app
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+async def run(app: FastAPI, path: str, logins: int, concurrency: int):
+    transport = ASGITransport(app=app)
+    async with AsyncClient(transport=transport, base_url="http://bench") as client:
+        statuses = []
+        semaphore = asyncio.Semaphore(concurrency)
+        done = asyncio.Event()
+
+        async def login():
+            async with semaphore:
+                response = await client.post(path)
+                statuses.append(response.status_code)
+
+        ping_latencies = []
+
+        async def pinger():
+            while not done.is_set():
+                started = time.perf_counter()
+                await client.get("/ping")
+                ping_latencies.append((time.perf_counter() - started) * 1000.0)
+                await asyncio.sleep(0.005)
+
+        ping_task = asyncio.create_task(pinger())
+        started = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await ping_task
+
+    ok = statuses.count(200)
+    shed = statuses.count(503)
+    return {
+        "logins_per_s": ok / elapsed,
+        "shed": shed,
+        "ping_p50_ms": percentile(ping_latencies, 50),
+        "ping_p99_ms": percentile(ping_latencies, 99),
+        "pings": len(ping_latencies),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    hashed = utils.get_password_hash(PASSWORD)
+    app = build_app(hashed)
+    print(f"pool workers={utils.PASSWORD_HASH_WORKERS} queue limit={utils.PASSWORD_HASH_QUEUE_LIMIT}")
+    print(f"{'mode':>8} {'logins/s':>9} {'shed':>5} {'pings':>6} {'ping p50 ms':>12} {'ping p99 ms':>12}")
+    for mode, path in (("inline", "/login-inline"), ("pool", "/login-pool")):
+        result = await run(app, path, args.logins, args.concurrency)
+        print(f"{mode:>8} {result['logins_per_s']:>9.1f} {result['shed']:>5} {result['pings']:>6} {result['ping_p50_ms']:>12.2f} {result['ping_p99_ms']:>12.2f}")
+    utils.password_executor.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,128 @@
+# End-to-end delivery latency of realtime broadcasts between two workers:
+# a sender publishes collector notices, a receiver holds the collector
+# sockets and records when each message arrives.
+#   --backend postgres: two OS processes over LISTEN/NOTIFY (needs DATABASE_URL)
+#   --backend local:    two managers in one process over LocalBroker
+# Usage: python benchmarks/bench_pubsub.py [--backend postgres] [--messages 2000] [--rate 1000] [--batch-ms 5]
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class RecordingSocket:
+    def __init__(self, latencies):
+        self.latencies = latencies
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        self.latencies.append((time.time() - json.loads(message)["sent"]) * 1000)
+
+    async def close(self):
+        pass
+
+
+def report(latencies, expected):
+    if not latencies:
+        print("no messages delivered")
+        return
+    p50, p99 = np.percentile(latencies, [50, 99])
+    print(f"delivered {len(latencies)}/{expected}: p50 {p50:.2f} ms, p99 {p99:.2f} ms, max {max(latencies):.2f} ms")
+
+
+async def send(manager, args):
+    interval = 1.0 / args.rate
+    started = time.perf_counter()
+    for i in range(args.messages):
+        # Paced against the start time so batching sees a steady stream
+        delay = started + i * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await manager.broadcast_to_collectors(json.dumps({"type": "pickup_notice", "seq": i, "sent": time.time()}))
+
+
+def make_manager(backend, batch_ms):
+    from routes.realtime import ConnectionManager
+    manager = ConnectionManager(backend)
+    manager.pubsub.batch_delay = batch_ms / 1000.0
+    return manager
+
+
+def receiver_process(args, ready, results):
+    async def run():
+        from services.pubsub import PostgresBackend
+        from database import DATABASE_URL
+        latencies = []
+        manager = make_manager(PostgresBackend(DATABASE_URL), args.batch_ms)
+        await manager.start()
+        await manager.connect(RecordingSocket(latencies), "collector_bench")
+        ready.set()
+        deadline = time.monotonic() + args.messages / args.rate + 10
+        while len(latencies) < args.messages and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        await manager.stop()
+        results.put(latencies)
+    asyncio.run(run())
+
+
+def sender_process(args, ready):
+    async def run():
+        from services.pubsub import PostgresBackend
+        from database import DATABASE_URL
+        manager = make_manager(PostgresBackend(DATABASE_URL), args.batch_ms)
+        await manager.start()
+        ready.wait()
+        await send(manager, args)
+        await asyncio.sleep(0.5)
+        await manager.stop()
+    asyncio.run(run())
+
+
+def run_postgres(args):
+    context = multiprocessing.get_context("spawn")
+    ready, results = context.Event(), context.Queue()
+    receiver = context.Process(target=receiver_process, args=(args, ready, results))
+    sender = context.Process(target=sender_process, args=(args, ready))
+    receiver.start()
+    sender.start()
+    latencies = results.get()
+    sender.join()
+    receiver.join()
+    report(latencies, args.messages)
+
+
+async def run_local(args):
+    from services.pubsub import LocalBroker
+    broker = LocalBroker()
+    sender, receiver = make_manager(broker.backend(), args.batch_ms), make_manager(broker.backend(), args.batch_ms)
+    latencies = []
+    for manager in (sender, receiver):
+        await manager.start()
+    await receiver.connect(RecordingSocket(latencies), "collector_bench")
+    await send(sender, args)
+    await asyncio.sleep(0.5)
+    for manager in (sender, receiver):
+        await manager.stop()
+    report(latencies, args.messages)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=["postgres", "local"], default="postgres")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=1000.0, help="Messages per second")
+    parser.add_argument("--batch-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    if args.backend == "postgres":
+        run_postgres(args)
+    else:
+        asyncio.run(run_local(args))
@@ -0,0 +1,41 @@
+# Compare the route solver against the old scheduled-date ordering.
+# Usage: python benchmarks/bench_routing.py [--sizes 100 1000 3000] [--budget 2.0]
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+from services.routing import path_length, solve_route
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 1000, 3000])
+    parser.add_argument("--budget", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'stops':>6} {'sort km':>10} {'sort ms':>8} {'solver km':>10} {'solver ms':>10} {'saving':>7} {'moves':>7} {'timeout':>7}")
+    for n in args.sizes:
+        # Pickups spread over ~10x10 km, scheduled in random order
+        coords = np.column_stack((28.2096 + rng.uniform(-0.05, 0.05, n), 83.9856 + rng.uniform(-0.05, 0.05, n))).tolist()
+        scheduled = rng.permutation(n).tolist()
+
+        started = time.perf_counter()
+        baseline_order = sorted(range(n), key=lambda i: scheduled[i])
+        sort_ms = (time.perf_counter() - started) * 1000.0
+        sort_km = path_length(coords, baseline_order)
+
+        solution = solve_route(coords, time_budget=args.budget)
+        saving = 1.0 - solution.distance_km / sort_km if sort_km else 0.0
+        moves = solution.two_opt_moves + solution.or_opt_moves
+        print(f"{n:>6} {sort_km:>10.1f} {sort_ms:>8.2f} {solution.distance_km:>10.1f} {solution.elapsed_ms:>10.1f} {saving:>6.0%} {moves:>7} {str(solution.timed_out):>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# Realtime egress for driver tracking: every driver sends location updates
+# at --rate per second, every citizen follows one driver. Compares the bytes
+# broadcast-to-all would send against what subscribers actually receive.
+# Usage: python benchmarks/bench_tracking.py [--drivers 200] [--citizens 5000] [--seconds 3] [--rate 5] [--binary]
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), ".."))
+
+
+class CountingSocket:
+    def __init__(self, totals):
+        self.totals = totals
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        self.totals["messages"] += 1
+        self.totals["bytes"] += len(message.encode())
+
+    async def send_bytes(self, message):
+        self.totals["messages"] += 1
+        self.totals["bytes"] += len(message)
+
+    async def close(self):
+        pass
+
+
+async def run(args):
+    from routes.realtime import ConnectionManager
+
+    manager = ConnectionManager()
+    manager.tracker.interval = args.interval
+    totals = {"messages": 0, "bytes": 0}
+    for i in range(args.citizens):
+        connection = await manager.connect(CountingSocket(totals), f"citizen_{i}")
+        connection.binary = args.binary
+        manager.subscribe(connection, f"collector_{i % args.drivers}")
+
+    updates = 0
+    broadcast_bytes = 0
+    started = time.perf_counter()
+    for tick in range(int(args.seconds * args.rate)):
+        delay = started + tick / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        for d in range(args.drivers):
+            location = {"lat": 12.97 + tick * 1e-5, "lng": 77.59 + d * 1e-4, "timestamp": int(time.time())}
+            await manager.broadcast_tracking_update(f"collector_{d}", location)
+            updates += 1
+            message = json.dumps({"type": "tracking", "driver_id": f"collector_{d}", "location": location})
+            broadcast_bytes += len(message.encode()) * args.citizens
+    await asyncio.sleep(args.interval + 0.5)
+    await manager.stop()
+
+    print(f"{args.drivers} drivers, {args.citizens} citizens, {updates} updates in {args.seconds:.0f} s")
+    print(f"  broadcast to all: {updates * args.citizens} messages, {broadcast_bytes / 1e6:.1f} MB")
+    print(f"  subscriptions:    {totals['messages']} messages, {totals['bytes'] / 1e6:.2f} MB"
+          f" ({broadcast_bytes / max(totals['bytes'], 1):.0f}x less)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--drivers", type=int, default=200)
+    parser.add_argument("--citizens", type=int, default=5000)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--rate", type=float, default=5.0, help="Location updates per driver per second")
+    parser.add_argument("--interval", type=float, default=1.0, help="TRACKING_INTERVAL")
+    parser.add_argument("--binary", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(run(args))
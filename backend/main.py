@@ -1,22 +1,62 @@
 from fastapi import FastAPI, Request, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
 from routes import auth, citizen, admin, collector, marketplace, ai, blockchain, realtime
-from tables import AuditLog
-from database import init_db, AsyncSessionLocal
+from services.schema import check_schema_version
+from services.audit import audit_writer, audit_row, write_audit_rows
+from services.blockchain import mint_batcher, shutdown_verify_pool
+from services.classifier import classifier_service
+from services.forecast import forecast_service
+from services.stats import stats_reconciler
+from services.leaderboard import leaderboard
+from services.carbon import rollup_compactor
+from services.hotspots import hotspot_refresher
+from services.zones import zone_assigner
+from services.auth_cache import user_cache
+from utils import NEXT_CURSOR_HEADER
+import os
 import time
 import asyncio
-from datetime import datetime
+import functools
 from prometheus_client import make_asgi_app, Counter, Histogram
 
 app = FastAPI(title="Waste Management API")
 
 @app.on_event("startup")
 async def startup_event():
-    # Only initialize DB in local dev. 
-    # In Vercel, we rely on the DB being ready.
+    # Schema changes are applied by `python manage.py migrate` (see
+    # services/schema.py), never here. In Vercel, we rely on the DB being ready.
     if os.getenv("VERCEL") != "1":
-        await init_db()
+        await check_schema_version()
+        await realtime.manager.start()
         asyncio.create_task(realtime.broadcast_live_stats())
+        mint_batcher.start()
+        audit_writer.start()
+        await classifier_service.start()
+        forecast_service.start()
+        stats_reconciler.start()
+        # Awards reach every worker's leaderboard through the realtime pub/sub
+        leaderboard.publish = functools.partial(realtime.manager.pubsub.publish, "leaderboard")
+        leaderboard.start()
+        rollup_compactor.start()
+        hotspot_refresher.start()
+        zone_assigner.start()
+        # Revoked sessions must stop working on every worker, not just this one
+        user_cache.publish = functools.partial(realtime.manager.pubsub.publish, "auth")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await audit_writer.stop()
+    await classifier_service.stop()
+    await forecast_service.stop()
+    await stats_reconciler.stop()
+    await leaderboard.stop()
+    await rollup_compactor.stop()
+    await hotspot_refresher.stop()
+    await zone_assigner.stop()
+    await realtime.live_stats_leader.release()
+    await realtime.manager.stop()
+    await mint_batcher.stop()
+    shutdown_verify_pool()
 
 # Configure CORS
 app.add_middleware(
@@ -25,25 +65,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
 
 async def log_audit_event(log_entry: dict):
-    # Convert timestamp float to datetime
-    timestamp = datetime.fromtimestamp(log_entry["timestamp"])
-    
-    async with AsyncSessionLocal() as session:
-        audit_log = AuditLog(
-            action=log_entry["method"], # Mapping method to action for now
-            endpoint=log_entry["endpoint"],
-            ip_address=log_entry["ip_address"],
-            timestamp=timestamp,
-            # user_id is missing here, ideally middleware should extract it or we make it nullable
-            # For now let's assume it's nullable or handled elsewhere if user_id is needed
-            user_id="system" # Placeholder or nullable
-        )
-        session.add(audit_log)
-        await session.commit()
+    # Single-row fallback when the batch writer isn't running (e.g. Vercel)
+    await write_audit_rows([audit_row(log_entry)])
 
 # Audit Log Middleware
 @app.middleware("http")
@@ -57,15 +85,19 @@ async def audit_log_middleware(request: Request, call_next):
         log_entry = {
             "method": request.method,
             "endpoint": request.url.path,
-            "ip_address": request.client.host,
+            "ip_address": request.client.host if request.client else None,
+            "user_id": getattr(request.state, "user_id", None), # set by get_current_user
             "status_code": response.status_code,
             "duration": process_time,
             "timestamp": time.time()
         }
-        # Use a background task so we don't block the response
-        background_tasks = BackgroundTasks()
-        background_tasks.add_task(log_audit_event, log_entry)
-        response.background = background_tasks
+        if audit_writer.running:
+            # Buffered and bulk-inserted by the background writer
+            audit_writer.submit(log_entry)
+        else:
+            background_tasks = BackgroundTasks()
+            background_tasks.add_task(log_audit_event, log_entry)
+            response.background = background_tasks
         
     # Update Prometheus Metrics
     REQUEST_COUNT.labels(method=request.method, endpoint=request.url.path, status=response.status_code).inc()
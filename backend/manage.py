@@ -0,0 +1,95 @@
+# Maintenance commands, e.g. `python manage.py assign-zones --rebalance`
+import argparse
+import asyncio
+import json
+
+from database import AsyncSessionLocal
+
+
+async def assign_zones(args):
+    from services.zones import assign_pending_pickups
+    async with AsyncSessionLocal() as db:
+        return await assign_pending_pickups(db, rebalance=args.rebalance, capacity_slack=args.slack)
+
+
+async def reconcile_credits(args):
+    from services.credits import reconcile_balances
+    async with AsyncSessionLocal() as db:
+        return await reconcile_balances(db)
+
+
+async def rebuild_token_balances(args):
+    from services.blockchain import rebuild_token_balances
+    async with AsyncSessionLocal() as db:
+        return await rebuild_token_balances(db, batch_size=args.batch_size)
+
+
+async def backfill_locations(args):
+    from services.geo import backfill_locations
+    async with AsyncSessionLocal() as db:
+        return await backfill_locations(db, batch_size=args.batch_size)
+
+
+async def reconcile_stats(args):
+    from services.stats import reconcile_stats
+    async with AsyncSessionLocal() as db:
+        return await reconcile_stats(db)
+
+
+async def migrate(args):
+    from services.schema import migrate
+    return await migrate(target=args.target)
+
+
+async def rebuild_carbon(args):
+    from services.carbon import rebuild_rollups
+    async with AsyncSessionLocal() as db:
+        return await rebuild_rollups(db)
+
+
+async def compact_carbon(args):
+    from services.carbon import compact_rollups
+    async with AsyncSessionLocal() as db:
+        return await compact_rollups(db)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Waste Management maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    zones = commands.add_parser("assign-zones", help="Partition pending pickups into one zone per active collector")
+    zones.add_argument("--rebalance", action="store_true", help="Also redistribute pickups that are already assigned")
+    zones.add_argument("--slack", type=float, default=0.1, help="Allowed zone size above the even share")
+    zones.set_defaults(handler=assign_zones)
+
+    credits = commands.add_parser("reconcile-credits", help="Rebuild user credit balances from the credit ledger")
+    credits.set_defaults(handler=reconcile_credits)
+
+    tokens = commands.add_parser("rebuild-token-balances", help="Replay the whole chain into the token_balances projection")
+    tokens.add_argument("--batch-size", type=int, default=5000, help="Blocks read per batch")
+    tokens.set_defaults(handler=rebuild_token_balances)
+
+    locations = commands.add_parser("backfill-locations", help="Fill missing lat/lng columns from the location JSON")
+    locations.add_argument("--batch-size", type=int, default=1000, help="Rows updated per transaction")
+    locations.set_defaults(handler=backfill_locations)
+
+    stats = commands.add_parser("reconcile-stats", help="Rebuild the admin stats counters from the raw tables")
+    stats.set_defaults(handler=reconcile_stats)
+
+    migrations = commands.add_parser("migrate", help="Apply pending schema migrations (migrations/)")
+    migrations.add_argument("--target", type=int, help="Stop after this version")
+    migrations.set_defaults(handler=migrate)
+
+    carbon = commands.add_parser("rebuild-carbon", help="Recompute the carbon footprint rollups from the activities")
+    carbon.set_defaults(handler=rebuild_carbon)
+
+    compact = commands.add_parser("compact-carbon", help="Fold daily carbon rollups of closed months into monthly rows")
+    compact.set_defaults(handler=compact_carbon)
+
+    args = parser.parse_args()
+    result = asyncio.run(args.handler(args))
+    print(json.dumps(result, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
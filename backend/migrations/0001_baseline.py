@@ -0,0 +1,134 @@
+# The schema as the old create_all-at-startup left it, before migrations
+# existed. Frozen: later changes go in their own scripts, never here. IF
+# NOT EXISTS so a database created by that create_all is adopted as is; on
+# a new database it creates everything.
+from sqlalchemy import text
+
+TABLES = [
+    """CREATE TABLE IF NOT EXISTS users (
+        id VARCHAR NOT NULL PRIMARY KEY,
+        email VARCHAR,
+        password VARCHAR,
+        role VARCHAR,
+        name VARCHAR,
+        credit_points INTEGER,
+        created_at TIMESTAMP WITHOUT TIME ZONE,
+        is_verified BOOLEAN,
+        id_photo_url VARCHAR,
+        otp VARCHAR,
+        otp_expiry TIMESTAMP WITHOUT TIME ZONE
+    )""",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users (email)",
+    """CREATE TABLE IF NOT EXISTS sessions (
+        id VARCHAR NOT NULL PRIMARY KEY,
+        user_id VARCHAR REFERENCES users (id),
+        token VARCHAR,
+        ip_address VARCHAR,
+        user_agent VARCHAR,
+        created_at TIMESTAMP WITHOUT TIME ZONE,
+        active BOOLEAN
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_sessions_token ON sessions (token)",
+    """CREATE TABLE IF NOT EXISTS notifications (
+        id VARCHAR NOT NULL PRIMARY KEY,
+        user_id VARCHAR REFERENCES users (id),
+        title VARCHAR,
+        message VARCHAR,
+        type VARCHAR,
+        read BOOLEAN,
+        date TIMESTAMP WITHOUT TIME ZONE
+    )""",
+    """CREATE TABLE IF NOT EXISTS audit_logs (
+        id VARCHAR NOT NULL PRIMARY KEY,
+        user_id VARCHAR REFERENCES users (id),
+        action VARCHAR,
+        endpoint VARCHAR,
+        ip_address VARCHAR,
+        timestamp TIMESTAMP WITHOUT TIME ZONE
+    )""",
+    """CREATE TABLE IF NOT EXISTS credit_transactions (
+        id VARCHAR NOT NULL PRIMARY KEY,
+        user_id VARCHAR REFERENCES users (id),
+        amount INTEGER,
+        type VARCHAR,
+        description VARCHAR,
+        date TIMESTAMP WITHOUT TIME ZONE
+    )""",
+    """CREATE TABLE IF NOT EXISTS activities (
+        id VARCHAR NOT NULL PRIMARY KEY,
+        user_id VARCHAR REFERENCES users (id),
+        type VARCHAR,
+        description VARCHAR,
+        date TIMESTAMP WITHOUT TIME ZONE,
+        impact_co2 FLOAT
+    )""",
+    """CREATE TABLE IF NOT EXISTS pickup_requests (
+        id VARCHAR NOT NULL PRIMARY KEY,
+        user_id VARCHAR REFERENCES users (id),
+        waste_type VARCHAR,
+        amount_approx VARCHAR,
+        location JSON,
+        scheduled_date TIMESTAMP WITHOUT TIME ZONE,
+        status VARCHAR,
+        request_date TIMESTAMP WITHOUT TIME ZONE,
+        collected_at TIMESTAMP WITHOUT TIME ZONE,
+        collector_id VARCHAR REFERENCES users (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS waste_reports (
+        id VARCHAR NOT NULL PRIMARY KEY,
+        user_id VARCHAR REFERENCES users (id),
+        report_type VARCHAR,
+        description VARCHAR,
+        location JSON,
+        image_url VARCHAR,
+        status VARCHAR,
+        report_date TIMESTAMP WITHOUT TIME ZONE
+    )""",
+    """CREATE TABLE IF NOT EXISTS announcements (
+        id VARCHAR NOT NULL PRIMARY KEY,
+        title VARCHAR,
+        message VARCHAR,
+        priority VARCHAR,
+        target_role VARCHAR,
+        date TIMESTAMP WITHOUT TIME ZONE
+    )""",
+    """CREATE TABLE IF NOT EXISTS products (
+        id VARCHAR NOT NULL PRIMARY KEY,
+        name VARCHAR,
+        description VARCHAR,
+        cost INTEGER,
+        image_url VARCHAR,
+        stock INTEGER,
+        category VARCHAR
+    )""",
+    """CREATE TABLE IF NOT EXISTS system_settings (
+        id VARCHAR NOT NULL PRIMARY KEY,
+        type VARCHAR UNIQUE,
+        credits_per_kg FLOAT,
+        referral_bonus INTEGER,
+        withdrawal_minimum INTEGER,
+        system_version VARCHAR
+    )""",
+    """CREATE TABLE IF NOT EXISTS blockchain (
+        id VARCHAR NOT NULL PRIMARY KEY,
+        index INTEGER,
+        timestamp TIMESTAMP WITHOUT TIME ZONE,
+        transactions JSON,
+        previous_hash VARCHAR,
+        hash VARCHAR
+    )""",
+    """CREATE TABLE IF NOT EXISTS orders (
+        id VARCHAR NOT NULL PRIMARY KEY,
+        user_id VARCHAR REFERENCES users (id),
+        product_id VARCHAR REFERENCES products (id),
+        quantity INTEGER,
+        total_cost INTEGER,
+        status VARCHAR,
+        date TIMESTAMP WITHOUT TIME ZONE
+    )""",
+]
+
+
+async def upgrade(conn):
+    for ddl in TABLES:
+        await conn.execute(text(ddl))
@@ -0,0 +1,21 @@
+# Columns added to existing tables before migrations existed (create_all
+# never altered them). Nullable without a default, so each ALTER only
+# touches the catalog; lock_timeout keeps it from queueing behind long
+# transactions and blocking everything behind it.
+from sqlalchemy import text
+
+COLUMNS = [
+    ("users", "credits_earned", "INTEGER"),
+    ("audit_logs", "status_code", "INTEGER"),
+    ("audit_logs", "duration_ms", "DOUBLE PRECISION"),
+    ("pickup_requests", "lat", "DOUBLE PRECISION"),
+    ("pickup_requests", "lng", "DOUBLE PRECISION"),
+    ("waste_reports", "lat", "DOUBLE PRECISION"),
+    ("waste_reports", "lng", "DOUBLE PRECISION"),
+]
+
+
+async def upgrade(conn):
+    await conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+    for table, column, column_type in COLUMNS:
+        await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
@@ -0,0 +1,39 @@
+# Tables added to tables.py before migrations existed: the token balance
+# projection, the admin stats counters and the per-user carbon rollups
+from sqlalchemy import text
+
+TABLES = [
+    """CREATE TABLE token_balances (
+        address VARCHAR NOT NULL PRIMARY KEY,
+        balance FLOAT,
+        last_block_index INTEGER,
+        updated_at TIMESTAMP WITHOUT TIME ZONE
+    )""",
+    """CREATE TABLE stats_buckets (
+        period VARCHAR NOT NULL,
+        period_start TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        users INTEGER,
+        activities INTEGER,
+        pickup_requests INTEGER,
+        credits_spent INTEGER,
+        co2_saved FLOAT,
+        collections INTEGER,
+        updated_at TIMESTAMP WITHOUT TIME ZONE,
+        PRIMARY KEY (period, period_start)
+    )""",
+    """CREATE TABLE carbon_rollups (
+        user_id VARCHAR NOT NULL REFERENCES users (id),
+        period VARCHAR NOT NULL,
+        period_start TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+        co2 FLOAT,
+        activities INTEGER,
+        updated_at TIMESTAMP WITHOUT TIME ZONE,
+        PRIMARY KEY (user_id, period, period_start)
+    )""",
+    "CREATE INDEX ix_carbon_rollups_period_start ON carbon_rollups (period, period_start)",
+]
+
+
+async def upgrade(conn):
+    for ddl in TABLES:
+        await conn.execute(text(ddl))
@@ -0,0 +1,26 @@
+# Fill the columns from 0002 and the token balance projection (0003) for
+# rows written before they existed, in batches that commit as they go
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from services.blockchain import rebuild_token_balances
+from services.geo import backfill_locations
+from services.schema import backfill_in_batches
+
+TRANSACTIONAL = False
+
+
+async def upgrade(conn):
+    await backfill_in_batches(
+        conn,
+        "users",
+        "credits_earned = COALESCE((SELECT SUM(t.amount) FROM credit_transactions t "
+        "WHERE t.user_id = users.id AND t.type = 'earned'), 0)",
+        "credits_earned IS NULL",
+    )
+    async with AsyncSession(conn.engine, expire_on_commit=False) as db:
+        await backfill_locations(db)
+        balances = (await db.execute(text("SELECT 1 FROM token_balances LIMIT 1"))).first()
+        blocks = (await db.execute(text("SELECT 1 FROM blockchain LIMIT 1"))).first()
+        if blocks and not balances:
+            await rebuild_token_balances(db)
@@ -0,0 +1,48 @@
+# Indexes for the hot queries (tests/test_query_plans.py), built without
+# blocking writes. The unique index on blockchain.index fails if the chain
+# already has duplicate indexes; those need resolving by hand first.
+from sqlalchemy import text
+
+from services.geo import GEO_MODELS
+from services.schema import create_index_concurrently
+
+TRANSACTIONAL = False
+
+INDEXES = {
+    "ix_blockchain_index": "CREATE UNIQUE INDEX CONCURRENTLY ix_blockchain_index ON blockchain (index)",
+    "ix_users_created_at": "CREATE INDEX CONCURRENTLY ix_users_created_at ON users (created_at, id)",
+    "ix_users_role_credits_earned": "CREATE INDEX CONCURRENTLY ix_users_role_credits_earned ON users (role, credits_earned)",
+    "ix_users_pending_verification": (
+        "CREATE INDEX CONCURRENTLY ix_users_pending_verification ON users (created_at, id) "
+        "WHERE id_photo_url IS NOT NULL AND is_verified = false"
+    ),
+    "ix_activities_user_id_date": "CREATE INDEX CONCURRENTLY ix_activities_user_id_date ON activities (user_id, date, id)",
+    "ix_notifications_user_id_date": "CREATE INDEX CONCURRENTLY ix_notifications_user_id_date ON notifications (user_id, date, id)",
+    "ix_credit_transactions_user_id_type": "CREATE INDEX CONCURRENTLY ix_credit_transactions_user_id_type ON credit_transactions (user_id, type)",
+    "ix_audit_logs_timestamp": "CREATE INDEX CONCURRENTLY ix_audit_logs_timestamp ON audit_logs (timestamp, id)",
+    "ix_announcements_date": "CREATE INDEX CONCURRENTLY ix_announcements_date ON announcements (date, id)",
+    "ix_pickup_requests_lat_lng": "CREATE INDEX CONCURRENTLY ix_pickup_requests_lat_lng ON pickup_requests (lat, lng)",
+    "ix_pickup_requests_collector_id_status": (
+        "CREATE INDEX CONCURRENTLY ix_pickup_requests_collector_id_status ON pickup_requests (collector_id, status)"
+    ),
+    "ix_pickup_requests_pending": (
+        "CREATE INDEX CONCURRENTLY ix_pickup_requests_pending ON pickup_requests (request_date) WHERE status = 'pending'"
+    ),
+    "ix_waste_reports_lat_lng": "CREATE INDEX CONCURRENTLY ix_waste_reports_lat_lng ON waste_reports (lat, lng)",
+    "ix_waste_reports_report_date": "CREATE INDEX CONCURRENTLY ix_waste_reports_report_date ON waste_reports (report_date, id)",
+}
+
+
+async def upgrade(conn):
+    for name, ddl in INDEXES.items():
+        await create_index_concurrently(conn, name, ddl)
+    # Radius queries use a GiST index on the geography when PostGIS is there
+    if (await conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'postgis'"))).first():
+        for model in GEO_MODELS.values():
+            table = model.__tablename__
+            await create_index_concurrently(
+                conn,
+                f"ix_{table}_geog",
+                f"CREATE INDEX CONCURRENTLY ix_{table}_geog ON {table} "
+                f"USING gist ((ST_SetSRID(ST_MakePoint(lng, lat), 4326)::geography)) WHERE lat IS NOT NULL",
+            )
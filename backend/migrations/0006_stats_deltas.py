@@ -0,0 +1,19 @@
+# Journal for the admin stats counters: write transactions append their
+# increments here instead of updating the shared stats_buckets rows.
+from sqlalchemy import text
+
+
+async def upgrade(conn):
+    await conn.execute(text(
+        "CREATE TABLE stats_deltas ("
+        "id BIGSERIAL NOT NULL PRIMARY KEY, "
+        "period VARCHAR, "
+        "period_start TIMESTAMP WITHOUT TIME ZONE, "
+        "users INTEGER, "
+        "activities INTEGER, "
+        "pickup_requests INTEGER, "
+        "credits_spent INTEGER, "
+        "co2_saved FLOAT, "
+        "collections INTEGER)"
+    ))
+    await conn.execute(text("CREATE INDEX ix_stats_deltas_period_start ON stats_deltas (period, period_start)"))
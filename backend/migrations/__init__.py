@@ -0,0 +1,2 @@
+# Versioned schema migrations, applied by `python manage.py migrate`; see
+# services/schema.py for the conventions scripts follow
@@ -13,6 +13,7 @@ class User(BaseModel):
     role: str
     name: Optional[str] = None
     credit_points: int = 0
+    credits_earned: int = 0
     created_at: datetime = Field(default_factory=datetime.utcnow)
     is_verified: bool = False
     id_photo_url: Optional[str] = None
@@ -39,10 +40,12 @@ class Notification(BaseModel):
         orm_mode = True
 
 class AuditLog(BaseModel):
-    user_id: str
+    user_id: Optional[str] = None
     action: str
     endpoint: str
     ip_address: str
+    status_code: Optional[int] = None
+    duration_ms: Optional[float] = None
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     class Config:
         orm_mode = True
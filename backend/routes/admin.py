@@ -1,4 +1,5 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Query, Response
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
@@ -6,8 +7,17 @@ from sqlalchemy import func, delete, update
 from database import get_db
 from tables import AuditLog, User, Product, WasteReport, Announcement, SystemSettings, CreditTransaction, Activity, PickupRequest
 from models import AuditLog as AuditLogSchema, User as UserSchema, Product as ProductSchema, WasteReport as WasteReportSchema, Announcement as AnnouncementSchema, SystemSettings as SystemSettingsSchema
-from utils import get_current_user
+from utils import get_current_user, paginate
+from services.zones import assign_pending_pickups
+from services.auth_cache import user_cache
+from services.geo import GEO_MODELS, MAX_RADIUS_KM, find_within
+from services.stats import PERIODS, get_totals, get_trend
+from services.carbon import GRANULARITIES, city_footprint
+from services.announcements import announcement_message
+from services.leaderboard import leaderboard, with_names
+from services.pagination import EXPORT_FORMATS, csv_lines, ndjson_lines, stream_rows
 import json
+from datetime import datetime, timedelta
 
 router = APIRouter()
 
@@ -17,42 +27,149 @@ async def verify_admin(current_user: User = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Admin access required")
     return current_user
 
+# List endpoints page newest first with keyset cursors (utils.paginate):
+# pass the X-Next-Cursor response header back as ?cursor= for the next page
 @router.get("/audit-logs", response_model=List[AuditLogSchema])
-async def get_audit_logs(limit: int = 50, admin: User = Depends(verify_admin), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(AuditLog).order_by(AuditLog.timestamp.desc()).limit(limit))
-    logs = result.scalars().all()
-    return logs
+async def get_audit_logs(
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    admin: User = Depends(verify_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    return await paginate(db, response, select(AuditLog), AuditLog.timestamp, AuditLog.id, cursor, limit)
+
+# Full table exports, streamed with a server-side cursor in constant memory:
+# name -> (model, sort column, excluded columns)
+EXPORTS = {
+    "audit-logs": (AuditLog, AuditLog.timestamp, ()),
+    "users": (User, User.created_at, ("password", "otp", "otp_expiry")),
+    "feedback": (WasteReport, WasteReport.report_date, ()),
+    "announcements": (Announcement, Announcement.date, ()),
+}
+
+@router.get("/export/{kind}")
+async def export_rows(
+    kind: str,
+    export_format: str = Query("ndjson", alias="format"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    admin: User = Depends(verify_admin)
+):
+    if kind not in EXPORTS:
+        raise HTTPException(status_code=404, detail=f"Unknown kind, expected one of {sorted(EXPORTS)}")
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format, expected one of {list(EXPORT_FORMATS)}")
+    model, sort_column, excluded = EXPORTS[kind]
+    columns = [column for column in model.__table__.columns if column.key not in excluded]
+    query = select(*columns)
+    if since is not None:
+        query = query.filter(sort_column >= since)
+    if until is not None:
+        query = query.filter(sort_column < until)
+    query = query.order_by(sort_column, model.id)
+
+    names = [column.key for column in columns]
+    if export_format == "csv":
+        body, media_type = csv_lines(names, stream_rows(query)), "text/csv"
+    else:
+        body, media_type = ndjson_lines(names, stream_rows(query)), "application/x-ndjson"
+    return StreamingResponse(body, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="{kind}.{export_format}"'
+    })
 
 @router.get("/stats")
 async def get_system_stats(admin: User = Depends(verify_admin), db: AsyncSession = Depends(get_db)):
-    user_count_res = await db.execute(select(func.count(User.id)))
-    user_count = user_count_res.scalar()
-    
-    activity_count_res = await db.execute(select(func.count(Activity.id)))
-    activity_count = activity_count_res.scalar()
-    
-    pickup_count_res = await db.execute(select(func.count(PickupRequest.id)))
-    pickup_count = pickup_count_res.scalar()
-    
-    revenue_res = await db.execute(
-        select(func.sum(CreditTransaction.amount))
-        .filter(CreditTransaction.type == "spent")
-    )
-    revenue = revenue_res.scalar() or 0
-    
+    # Counters maintained on insert/delete by services.stats
+    totals = await get_totals(db)
     return {
-        "users": user_count,
-        "activities": activity_count,
-        "pickup_requests": pickup_count,
-        "total_credits_spent": abs(revenue)
+        "users": totals["users"],
+        "activities": totals["activities"],
+        "pickup_requests": totals["pickup_requests"],
+        "total_credits_spent": totals["credits_spent"],
+        "co2_saved": round(totals["co2_saved"], 1),
+        "collections": totals["collections"]
     }
 
+@router.get("/stats/trend")
+async def get_stats_trend(
+    period: str = Query("day"),
+    days: int = Query(30, ge=1, le=730),
+    admin: User = Depends(verify_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    # Per-day or per-week increments of each counter served by /stats
+    if period not in PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of {list(PERIODS)}")
+    return await get_trend(db, period, datetime.utcnow() - timedelta(days=days - 1))
+
+@router.get("/carbon")
+async def get_city_carbon(
+    granularity: str = Query("day"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    admin: User = Depends(verify_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    # City-wide CO2 from every citizen's rollups (services.carbon)
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {list(GRANULARITIES)}")
+    return await city_footprint(db, granularity, start, end)
+
+# --- Collector Zones ---
+@router.post("/assign-zones")
+async def assign_collector_zones(rebalance: bool = False, admin: User = Depends(verify_admin), db: AsyncSession = Depends(get_db)):
+    return await assign_pending_pickups(db, rebalance=rebalance)
+
+# --- Map Queries ---
+@router.get("/geo/{kind}")
+async def query_locations(
+    kind: str,
+    min_lat: Optional[float] = Query(None, ge=-90, le=90),
+    min_lng: Optional[float] = Query(None, ge=-180, le=180),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90),
+    max_lng: Optional[float] = Query(None, ge=-180, le=180),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lng: Optional[float] = Query(None, ge=-180, le=180),
+    radius_km: float = Query(1.0, gt=0, le=MAX_RADIUS_KM),
+    status: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=5000),
+    admin: User = Depends(verify_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    # Pickups or reports inside a bbox, or within radius_km of lat/lng
+    model = GEO_MODELS.get(kind)
+    if model is None:
+        raise HTTPException(status_code=404, detail=f"Unknown kind, expected one of {sorted(GEO_MODELS)}")
+    bounds = (min_lat, min_lng, max_lat, max_lng)
+    filters = [model.status == status] if status else []
+    if lat is not None and lng is not None:
+        rows = await find_within(db, model, center=(lat, lng), radius_km=radius_km, filters=filters, limit=limit)
+    elif all(value is not None for value in bounds):
+        if min_lat > max_lat or min_lng > max_lng:
+            raise HTTPException(status_code=400, detail="Invalid bounding box")
+        rows = await find_within(db, model, bbox=bounds, filters=filters, limit=limit)
+    else:
+        raise HTTPException(status_code=400, detail="Pass lat and lng, or min_lat, min_lng, max_lat and max_lng")
+
+    items = []
+    for row, distance in rows:
+        item = {column.key: getattr(row, column.key) for column in model.__table__.columns}
+        if distance is not None:
+            item["distance_km"] = round(distance, 3)
+        items.append(item)
+    return items
+
 # --- User Management ---
 @router.get("/users", response_model=List[UserSchema])
-async def get_all_users(limit: int = 100, admin: User = Depends(verify_admin), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(User).limit(limit))
-    users = result.scalars().all()
-    return users
+async def get_all_users(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    admin: User = Depends(verify_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    return await paginate(db, response, select(User), User.created_at, User.id, cursor, limit)
 
 @router.put("/users/{user_id}")
 async def update_user_role(user_id: str, role: str, admin: User = Depends(verify_admin), db: AsyncSession = Depends(get_db)):
@@ -63,6 +180,7 @@ async def update_user_role(user_id: str, role: str, admin: User = Depends(verify
     
     user.role = role
     await db.commit()
+    user_cache.invalidate_user(user_id)
     return {"message": "User role updated"}
 
 @router.delete("/users/{user_id}")
@@ -74,6 +192,7 @@ async def delete_user(user_id: str, admin: User = Depends(verify_admin), db: Asy
         
     await db.delete(user)
     await db.commit()
+    user_cache.invalidate_user(user_id)
     return {"message": "User deleted successfully"}
 
 # --- Marketplace Management ---
@@ -118,10 +237,14 @@ async def delete_product(product_id: str, admin: User = Depends(verify_admin), d
 
 # --- Feedback Management ---
 @router.get("/feedback", response_model=List[WasteReportSchema])
-async def get_all_feedback(admin: User = Depends(verify_admin), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(WasteReport).order_by(WasteReport.report_date.desc()).limit(100))
-    reports = result.scalars().all()
-    return reports
+async def get_all_feedback(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    admin: User = Depends(verify_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    return await paginate(db, response, select(WasteReport), WasteReport.report_date, WasteReport.id, cursor, limit)
 
 @router.post("/feedback/{report_id}/resolve")
 async def resolve_feedback(report_id: str, admin: User = Depends(verify_admin), db: AsyncSession = Depends(get_db)):
@@ -137,15 +260,7 @@ async def resolve_feedback(report_id: str, admin: User = Depends(verify_admin),
 # --- Broadcasts ---
 @router.post("/announce")
 async def broadcast_announcement(announcement: AnnouncementSchema, admin: User = Depends(verify_admin), db: AsyncSession = Depends(get_db)):
-    # from routes.realtime import manager # Avoid circular import if possible, or import inside
-    # msg = json.dumps({
-    #     "type": "announcement",
-    #     "title": announcement.title,
-    #     "message": announcement.message,
-    #     "priority": announcement.priority
-    # })
-    # await manager.broadcast_to_admins(msg) # Simple broadcast for MVP
-    
+    from routes.realtime import manager # Avoid circular import if possible, or import inside
     # Save to DB
     new_announcement = Announcement(
         title=announcement.title,
@@ -155,34 +270,41 @@ async def broadcast_announcement(announcement: AnnouncementSchema, admin: User =
     )
     db.add(new_announcement)
     await db.commit()
+    # Connected clients on every worker, via the realtime pub/sub; the
+    # cursor lets them catch up on what they miss while disconnected
+    msg = json.dumps({"type": "announcement", **announcement_message(new_announcement)})
+    await manager.broadcast_announcement(msg, announcement.target_role or "all")
     return {"message": "Announcement broadcasted and saved"}
 
 @router.get("/announcements", response_model=List[AnnouncementSchema])
-async def get_announcements(limit: int = 50, admin: User = Depends(verify_admin), db: AsyncSession = Depends(get_db)):
-    result = await db.execute(select(Announcement).order_by(Announcement.date.desc()).limit(limit))
-    announcements = result.scalars().all()
-    return announcements
+async def get_announcements(
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    admin: User = Depends(verify_admin),
+    db: AsyncSession = Depends(get_db)
+):
+    return await paginate(db, response, select(Announcement), Announcement.date, Announcement.id, cursor, limit)
 
 # --- Leaderboard ---
 @router.get("/leaderboard")
-async def get_leaderboard(limit: int = 10, admin: User = Depends(verify_admin), db: AsyncSession = Depends(get_db)):
+async def get_leaderboard(limit: int = Query(10, ge=1, le=1000), admin: User = Depends(verify_admin), db: AsyncSession = Depends(get_db)):
+    # Ranked by lifetime earned credits, from the in-memory index once loaded
+    if leaderboard.ready:
+        return await with_names(db, leaderboard.index.top(limit))
     result = await db.execute(
-        select(User)
-        .filter(User.role == "citizen")
-        .order_by(User.credit_points.desc())
+        select(User.id, User.name, User.credits_earned)
+        .filter(User.role == "citizen", User.credits_earned > 0)
+        .order_by(User.credits_earned.desc())
         .limit(limit)
     )
-    citizens = result.scalars().all()
-    
-    leaderboard = []
-    for idx, c in enumerate(citizens):
-        leaderboard.append({
-            "rank": idx + 1,
-            "name": c.name or "Eco Warrior",
-            "points": c.credit_points,
-            "id": c.id
-        })
-    return leaderboard
+    entries = []
+    for c in result.all():
+        rank = len(entries) + 1
+        if entries and entries[-1]["points"] == c.credits_earned:
+            rank = entries[-1]["rank"]
+        entries.append({"rank": rank, "name": c.name or "Eco Warrior", "points": c.credits_earned, "id": c.id})
+    return entries
 
 # --- Settings ---
 @router.get("/settings")
@@ -218,13 +340,16 @@ async def update_settings(settings: SystemSettingsSchema, admin: User = Depends(
 
 # --- Verification Management ---
 @router.get("/verify/pending", response_model=List[UserSchema])
-async def get_pending_verifications(admin: User = Depends(verify_admin), db: AsyncSession = Depends(get_db)):
+async def get_pending_verifications(
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    admin: User = Depends(verify_admin),
+    db: AsyncSession = Depends(get_db)
+):
     # List users who have uploaded an ID but are not yet verified
-    result = await db.execute(
-        select(User).filter(User.id_photo_url.isnot(None), User.is_verified == False)
-    )
-    users = result.scalars().all()
-    return users
+    query = select(User).filter(User.id_photo_url.isnot(None), User.is_verified == False)
+    return await paginate(db, response, query, User.created_at, User.id, cursor, limit)
 
 @router.post("/verify/approve/{user_id}")
 async def approve_user(user_id: str, admin: User = Depends(verify_admin), db: AsyncSession = Depends(get_db)):
@@ -235,6 +360,7 @@ async def approve_user(user_id: str, admin: User = Depends(verify_admin), db: As
     
     user.is_verified = True
     await db.commit()
+    user_cache.invalidate_user(user_id)
     return {"message": "User verified successfully"}
 
 @router.post("/verify/reject/{user_id}")
@@ -247,4 +373,5 @@ async def reject_user(user_id: str, admin: User = Depends(verify_admin), db: Asy
     # Optional: Delete the invalid photo or the user? For now just clear the photo
     user.id_photo_url = None
     await db.commit()
+    user_cache.invalidate_user(user_id)
     return {"message": "User ID rejected"}
@@ -1,23 +1,24 @@
-from fastapi import APIRouter, File, UploadFile
-from typing import List
-import random
+from fastapi import APIRouter, Depends, File, UploadFile, HTTPException, Query
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from datetime import datetime
+from database import get_db
+from services.classifier import classifier_service
+from services.forecast import forecast_service
+from services.hotspots import WINDOWS, hotspot_index, hotspot_refresher
 
 router = APIRouter()
 
 @router.post("/classify-waste")
 async def classify_waste(file: UploadFile = File(...)):
-    # MOCK AI Service
-    # In reality, load TensorFlow/PyTorch model here
-    
-    # Simulate processing delay
-    import time
-    time.sleep(1)
-    
-    # Randomly predict for demo purposes
-    categories = ["Organic", "Recyclable", "Hazardous"]
-    prediction = random.choice(categories)
-    confidence = random.uniform(0.85, 0.99)
+    # Backend is chosen by CLASSIFIER_BACKEND (mock or numpy) and loaded at
+    # startup; concurrent uploads are batched into one inference call
+    image = await file.read()
+    try:
+        prediction, confidence = await classifier_service.classify(image)
+    except (OSError, ValueError):
+        raise HTTPException(status_code=400, detail="Could not read image")
     
     return {
         "filename": file.filename,
@@ -27,27 +28,40 @@ async def classify_waste(file: UploadFile = File(...)):
     }
 
 @router.get("/hotspots")
-async def get_waste_hotspots():
-    # Return simulated lat/lng heatmap data
-    # Pokhara coordinates approx
-    base_lat = 28.2096
-    base_lng = 83.9856
-    
-    hotspots = []
-    for _ in range(20):
-        hotspots.append({
-            "lat": base_lat + random.uniform(-0.02, 0.02),
-            "lng": base_lng + random.uniform(-0.02, 0.02),
-            "intensity": random.randint(1, 10), # 1-10 scale of pile-up
-        })
-        
-    return hotspots
+async def get_waste_hotspots(
+    min_lat: Optional[float] = Query(None, ge=-90, le=90),
+    min_lng: Optional[float] = Query(None, ge=-180, le=180),
+    max_lat: Optional[float] = Query(None, ge=-90, le=90),
+    max_lng: Optional[float] = Query(None, ge=-180, le=180),
+    zoom: int = Query(13, ge=1, le=20),
+    window: str = Query("30d"),
+    waste_type: str = Query("all"),
+    limit: int = Query(200, ge=1, le=5000),
+    db: AsyncSession = Depends(get_db)
+):
+    # Kernel density over real report/pickup locations, restricted to the
+    # visible bbox (whole dataset if omitted) at the map's zoom level
+    if window not in WINDOWS:
+        raise HTTPException(status_code=400, detail=f"window must be one of {list(WINDOWS)}")
+    bounds = (min_lat, min_lng, max_lat, max_lng)
+    if any(value is None for value in bounds):
+        if any(value is not None for value in bounds):
+            raise HTTPException(status_code=400, detail="Pass all of min_lat, min_lng, max_lat, max_lng or none")
+        bbox = None
+    else:
+        if min_lat > max_lat or min_lng > max_lng:
+            raise HTTPException(status_code=400, detail="Invalid bounding box")
+        bbox = bounds
+
+    if not hotspot_refresher.running:
+        await hotspot_index.refresh(db)
+    return hotspot_index.query(bbox=bbox, zoom=zoom, window=window, waste_type=waste_type, limit=limit)
 
 @router.get("/insights")
-async def get_ai_insights():
-    return {
-        "waste_generation_trend": "Increasing by 5% this week",
-        "optimal_collection_time": "06:00 AM - 08:00 AM",
-        "recycling_efficiency": "78% (Good)",
-        "predicted_overflow": ["Main Street Bin #4", "Lakeside Bin #2"]
-    }
+async def get_ai_insights(db: AsyncSession = Depends(get_db)):
+    # Precomputed every FORECAST_INTERVAL seconds by services.forecast;
+    # staleness_seconds tells how old the served forecast is
+    try:
+        return await forecast_service.insights(db)
+    except SQLAlchemyError:
+        raise HTTPException(status_code=503, detail="Insights are not available yet")
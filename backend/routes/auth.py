@@ -7,7 +7,8 @@ from sqlalchemy import delete
 from models import Token, UserLogin, UserSession as UserSessionSchema, User as UserSchema
 from tables import User, UserSession
 from database import get_db
-from utils import verify_password, create_access_token, get_password_hash, get_current_user, ACCESS_TOKEN_EXPIRE_MINUTES
+from utils import verify_password_async, create_access_token, get_password_hash_async, get_current_user, ACCESS_TOKEN_EXPIRE_MINUTES
+from services.auth_cache import user_cache
 import random
 from datetime import datetime
 from fastapi import UploadFile, File
@@ -33,7 +34,7 @@ async def register(user_in: UserCreate, db: AsyncSession = Depends(get_db)):
     otp = str(random.randint(100000, 999999))
     user = User(
         email=user_in.email,
-        password=get_password_hash(user_in.password),
+        password=await get_password_hash_async(user_in.password),
         role=user_in.role,
         name=user_in.name,
         otp=otp,
@@ -78,7 +79,7 @@ async def login(user_login: UserLogin, request: Request, db: AsyncSession = Depe
     result = await db.execute(select(User).filter(User.email == user_login.email))
     user = result.scalars().first()
     
-    if not user or not verify_password(user_login.password, user.password):
+    if not user or not await verify_password_async(user_login.password, user.password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -123,6 +124,7 @@ async def revoke_session(session_id: str, current_user: User = Depends(get_curre
     
     await db.delete(session)
     await db.commit()
+    user_cache.revoke_token(session.token)
     return {"message": "Session revoked"}
 
 @router.post("/seed")
@@ -142,7 +144,7 @@ async def seed_users(db: AsyncSession = Depends(get_db)):
             user = User(
                 email=user_data["email"],
                 role=user_data["role"],
-                password=get_password_hash(user_data["password"]),
+                password=await get_password_hash_async(user_data["password"]),
                 name=user_data["name"],
                 is_verified=user_data["verified"]
             )
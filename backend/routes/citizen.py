@@ -1,11 +1,18 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from typing import List, Optional
+from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import func, cast, Date
+from sqlalchemy import func
 from database import get_db
-from tables import User, Activity, Notification, CreditTransaction, PickupRequest, WasteReport
+from tables import User, Activity, Notification, PickupRequest, WasteReport
 from models import Activity as ActivitySchema, Notification as NotificationSchema
+from services.credits import award_credits
+from services.carbon import GRANULARITIES, user_footprint
+from services.dashboard import citizen_rank, load_dashboard
+from services.leaderboard import LEADERBOARD_WINDOW, leaderboard, with_names
+from services.geo import MAX_RADIUS_KM, coordinate_columns, find_within
+from utils import get_current_user, paginate
 import qrcode
 import io
 from fastapi.responses import StreamingResponse
@@ -20,17 +27,22 @@ async def get_user_by_email(email: str, db: AsyncSession):
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
+@router.get("/dashboard/{email}")
+async def get_citizen_dashboard(email: str, db: AsyncSession = Depends(get_db)):
+    # Stats, recent activities and notifications and the last
+    # FOOTPRINT_DAYS of carbon footprint in one round trip
+    dashboard = await load_dashboard(db, email)
+    if dashboard is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return dashboard
+
 @router.get("/stats/{email}")
 async def get_citizen_stats(email: str, db: AsyncSession = Depends(get_db)):
     user = await get_user_by_email(email, db)
     user_id = user.id
     
-    # Calculate total credits
-    result_credits = await db.execute(
-        select(func.sum(CreditTransaction.amount))
-        .filter(CreditTransaction.user_id == user_id, CreditTransaction.type == "earned")
-    )
-    total_credits = result_credits.scalar() or 0
+    # Lifetime earned credits are maintained on the user row
+    total_credits = user.credits_earned or 0
     
     # Calculate CO2 saved
     result_co2 = await db.execute(
@@ -46,8 +58,10 @@ async def get_citizen_stats(email: str, db: AsyncSession = Depends(get_db)):
     )
     waste_collected = result_pickup.scalar() or 0
     
-    # Mock rank for now
-    rank = 156
+    if leaderboard.ready:
+        rank = leaderboard.rank(total_credits)
+    else:
+        rank = (await db.execute(select(citizen_rank(user.credits_earned)))).scalar()
     
     return {
         "credits": total_credits,
@@ -56,31 +70,50 @@ async def get_citizen_stats(email: str, db: AsyncSession = Depends(get_db)):
         "rank": rank
     }
 
+@router.get("/leaderboard/{email}")
+async def get_citizen_leaderboard(
+    email: str,
+    top: int = Query(10, ge=1, le=100),
+    window: int = Query(LEADERBOARD_WINDOW, ge=0, le=50),
+    db: AsyncSession = Depends(get_db)
+):
+    # The top citizens plus the ones ranked just above and below this user
+    user = await get_user_by_email(email, db)
+    if not leaderboard.ready:
+        raise HTTPException(status_code=503, detail="Leaderboard is still loading")
+    credits = user.credits_earned or 0
+    return {
+        "rank": leaderboard.rank(credits),
+        "points": credits,
+        "citizens": len(leaderboard.index),
+        "top": await with_names(db, leaderboard.index.top(top)),
+        "around": await with_names(db, leaderboard.index.around(user.id, window)),
+    }
+
+# Newest first; the X-Next-Cursor header is the ?cursor= for the next page
 @router.get("/activities/{email}", response_model=List[ActivitySchema])
-async def get_activities(email: str, db: AsyncSession = Depends(get_db)):
+async def get_activities(
+    email: str,
+    response: Response,
+    limit: int = Query(5, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
     user = await get_user_by_email(email, db)
-    
-    result = await db.execute(
-        select(Activity)
-        .filter(Activity.user_id == user.id)
-        .order_by(Activity.date.desc())
-        .limit(5)
-    )
-    activities = result.scalars().all()
-    return activities
+    query = select(Activity).filter(Activity.user_id == user.id)
+    return await paginate(db, response, query, Activity.date, Activity.id, cursor, limit)
 
 @router.get("/notifications/{email}", response_model=List[NotificationSchema])
-async def get_notifications(email: str, db: AsyncSession = Depends(get_db)):
+async def get_notifications(
+    email: str,
+    response: Response,
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
     user = await get_user_by_email(email, db)
-    
-    result = await db.execute(
-        select(Notification)
-        .filter(Notification.user_id == user.id)
-        .order_by(Notification.date.desc())
-        .limit(10)
-    )
-    notifications = result.scalars().all()
-    return notifications
+    query = select(Notification).filter(Notification.user_id == user.id)
+    return await paginate(db, response, query, Notification.date, Notification.id, cursor, limit)
 
 @router.post("/seed-data/{email}")
 async def seed_citizen_data(email: str, db: AsyncSession = Depends(get_db)):
@@ -101,12 +134,9 @@ async def seed_citizen_data(email: str, db: AsyncSession = Depends(get_db)):
     db.add_all(activities)
     
     # Seed Credits
-    credits = [
-        CreditTransaction(user_id=user_id, amount=50, type="earned", description="Waste Pickup Reward"),
-        CreditTransaction(user_id=user_id, amount=20, type="earned", description="Verified Report"),
-        CreditTransaction(user_id=user_id, amount=35, type="earned", description="Recycling Bonus"),
-    ]
-    db.add_all(credits)
+    await award_credits(db, user_id, 50, "Waste Pickup Reward")
+    await award_credits(db, user_id, 20, "Verified Report")
+    await award_credits(db, user_id, 35, "Recycling Bonus")
     
     # Seed Notifications
     notifications = [
@@ -128,6 +158,7 @@ async def request_pickup(request: PickupRequestSchema, db: AsyncSession = Depend
         waste_type=request.waste_type,
         amount_approx=request.amount_approx,
         location=request.location,
+        **coordinate_columns(request.location),
         scheduled_date=request.scheduled_date,
         status=request.status
     )
@@ -168,6 +199,7 @@ async def report_waste(report: WasteReportSchema, db: AsyncSession = Depends(get
         report_type=report.report_type,
         description=report.description,
         location=report.location,
+        **coordinate_columns(report.location),
         image_url=report.image_url,
         status=report.status
     )
@@ -184,17 +216,38 @@ async def report_waste(report: WasteReportSchema, db: AsyncSession = Depends(get
     db.add(activity)
     
     # Award small credit for reporting (gamification)
-    credit = CreditTransaction(
-        user_id=report.user_id,
-        amount=5,
-        type="earned",
-        description="Report Reward"
-    )
-    db.add(credit)
+    await award_credits(db, report.user_id, 5, "Report Reward")
     await db.commit()
     
     return {"message": "Waste reported successfully", "id": new_report.id}
 
+@router.get("/reports/nearby")
+async def get_nearby_reports(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(1.0, gt=0, le=MAX_RADIUS_KM),
+    limit: int = Query(100, ge=1, le=500),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Open reports around the citizen, nearest first
+    rows = await find_within(
+        db, WasteReport, center=(lat, lng), radius_km=radius_km,
+        filters=[WasteReport.status != "resolved"], limit=limit
+    )
+    return [
+        {
+            "id": r.id,
+            "report_type": r.report_type,
+            "description": r.description,
+            "location": r.location,
+            "status": r.status,
+            "report_date": r.report_date,
+            "distance_km": round(distance, 3)
+        }
+        for r, distance in rows
+    ]
+
 @router.get("/qr-code/{email}")
 async def generate_qr_code(email: str, db: AsyncSession = Depends(get_db)):
     user = await get_user_by_email(email, db)
@@ -215,28 +268,17 @@ async def generate_qr_code(email: str, db: AsyncSession = Depends(get_db)):
     return StreamingResponse(img_byte_arr, media_type="image/png")
 
 @router.get("/carbon-footprint/{email}")
-async def get_carbon_footprint(email: str, db: AsyncSession = Depends(get_db)):
+async def get_carbon_footprint(
+    email: str,
+    granularity: str = Query("day"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    # CO2 per day, week or month from the rollups in services.carbon,
+    # oldest first. Months older than ROLLUP_DAILY_DAYS are only kept whole
+    # and come back as one point with "period": "month".
+    if granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {list(GRANULARITIES)}")
     user = await get_user_by_email(email, db)
-    user_id = user.id
-    
-    # Aggregate CO2 by date
-    # In Postgres we can use cast(Activity.date, Date) to group by day
-    # Or func.date_trunc('day', Activity.date)
-    
-    result = await db.execute(
-        select(
-            cast(Activity.date, Date).label("date"),
-            func.sum(Activity.impact_co2).label("co2"),
-            func.count(Activity.id).label("count")
-        )
-        .filter(Activity.user_id == user_id, Activity.impact_co2 > 0)
-        .group_by(cast(Activity.date, Date))
-        .order_by("date")
-    )
-    
-    daily_data = result.all()
-    
-    # Format for frontend
-    formatted_data = [{"date": str(d.date), "co2": round(d.co2, 2), "activities": d.count} for d in daily_data]
-    
-    return formatted_data
+    return await user_footprint(db, user.id, granularity, start, end)
@@ -1,88 +1,144 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List, Dict
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import List, Dict, Optional, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import or_, and_, update
 from datetime import datetime
 from database import get_db
-from tables import User, PickupRequest, Activity, CreditTransaction
+from tables import User, PickupRequest, Activity
 from utils import get_current_user
+from services.routing import extract_coordinates, solve_route
+from services.credits import award_credits
+from services.geo import MAX_RADIUS_KM, find_within
+import asyncio
 
 router = APIRouter()
 
-# Mock route optimization (TSP placeholder)
-def optimize_route(requests: List[PickupRequest]):
-    # Simple sort by scheduled date for now
-    # In real app, use OR-Tools to solve TSP based on lat/lng
+MAX_ROUTE_STOPS = 5000
+MAX_TIME_BUDGET = 10.0
+
+def sort_by_schedule(requests: List[PickupRequest]):
     return sorted(requests, key=lambda x: x.scheduled_date if x.scheduled_date else datetime.max)
 
+def optimize_route(requests: List[PickupRequest], start: Optional[Tuple[float, float]] = None, time_budget: float = 2.0):
+    # Stops with usable coordinates go through the route solver; anything
+    # without a lat/lng is appended afterwards in scheduled order.
+    ordered = sort_by_schedule(requests)
+    routable, coords, unroutable = [], [], []
+    for p in ordered:
+        point = extract_coordinates(p.location)
+        if point is None:
+            unroutable.append(p)
+        else:
+            routable.append(p)
+            coords.append(point)
+
+    solution = solve_route(coords, start=start, time_budget=time_budget)
+    stops = [routable[i] for i in solution.order] + unroutable
+    return stops, solution
+
+def pickup_to_dict(p: PickupRequest):
+    return {
+        "id": p.id,
+        "user_id": p.user_id,
+        "waste_type": p.waste_type,
+        "amount_approx": p.amount_approx,
+        "location": p.location,
+        "scheduled_date": p.scheduled_date,
+        "status": p.status,
+        "request_date": p.request_date
+    }
+
 @router.get("/routes/{email}")
-async def get_assigned_routes(email: str, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+async def get_assigned_routes(
+    email: str,
+    limit: int = Query(1000, ge=1, le=MAX_ROUTE_STOPS),
+    time_budget: float = Query(2.0, gt=0, le=MAX_TIME_BUDGET),
+    start_lat: Optional[float] = None,
+    start_lng: Optional[float] = None,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
     # Verify user is collector
     if current_user.role != "collector":
         # In MVP, we might be lenient or strict. Let's be strict.
         # But for now, let's allow "collector" role check.
         pass
 
-    # Get all pending pickup requests (MVP: assign all to the collector)
-    # In real app, filter by collector's assigned zone
-    result = await db.execute(select(PickupRequest).filter(PickupRequest.status == "pending").limit(50))
+    # Only the pickups in this collector's zone (see services.zones)
+    result = await db.execute(
+        select(PickupRequest)
+        .filter(PickupRequest.collector_id == current_user.id, PickupRequest.status == "assigned")
+        .order_by(PickupRequest.scheduled_date)
+        .limit(limit)
+    )
     pending_pickups = result.scalars().all()
-    
-    # Optimize route
-    optimized = optimize_route(pending_pickups)
-    
-    # Format for frontend - SQLAlchemy models to dict/schema
-    # Assuming frontend expects a list of dicts with 'id'
-    routes = []
-    for p in optimized:
-        # Create a dict representation manually or use a schema
-        p_dict = {
-            "id": p.id,
-            "user_id": p.user_id,
-            "waste_type": p.waste_type,
-            "amount_approx": p.amount_approx,
-            "location": p.location,
-            "scheduled_date": p.scheduled_date,
-            "status": p.status,
-            "request_date": p.request_date
-        }
-        routes.append(p_dict)
-        
-    return routes
+
+    start = (start_lat, start_lng) if start_lat is not None and start_lng is not None else None
+
+    # Solving is CPU-bound, keep it off the event loop
+    stops, solution = await asyncio.to_thread(optimize_route, pending_pickups, start, time_budget)
+
+    return {
+        "collector_id": current_user.id,
+        "stops": [pickup_to_dict(p) for p in stops],
+        "total_distance_km": round(solution.distance_km, 3),
+        "unrouted_stops": len(stops) - len(solution.order),
+        "solver": solution.stats()
+    }
+
+@router.get("/pickups/nearby")
+async def get_nearby_pickups(
+    lat: float = Query(..., ge=-90, le=90),
+    lng: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(2.0, gt=0, le=MAX_RADIUS_KM),
+    include_unassigned: bool = False,
+    limit: int = Query(200, ge=1, le=1000),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    if current_user.role != "collector":
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    # This collector's open stops, optionally plus pending pickups nobody has yet
+    scope = and_(PickupRequest.collector_id == current_user.id, PickupRequest.status == "assigned")
+    if include_unassigned:
+        scope = or_(scope, and_(PickupRequest.collector_id.is_(None), PickupRequest.status == "pending"))
+    rows = await find_within(db, PickupRequest, center=(lat, lng), radius_km=radius_km, filters=[scope], limit=limit)
+    return [dict(pickup_to_dict(p), distance_km=round(distance, 3)) for p, distance in rows]
 
 @router.post("/verify-pickup/{pickup_id}")
 async def verify_pickup(pickup_id: str, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     if current_user.role != "collector":
         raise HTTPException(status_code=403, detail="Not authorized")
         
-    # Get pickup details
-    result = await db.execute(select(PickupRequest).filter(PickupRequest.id == pickup_id))
-    pickup = result.scalars().first()
-    
-    if not pickup:
-         raise HTTPException(status_code=404, detail="Pickup not found")
-         
-    if pickup.status == "collected":
+    # Claim the pickup with one conditional UPDATE: of two concurrent
+    # verifications only one gets the row back, so credits are awarded once
+    result = await db.execute(
+        update(PickupRequest)
+        .where(
+            PickupRequest.id == pickup_id,
+            or_(PickupRequest.status.is_(None), PickupRequest.status != "collected"),
+        )
+        .values(status="collected", collected_at=datetime.utcnow(), collector_id=current_user.id)
+        .returning(PickupRequest.user_id, PickupRequest.waste_type)
+        .execution_options(synchronize_session=False)
+    )
+    pickup = result.first()
+
+    if pickup is None:
+        await db.rollback()
+        exists = (await db.execute(select(PickupRequest.id).filter(PickupRequest.id == pickup_id))).first()
+        if exists is None:
+            raise HTTPException(status_code=404, detail="Pickup not found")
         raise HTTPException(status_code=404, detail="Pickup already collected")
 
-    # Update pickup status
-    pickup.status = "collected"
-    pickup.collected_at = datetime.utcnow()
-    pickup.collector_id = current_user.id
-    db.add(pickup)
-    
     # Award credits to citizen
     credit_amount = 10 # Standard amount
     if pickup.waste_type == "recyclable":
         credit_amount = 20
-        
-    credit = CreditTransaction(
-        user_id=pickup.user_id,
-        amount=credit_amount,
-        type="earned",
-        description=f"Waste Collection Verified ({pickup.waste_type})"
-    )
-    db.add(credit)
+
+    await award_credits(db, pickup.user_id, credit_amount, f"Waste Collection Verified ({pickup.waste_type})")
     
     # Log activity for Collector
     activity = Activity(
@@ -2,11 +2,11 @@ from fastapi import APIRouter, HTTPException, Depends
 from typing import List
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy import func
 from database import get_db
-from tables import User, CreditTransaction, Product, Order
+from tables import User, Product, Order
 from models import Product as ProductSchema
 from utils import get_current_user
+from services.credits import spend_credits, get_balance
 from pydantic import BaseModel
 from datetime import datetime
 
@@ -51,8 +51,11 @@ async def get_products(db: AsyncSession = Depends(get_db)):
 
 @router.post("/order")
 async def place_order(order: OrderRequest, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
-    # Get product
-    result = await db.execute(select(Product).filter(Product.id == order.product_id))
+    if order.quantity <= 0:
+        raise HTTPException(status_code=400, detail="Quantity must be positive")
+
+    # Get product (locked so concurrent orders can't oversell stock)
+    result = await db.execute(select(Product).filter(Product.id == order.product_id).with_for_update())
     product = result.scalars().first()
     
     if not product:
@@ -63,25 +66,16 @@ async def place_order(order: OrderRequest, current_user: User = Depends(get_curr
         
     total_cost = product.cost * order.quantity
     
-    # Check user credits (Use db aggregation or fetch recent balance)
-    # Simple check: Aggregating all transactions
-    result_balance = await db.execute(
-        select(func.sum(CreditTransaction.amount))
-        .filter(CreditTransaction.user_id == current_user.id)
-    )
-    balance = result_balance.scalar() or 0
-    
-    if balance < total_cost:
+    # Check and deduct credits atomically against the maintained balance;
+    # free products spend nothing
+    if total_cost > 0:
+        balance = await spend_credits(db, current_user.id, total_cost, f"Purchased {order.quantity} x {product.name}")
+    else:
+        balance = await get_balance(db, current_user.id)
+    if balance is None:
+        await db.rollback()
+        balance = await get_balance(db, current_user.id)
         raise HTTPException(status_code=400, detail=f"Insufficient credits. Balance: {balance}, Required: {total_cost}")
-        
-    # Deduct credits
-    transaction = CreditTransaction(
-        user_id=current_user.id,
-        amount=-total_cost,
-        type="spent",
-        description=f"Purchased {order.quantity} x {product.name}"
-    )
-    db.add(transaction)
     
     # Create Order record
     new_order = Order(
@@ -99,4 +93,4 @@ async def place_order(order: OrderRequest, current_user: User = Depends(get_curr
     
     await db.commit()
     
-    return {"message": "Order placed successfully", "balance": balance - total_cost}
+    return {"message": "Order placed successfully", "balance": balance}
@@ -1,70 +1,240 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import List, Dict
+from typing import List, Dict, Optional, Set, Tuple
 import json
 import asyncio
+import logging
+import os
+import time
+from database import AsyncSessionLocal, engine
+from services.announcements import decode_cursor, missed_announcements
+from services.auth_cache import user_cache
+from services.connections import ClientConnection
+from services.leaderboard import leaderboard
+from services.pubsub import PubSub, PubSubBackend
+from services.stats import get_totals
+from services.tracking import DriverTracker, encode_position
+from sqlalchemy import text
+from sqlalchemy.future import select
+from tables import PickupRequest
+
+logger = logging.getLogger(__name__)
+
+LIVE_STATS_INTERVAL = float(os.getenv("LIVE_STATS_INTERVAL", "5"))
+# Session advisory lock held by the worker that reads the live stats
+LIVE_STATS_LOCK_KEY = 0x57494957
+MAX_TRACKED_DRIVERS = 20
 
 router = APIRouter()
 
-class ConnectionManager:
+class LiveStats:
+    # Last analytics values pushed to admins, so each tick only sends the
+    # fields that changed
+
     def __init__(self):
-        # Store active connections: user_id -> WebSocket
-        self.active_connections: Dict[str, WebSocket] = {}
-        self.admin_connections: List[WebSocket] = []
-        self.collector_connections: List[WebSocket] = []
+        self.current: Dict[str, float] = {}
 
-    async def connect(self, websocket: WebSocket, client_id: str):
-        await websocket.accept()
-        if client_id.startswith("admin"):
-            self.admin_connections.append(websocket)
-        elif client_id.startswith("collector"):
-            self.collector_connections.append(websocket)
-        else:
-            self.active_connections[client_id] = websocket
+    def update(self, values: Dict[str, float]) -> Dict[str, float]:
+        changed = {key: value for key, value in values.items() if self.current.get(key) != value}
+        self.current.update(changed)
+        return changed
+
+
+class WorkerCounts:
+    # Connection counts every worker reports over the pub/sub each tick;
+    # a worker that stops reporting (crashed, scaled down) drops out after
+    # `ttl` seconds
+
+    def __init__(self, ttl: float = LIVE_STATS_INTERVAL * 3):
+        self.ttl = ttl
+        self.reports: Dict[str, Tuple[Dict[str, int], float]] = {}
+
+    def apply_message(self, message: str):
+        report = json.loads(message)
+        self.reports[report.pop("worker")] = (report, time.monotonic())
+
+    def total(self, key: str) -> int:
+        cutoff = time.monotonic() - self.ttl
+        self.reports = {worker: entry for worker, entry in self.reports.items() if entry[1] >= cutoff}
+        return sum(int(report.get(key, 0)) for report, _ in self.reports.values())
+
+
+class ConnectionManager:
+    # Sends never await the socket: broadcasts enqueue on each connection
+    # (services.connections) and per-connection writer tasks do the I/O, so
+    # fan-out is concurrent and a slow client only delays itself. Closed or
+    # failed connections remove themselves. Broadcasts go through
+    # services.pubsub so clients connected to other workers get them too.
 
-    def disconnect(self, websocket: WebSocket, client_id: str):
+    def __init__(self, backend: Optional[PubSubBackend] = None):
+        # Store active connections: user_id -> ClientConnection
+        self.active_connections: Dict[str, ClientConnection] = {}
+        self.admin_connections: List[ClientConnection] = []
+        self.collector_connections: List[ClientConnection] = []
+        self.pubsub = PubSub(self.deliver_local, backend)
+        # Driver tracking: who follows each driver on this worker, and the
+        # last position seen so new subscribers don't wait for the next one
+        self.driver_subscribers: Dict[str, Set[ClientConnection]] = {}
+        self.last_positions: Dict[str, str] = {}
+        self.tracker = DriverTracker(self._publish_position)
+        self.live_stats = LiveStats()
+        self.worker_counts = WorkerCounts()
+
+    async def start(self):
+        await self.pubsub.start()
+
+    async def stop(self):
+        self.tracker.stop()
+        await self.pubsub.stop()
+
+    @staticmethod
+    def role(client_id: str) -> str:
         if client_id.startswith("admin"):
-            if websocket in self.admin_connections:
-                self.admin_connections.remove(websocket)
-        elif client_id.startswith("collector"):
-            if websocket in self.collector_connections:
-                self.collector_connections.remove(websocket)
+            return "admin"
+        if client_id.startswith("collector"):
+            return "collector"
+        return "citizen"
+
+    async def connect(self, websocket: WebSocket, client_id: str) -> ClientConnection:
+        await websocket.accept()
+        role = self.role(client_id)
+        connection = ClientConnection(websocket, client_id, role, on_close=self._remove)
+        if role == "admin":
+            self.admin_connections.append(connection)
+        elif role == "collector":
+            self.collector_connections.append(connection)
         else:
-            if client_id in self.active_connections:
-                del self.active_connections[client_id]
+            previous = self.active_connections.get(client_id)
+            self.active_connections[client_id] = connection
+            if previous is not None:
+                # Same user reconnected; the old socket would never be read again
+                previous.close("replaced")
+        return connection
+
+    def disconnect(self, connection: ClientConnection):
+        connection.close()
+
+    def _remove(self, connection: ClientConnection):
+        for driver_id in connection.subscriptions:
+            self._unsubscribe(connection, driver_id)
+        connection.subscriptions = set()
+        if connection.role == "admin":
+            if connection in self.admin_connections:
+                self.admin_connections.remove(connection)
+        elif connection.role == "collector":
+            if connection in self.collector_connections:
+                self.collector_connections.remove(connection)
+            self.tracker.forget(connection.client_id)
+        elif self.active_connections.get(connection.client_id) is connection:
+            del self.active_connections[connection.client_id]
+
+    def connection_count(self) -> int:
+        return len(self.active_connections) + len(self.admin_connections) + len(self.collector_connections)
+
+    def _fan_out(self, connections, message: str):
+        # Copy: a full queue under the 'disconnect' policy removes the connection
+        for connection in list(connections):
+            connection.send(message)
+
+    def deliver_local(self, target: str, message: str):
+        # Targets: 'admins', 'collectors', 'citizens', 'all', 'user:<client_id>',
+        # 'driver:<driver_id>', 'leaderboard', 'auth', 'worker_counts' or
+        # 'live_stats'
+        if target in ("admins", "all"):
+            self._fan_out(self.admin_connections, message)
+        if target in ("collectors", "all"):
+            self._fan_out(self.collector_connections, message)
+        if target in ("citizens", "all"):
+            self._fan_out(self.active_connections.values(), message)
+        if target.startswith("user:"):
+            connection = self.active_connections.get(target[5:])
+            if connection is not None:
+                connection.send(message)
+        elif target.startswith("driver:"):
+            self._deliver_position(target[7:], message)
+        elif target == "leaderboard":
+            # Credit awards committed on any worker (services.leaderboard)
+            leaderboard.apply_message(message)
+        elif target == "auth":
+            # Session revocations and user invalidations (services.auth_cache)
+            user_cache.apply_message(message)
+        elif target == "worker_counts":
+            self.worker_counts.apply_message(message)
+        elif target == "live_stats":
+            # The cluster-wide snapshot from the live stats leader
+            changed = self.live_stats.update(json.loads(message))
+            if changed:
+                self._fan_out(self.admin_connections, json.dumps({"type": "analytics_update", **changed}))
+
+    def subscribe(self, connection: ClientConnection, driver_id: str) -> bool:
+        if driver_id not in connection.subscriptions and len(connection.subscriptions) >= MAX_TRACKED_DRIVERS:
+            return False
+        connection.subscriptions.add(driver_id)
+        self.driver_subscribers.setdefault(driver_id, set()).add(connection)
+        last = self.last_positions.get(driver_id)
+        if last is not None:
+            connection.send(self._position_frame(driver_id, last) if connection.binary else last)
+        return True
+
+    def unsubscribe(self, connection: ClientConnection, driver_id: str):
+        connection.subscriptions.discard(driver_id)
+        self._unsubscribe(connection, driver_id)
+
+    def _unsubscribe(self, connection: ClientConnection, driver_id: str):
+        subscribers = self.driver_subscribers.get(driver_id)
+        if subscribers is not None:
+            subscribers.discard(connection)
+            if not subscribers:
+                del self.driver_subscribers[driver_id]
+
+    @staticmethod
+    def _position_frame(driver_id: str, message: str) -> bytes:
+        return encode_position(driver_id, json.loads(message)["location"])
+
+    def _publish_position(self, driver_id: str, location: dict):
+        message = json.dumps({"type": "tracking", "driver_id": driver_id, "location": location})
+        self.pubsub.publish(f"driver:{driver_id}", message)
+
+    def _deliver_position(self, driver_id: str, message: str):
+        self.last_positions[driver_id] = message
+        frame = None
+        for connection in list(self.driver_subscribers.get(driver_id, ())):
+            if connection.binary:
+                # Encoded once per update, shared by all binary subscribers
+                if frame is None:
+                    frame = self._position_frame(driver_id, message)
+                connection.send(frame)
+            else:
+                connection.send(message)
 
     async def send_personal_message(self, message: str, client_id: str):
-        if client_id in self.active_connections:
-            await self.active_connections[client_id].send_text(message)
+        self.pubsub.publish(f"user:{client_id}", message)
 
     async def broadcast_to_admins(self, message: str):
-        for connection in self.admin_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                pass
+        self.pubsub.publish("admins", message)
 
     async def broadcast_to_collectors(self, message: str):
-        for connection in self.collector_connections:
-            try:
-                await connection.send_text(message)
-            except:
-                pass
+        self.pubsub.publish("collectors", message)
+
+    async def broadcast_announcement(self, message: str, target_role: str = "all"):
+        target = {"citizen": "citizens", "collector": "collectors", "admin": "admins"}.get(target_role, "all")
+        self.pubsub.publish(target, message)
 
     async def broadcast_tracking_update(self, driver_id: str, location: dict):
-        # In a real app, only broadcast to users subscribed to this driver's route
-        # For MVP, broadcast to all for demo effect
-        message = json.dumps({"type": "tracking", "driver_id": driver_id, "location": location})
-        for connection in self.active_connections.values():
-            try:
-                await connection.send_text(message)
-            except:
-                pass
+        # Only subscribers of this driver get it, at most once per
+        # TRACKING_INTERVAL with the latest position (services.tracking)
+        self.tracker.update(driver_id, location)
 
 manager = ConnectionManager()
 
 @router.websocket("/ws/{client_id}")
-async def websocket_endpoint(websocket: WebSocket, client_id: str):
-    await manager.connect(websocket, client_id)
+async def websocket_endpoint(websocket: WebSocket, client_id: str, last_announcement: Optional[str] = None):
+    # last_announcement: cursor of the newest announcement the client has
+    # seen; anything newer for its role arrives in one catch-up message
+    connection = await manager.connect(websocket, client_id)
+    if connection.role == "admin" and manager.live_stats.current:
+        # Full snapshot; later ticks only send what changed
+        connection.send(json.dumps({"type": "analytics_update", **manager.live_stats.current}))
+    await send_missed_announcements(connection, last_announcement)
     try:
         while True:
             data = await websocket.receive_text()
@@ -73,23 +243,148 @@ async def websocket_endpoint(websocket: WebSocket, client_id: str):
             
             if message.get("type") == "location_update":
                 # Driver sending location
-                await manager.broadcast_tracking_update(client_id, message.get("location"))
+                if connection.role == "collector":
+                    await manager.broadcast_tracking_update(client_id, message.get("location"))
+
+            elif message.get("type") == "subscribe":
+                # Follow a driver; "binary": true switches to compact frames
+                if "binary" in message:
+                    connection.binary = bool(message["binary"])
+                if not manager.subscribe(connection, str(message.get("driver_id"))):
+                    connection.send(json.dumps({"type": "error", "detail": f"At most {MAX_TRACKED_DRIVERS} drivers can be tracked"}))
+
+            elif message.get("type") == "unsubscribe":
+                manager.unsubscribe(connection, str(message.get("driver_id")))
+
+            elif message.get("type") == "track_pickup":
+                await track_pickup(connection, str(message.get("pickup_id")), bool(message.get("binary", connection.binary)))
                 
             elif message.get("type") == "ping":
-                await websocket.send_text(json.dumps({"type": "pong"}))
+                connection.send(json.dumps({"type": "pong"}))
                 
     except WebSocketDisconnect:
-        manager.disconnect(websocket, client_id)
+        pass
+    finally:
+        manager.disconnect(connection)
+
+async def send_missed_announcements(connection: ClientConnection, cursor: Optional[str]):
+    # Runs after the connection is registered, so an announcement published
+    # meanwhile may arrive twice; clients dedupe by id
+    try:
+        async with AsyncSessionLocal() as db:
+            items = await missed_announcements(db, connection.role, decode_cursor(cursor))
+    except Exception:
+        logger.exception("Could not load missed announcements for %s", connection.client_id)
+        return
+    if items:
+        connection.send(json.dumps({"type": "announcements", "items": items, "cursor": items[-1]["cursor"]}))
+
+async def track_pickup(connection: ClientConnection, pickup_id: str, binary: bool):
+    # Subscribe a citizen to the collector assigned to their own pickup.
+    # Collectors connect as 'collector_<user id>'.
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(PickupRequest.user_id, PickupRequest.collector_id).filter(PickupRequest.id == pickup_id)
+        )
+        row = result.first()
+    if row is None or row.user_id != connection.client_id:
+        connection.send(json.dumps({"type": "error", "detail": "Pickup not found"}))
+        return
+    if row.collector_id is None:
+        connection.send(json.dumps({"type": "error", "detail": "No collector assigned yet"}))
+        return
+    connection.binary = binary
+    driver_id = f"collector_{row.collector_id}"
+    manager.subscribe(connection, driver_id)
+    connection.send(json.dumps({"type": "tracking_subscribed", "pickup_id": pickup_id, "driver_id": driver_id}))
+
+class LiveStatsLeader:
+    # The worker that reads the live stats snapshot for the whole cluster:
+    # whoever holds a session advisory lock, on a connection kept open for
+    # as long as it leads. If it dies the lock goes with its connection and
+    # another worker takes over on its next tick.
+
+    def __init__(self, bind=None):
+        self.bind = bind
+        self.connection = None
+
+    async def is_leader(self) -> bool:
+        if self.connection is not None:
+            try:
+                await self.connection.execute(text("SELECT 1"))
+                await self.connection.commit()
+                return True
+            except Exception:
+                logger.warning("Lost the live stats leader connection")
+                await self._close()
+        bind = self.bind or engine
+        if bind.dialect.name != "postgresql":
+            return True
+        connection = await bind.connect()
+        try:
+            acquired = (await connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": LIVE_STATS_LOCK_KEY})).scalar()
+            await connection.commit()
+        except Exception:
+            await connection.close()
+            raise
+        if not acquired:
+            await connection.close()
+            return False
+        self.connection = connection
+        return True
+
+    async def release(self):
+        if self.connection is not None:
+            try:
+                await self.connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": LIVE_STATS_LOCK_KEY})
+                await self.connection.commit()
+            finally:
+                await self._close()
+
+    async def _close(self):
+        connection, self.connection = self.connection, None
+        try:
+            await connection.close()
+        except Exception:
+            pass
+
+
+live_stats_leader = LiveStatsLeader()
+
+
+async def read_live_stats() -> Dict[str, float]:
+    # One read of the shared counters (services.stats), whatever the size
+    # of the tables, plus the connections reported by every worker
+    async with AsyncSessionLocal() as db:
+        totals = await get_totals(db)
+    return {
+        "active_users": manager.worker_counts.total("connections"),
+        "co2_saved": round(totals["co2_saved"], 1),
+        "waste_collected": totals["collections"],
+    }
+
+
+def report_connections(manager: ConnectionManager):
+    manager.pubsub.publish("worker_counts", json.dumps({
+        "worker": manager.pubsub.worker_id,
+        "connections": manager.connection_count(),
+        "admins": len(manager.admin_connections),
+    }))
+
 
-# Background task to simulate live analytics
 async def broadcast_live_stats():
-    import random
+    # Every worker reports its connections; only the leader reads the
+    # database and its snapshot reaches every worker's admins
     while True:
-        await asyncio.sleep(5)  # Update every 5 seconds
-        stats = {
-            "type": "analytics_update",
-            "active_users": random.randint(100, 500),
-            "co2_saved": random.randint(1000, 5000),
-            "waste_collected": random.randint(500, 2000)
-        }
-        await manager.broadcast_to_admins(json.dumps(stats))
+        await asyncio.sleep(LIVE_STATS_INTERVAL)
+        report_connections(manager)
+        if not manager.worker_counts.total("admins"):
+            continue
+        try:
+            if not await live_stats_leader.is_leader():
+                continue
+            values = await read_live_stats()
+        except Exception:
+            logger.exception("Could not read live stats")
+            continue
+        manager.pubsub.publish("live_stats", json.dumps(values))
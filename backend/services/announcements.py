@@ -0,0 +1,62 @@
+import os
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import or_, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from tables import Announcement
+
+# Most announcements sent in one catch-up message; a client that has been
+# away longer only gets the newest ones
+CATCHUP_LIMIT = int(os.getenv("ANNOUNCEMENT_CATCHUP_LIMIT", "50"))
+
+Cursor = Tuple[datetime, str]
+
+
+def encode_cursor(announcement: Announcement) -> str:
+    # (date, id) of the last announcement a client has seen; ids break ties
+    # between announcements sent in the same microsecond
+    return f"{announcement.date.isoformat()}_{announcement.id}"
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Cursor]:
+    if not cursor:
+        return None
+    date, _, announcement_id = cursor.partition("_")
+    try:
+        return datetime.fromisoformat(date), announcement_id
+    except ValueError:
+        return None
+
+
+def audience_filter(role: str):
+    # Announcements aimed at everyone or at this role
+    return or_(Announcement.target_role.in_(("all", role)), Announcement.target_role.is_(None))
+
+
+def announcement_message(announcement: Announcement) -> dict:
+    return {
+        "id": announcement.id,
+        "title": announcement.title,
+        "message": announcement.message,
+        "priority": announcement.priority,
+        "target_role": announcement.target_role or "all",
+        "date": announcement.date.isoformat(),
+        "cursor": encode_cursor(announcement),
+    }
+
+
+def missed_announcements_query(role: str, cursor: Optional[Cursor], limit: int = CATCHUP_LIMIT):
+    query = select(Announcement).filter(audience_filter(role))
+    if cursor is not None:
+        query = query.filter(tuple_(Announcement.date, Announcement.id) > tuple_(*cursor))
+    return query.order_by(Announcement.date.desc(), Announcement.id.desc()).limit(limit)
+
+
+async def missed_announcements(db: AsyncSession, role: str, cursor: Optional[Cursor], limit: int = CATCHUP_LIMIT) -> List[dict]:
+    # Oldest first. Without a cursor (first connection) the newest `limit`
+    # stand in for the announcements list.
+    result = await db.execute(missed_announcements_query(role, cursor, limit))
+    return [announcement_message(announcement) for announcement in reversed(result.scalars().all())]
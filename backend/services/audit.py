@@ -0,0 +1,150 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import insert
+
+from database import AsyncSessionLocal
+from tables import AuditLog, generate_uuid
+
+logger = logging.getLogger(__name__)
+
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", "1.0"))
+
+AUDIT_QUEUE_DEPTH = Gauge("audit_log_queue_depth", "Audit log entries waiting to be written")
+AUDIT_DROPPED = Counter("audit_log_dropped_total", "Audit log entries dropped because the queue was full")
+AUDIT_WRITTEN = Counter("audit_log_written_total", "Audit log entries written to the database")
+AUDIT_WRITE_ERRORS = Counter("audit_log_write_errors_total", "Failed audit log batch inserts")
+AUDIT_BATCH_SIZE_HIST = Histogram("audit_log_batch_size", "Audit log rows per insert", buckets=(1, 5, 10, 50, 100, 250, 500, 1000, 5000))
+
+
+def audit_row(entry: dict) -> dict:
+    return {
+        "id": generate_uuid(),
+        "user_id": entry.get("user_id"),
+        "action": entry["method"], # Mapping method to action for now
+        "endpoint": entry["endpoint"],
+        "ip_address": entry["ip_address"],
+        "status_code": entry.get("status_code"),
+        "duration_ms": round(entry["duration"] * 1000.0, 3) if entry.get("duration") is not None else None,
+        "timestamp": datetime.fromtimestamp(entry["timestamp"]),
+    }
+
+
+async def write_audit_rows(rows: List[dict]):
+    async with AsyncSessionLocal() as session:
+        await session.execute(insert(AuditLog), rows)
+        await session.commit()
+
+
+class AuditLogWriter:
+    # In-process buffer for audit rows. Requests only enqueue; a background
+    # task bulk-inserts a batch once AUDIT_BATCH_SIZE rows are waiting or
+    # AUDIT_FLUSH_INTERVAL seconds after the first row of the batch. When
+    # the queue is full new entries are dropped and counted, never awaited.
+
+    def __init__(self, queue_size: int = AUDIT_QUEUE_SIZE, batch_size: int = AUDIT_BATCH_SIZE, flush_interval: float = AUDIT_FLUSH_INTERVAL):
+        # The bound is checked in submit() so stop() can always queue its
+        # wake-up (None)
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.task: Optional[asyncio.Task] = None
+        self.dropped = 0
+        self.stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        if not self.running:
+            self.stopping = False
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Stopping is a message, not a cancel: on Python < 3.12 wait_for can
+        # swallow a cancel that arrives as queue.get() completes, leaving the
+        # task waiting on the queue forever
+        if self.task is not None:
+            if self.running:
+                self.queue.put_nowait(None)
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        # Final flush on shutdown
+        while not self.queue.empty():
+            await self._flush(self._drain(self.batch_size))
+
+    def submit(self, entry: dict) -> bool:
+        if self.queue.qsize() >= self.queue_size:
+            self.dropped += 1
+            AUDIT_DROPPED.inc()
+            return False
+        self.queue.put_nowait(audit_row(entry))
+        AUDIT_QUEUE_DEPTH.set(self.queue.qsize())
+        return True
+
+    def _drain(self, limit: int) -> List[dict]:
+        rows = []
+        while len(rows) < limit and not self.queue.empty():
+            row = self.queue.get_nowait()
+            if row is None:
+                self.stopping = True
+            else:
+                rows.append(row)
+        return rows
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self.stopping:
+            rows = []
+            try:
+                row = await self.queue.get()
+                if row is None:
+                    return
+                rows.append(row)
+                deadline = loop.time() + self.flush_interval
+                while len(rows) < self.batch_size and not self.stopping:
+                    rows.extend(self._drain(self.batch_size - len(rows)))
+                    timeout = deadline - loop.time()
+                    if len(rows) >= self.batch_size or timeout <= 0 or self.stopping:
+                        break
+                    try:
+                        row = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    if row is None:
+                        self.stopping = True
+                    else:
+                        rows.append(row)
+            except asyncio.CancelledError:
+                # Don't lose rows already taken off the queue
+                await self._flush(rows)
+                raise
+            # Shielded so a cancel can't abort an insert halfway
+            await asyncio.shield(self._flush(rows))
+
+    async def _flush(self, rows: List[dict]):
+        AUDIT_QUEUE_DEPTH.set(self.queue.qsize())
+        if not rows:
+            return
+        try:
+            await write_audit_rows(rows)
+        except Exception:
+            AUDIT_WRITE_ERRORS.inc()
+            logger.exception("Failed to write %d audit log rows", len(rows))
+            return
+        AUDIT_WRITTEN.inc(len(rows))
+        AUDIT_BATCH_SIZE_HIST.observe(len(rows))
+
+
+audit_writer = AuditLogWriter()
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Optional, Set
+
+from prometheus_client import Counter, Gauge
+
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "30"))
+# Validated tokens remembered per user (one per active session/device)
+MAX_TOKENS_PER_USER = 16
+# Recent revocations and invalidations kept to check in-flight lookups against
+CHANGE_LOG_SIZE = 1024
+
+AUTH_CACHE_HITS = Counter("auth_user_cache_hits_total", "get_current_user lookups served from cache")
+AUTH_CACHE_MISSES = Counter("auth_user_cache_misses_total", "get_current_user lookups that went to the database")
+AUTH_CACHE_EVICTIONS = Counter("auth_user_cache_evictions_total", "Entries removed from the user cache", ["reason"])
+AUTH_CACHE_ENTRIES = Gauge("auth_user_cache_entries", "Users currently cached")
+
+# Never cached: credentials shouldn't sit in a long-lived process cache
+EXCLUDED_COLUMNS = {"password", "otp", "otp_expiry"}
+
+
+class _Entry:
+    __slots__ = ("expires_at", "user", "tokens")
+
+    def __init__(self, expires_at: float, user: dict, tokens: Set[str]):
+        self.expires_at = expires_at
+        self.user = user
+        self.tokens = tokens
+
+
+def token_digest(token: str) -> str:
+    # Tokens are remembered (and revoked across workers) by digest only
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class UserCache:
+    # TTL + LRU cache of resolved users keyed by JWT subject. An entry only
+    # vouches for tokens that were checked against an active UserSession, so
+    # a revoked token is a miss even while the user itself is cached. Once
+    # publish is set (the realtime pub/sub), revocations and invalidations
+    # reach every worker's cache through apply_message; the TTL bounds
+    # staleness if one of those messages is lost. A lookup takes the
+    # generation before reading the database and passes it to put, which
+    # drops the result if the user or token changed meanwhile.
+
+    def __init__(self, maxsize: int = AUTH_CACHE_SIZE, ttl: float = AUTH_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._subjects_by_user_id: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        # Every change bumps the generation; the log holds the user id or
+        # token digest of the last CHANGE_LOG_SIZE of them, newest last
+        self._generation = 0
+        self._changes: "deque[str]" = deque(maxlen=CHANGE_LOG_SIZE)
+        self.publish: Optional[Callable[[str], None]] = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, subject: str, token: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._remove(subject, "expired")
+                entry = None
+            if entry is None or token_digest(token) not in entry.tokens:
+                AUTH_CACHE_MISSES.inc()
+                return None
+            self._entries.move_to_end(subject)
+            AUTH_CACHE_HITS.inc()
+            return entry.user
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def _changed_since(self, generation: int, keys: Set[str]) -> bool:
+        newer = self._generation - generation
+        if newer <= 0:
+            return False
+        if newer > len(self._changes):
+            # Older than the log: assume the worst
+            return True
+        return any(self._changes[-i] in keys for i in range(1, newer + 1))
+
+    def put(self, subject: str, token: str, user: dict, generation: Optional[int] = None):
+        # generation: self.generation from before the user was read
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and self._changed_since(generation, {user["id"], token_digest(token)}):
+                return
+            entry = self._entries.get(subject)
+            if entry is not None and entry.user.get("id") == user.get("id") and entry.expires_at > time.monotonic():
+                entry.user = user
+                if len(entry.tokens) >= MAX_TOKENS_PER_USER:
+                    entry.tokens.pop()
+                entry.tokens.add(token_digest(token))
+            else:
+                if entry is not None:
+                    self._remove(subject, "replaced")
+                self._entries[subject] = _Entry(time.monotonic() + self.ttl, user, {token_digest(token)})
+                self._subjects_by_user_id[user["id"]] = subject
+            self._entries.move_to_end(subject)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)), "lru")
+            AUTH_CACHE_ENTRIES.set(len(self._entries))
+
+    def invalidate_user(self, user_id: str):
+        # Role change, deletion, approval...: drop everything for the user
+        self._send({"invalidate_user": user_id})
+
+    def revoke_token(self, token: str):
+        self._send({"revoke_token": token_digest(token)})
+
+    def _send(self, change: dict):
+        # The pub/sub delivers to this worker right away, then to the others
+        if self.publish is not None:
+            self.publish(json.dumps(change))
+        else:
+            self.apply(change)
+
+    def apply_message(self, message: str):
+        self.apply(json.loads(message))
+
+    def apply(self, change: dict):
+        if "invalidate_user" in change:
+            self._invalidate_user(change["invalidate_user"])
+        if "revoke_token" in change:
+            self._revoke_digest(change["revoke_token"])
+
+    def _log_change(self, key: str):
+        self._generation += 1
+        self._changes.append(key)
+
+    def _invalidate_user(self, user_id: str):
+        with self._lock:
+            self._log_change(user_id)
+            subject = self._subjects_by_user_id.get(user_id)
+            if subject is not None:
+                self._remove(subject, "invalidated")
+            AUTH_CACHE_ENTRIES.set(len(self._entries))
+
+    def _revoke_digest(self, digest: str):
+        with self._lock:
+            self._log_change(digest)
+            for entry in self._entries.values():
+                if digest in entry.tokens:
+                    entry.tokens.discard(digest)
+                    AUTH_CACHE_EVICTIONS.labels(reason="revoked").inc()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._subjects_by_user_id.clear()
+            AUTH_CACHE_ENTRIES.set(0)
+
+    def _remove(self, subject: str, reason: str):
+        entry = self._entries.pop(subject, None)
+        if entry is None:
+            return
+        if self._subjects_by_user_id.get(entry.user.get("id")) == subject:
+            del self._subjects_by_user_id[entry.user["id"]]
+        AUTH_CACHE_EVICTIONS.labels(reason=reason).inc()
+
+
+def user_snapshot(user) -> dict:
+    return {
+        column.key: getattr(user, column.key)
+        for column in user.__table__.columns
+        if column.key not in EXCLUDED_COLUMNS
+    }
+
+
+user_cache = UserCache()
@@ -0,0 +1,453 @@
+import asyncio
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from database import AsyncSessionLocal
+from tables import Block, TokenBalance
+
+MINT_ADDRESS = "0x00000000000000000000000000000000"
+GENESIS_PREVIOUS_HASH = "0" * 64
+REBUILD_BATCH_SIZE = 5000
+UPSERT_CHUNK = 1000
+
+# pg_advisory_xact_lock key serializing block appends across workers/pods
+APPEND_LOCK_KEY = 0x57494953 # 'WIIS'
+APPEND_RETRIES = 5
+
+MINT_BATCH_SIZE = int(os.getenv("MINT_BATCH_SIZE", "500"))
+MINT_BATCH_DELAY = float(os.getenv("MINT_BATCH_DELAY", "0.05"))
+
+VERIFY_CHUNK_SIZE = 2000
+VERIFY_WORKERS = int(os.getenv("CHAIN_VERIFY_WORKERS", str(os.cpu_count() or 1)))
+# A full verification re-hashes the whole chain: one at a time per worker,
+# and a new one no sooner than this many seconds after the last started
+VERIFY_MIN_INTERVAL = float(os.getenv("CHAIN_VERIFY_MIN_INTERVAL", "60"))
+
+
+def calculate_hash(block_data):
+    # Simple SHA256 hash of block content
+    block_string = json.dumps(block_data, sort_keys=True, default=str).encode()
+    return hashlib.sha256(block_string).hexdigest()
+
+
+def block_hash(index: int, timestamp: datetime, transactions: List[dict], previous_hash: str) -> str:
+    return calculate_hash({
+        "index": index,
+        "timestamp": timestamp,
+        "transactions": transactions,
+        "previous_hash": previous_hash
+    })
+
+
+def user_address(user_id: str) -> str:
+    return f"user_{user_id}"
+
+
+def mint_amount(amount) -> float:
+    # Rewards are positive, finite JSON numbers
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or not math.isfinite(amount) or amount <= 0:
+        raise ValueError(f"Invalid mint amount {amount!r}, expected a positive number")
+    return amount
+
+
+def check_mint(transaction: dict):
+    # Raises ValueError for a mint that would break the block it lands in
+    if not isinstance(transaction, dict):
+        raise ValueError("A mint must be an object")
+    receiver = transaction.get("to")
+    if not isinstance(receiver, str) or receiver in ("", MINT_ADDRESS, user_address("")):
+        raise ValueError("A mint needs a receiving address")
+    mint_amount(transaction.get("amount"))
+
+
+def transaction_deltas(transactions: Iterable[dict], deltas: Dict[str, float] = None) -> Dict[str, float]:
+    # Net balance change per address; the mint address is a source only
+    if deltas is None:
+        deltas = defaultdict(float)
+    for tx in transactions or []:
+        amount = float(tx.get("amount", 0) or 0)
+        receiver = tx.get("to")
+        sender = tx.get("from")
+        if receiver and receiver != MINT_ADDRESS:
+            deltas[receiver] += amount
+        if sender and sender != MINT_ADDRESS:
+            deltas[sender] -= amount
+    return deltas
+
+
+async def _upsert_deltas(db: AsyncSession, deltas: Dict[str, float], block_index: int):
+    now = datetime.utcnow()
+    # Sorted so concurrent writers lock rows in the same order
+    rows = [
+        {"address": address, "balance": amount, "last_block_index": block_index, "updated_at": now}
+        for address, amount in sorted(deltas.items())
+    ]
+    for start in range(0, len(rows), UPSERT_CHUNK):
+        stmt = pg_insert(TokenBalance).values(rows[start:start + UPSERT_CHUNK])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[TokenBalance.address],
+            set_={
+                "balance": TokenBalance.balance + stmt.excluded.balance,
+                "last_block_index": func.greatest(TokenBalance.last_block_index, stmt.excluded.last_block_index),
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+        await db.execute(stmt)
+
+
+async def apply_block(db: AsyncSession, index: int, transactions: List[dict]):
+    # Called in the same transaction that inserts the block
+    deltas = transaction_deltas(transactions)
+    if deltas:
+        await _upsert_deltas(db, deltas, index)
+
+
+async def get_token_balance(db: AsyncSession, address: str) -> float:
+    result = await db.execute(select(TokenBalance.balance).filter(TokenBalance.address == address))
+    return result.scalar() or 0.0
+
+
+async def _scan_deltas(db: AsyncSession, after_index: int, batch_size: int, deltas: Dict[str, float]) -> int:
+    # Keyset-paginated scan of blocks with index > after_index; only the
+    # per-address totals are kept in memory, never the blocks themselves.
+    last_index = after_index
+    while True:
+        result = await db.execute(
+            select(Block.index, Block.transactions)
+            .filter(Block.index > last_index)
+            .order_by(Block.index)
+            .limit(batch_size)
+        )
+        rows = result.all()
+        if not rows:
+            return last_index
+        for index, transactions in rows:
+            transaction_deltas(transactions, deltas)
+        last_index = rows[-1][0]
+
+
+async def rebuild_token_balances(db: AsyncSession, batch_size: int = REBUILD_BATCH_SIZE) -> dict:
+    started = datetime.utcnow()
+    deltas = defaultdict(float)
+    head = await _scan_deltas(db, -1, batch_size, deltas)
+    await db.commit()
+
+    # Swap in the rebuilt projection. The exclusive lock holds off
+    # incremental updates; blocks appended during the scan are replayed.
+    await db.execute(text("LOCK TABLE token_balances IN EXCLUSIVE MODE"))
+    head = await _scan_deltas(db, head, batch_size, deltas)
+    await db.execute(delete(TokenBalance))
+    await _upsert_deltas(db, deltas, head)
+    await db.commit()
+
+    return {
+        "addresses": len(deltas),
+        "head_index": head,
+        "elapsed_seconds": round((datetime.utcnow() - started).total_seconds(), 3),
+    }
+
+
+# --- Block append ---
+
+async def append_block(db: AsyncSession, transactions: List[dict]) -> Block:
+    # Appends one block holding `transactions` and updates the balance
+    # projection; the caller commits. The advisory lock serializes appends
+    # across processes, the unique index on blockchain.index is the backstop.
+    for attempt in range(APPEND_RETRIES):
+        try:
+            if db.bind.dialect.name == "postgresql":
+                await db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": APPEND_LOCK_KEY})
+            result = await db.execute(select(Block.index, Block.hash).order_by(Block.index.desc()).limit(1))
+            head = result.first()
+            index = (head.index + 1) if head else 0
+            previous_hash = head.hash if head else GENESIS_PREVIOUS_HASH
+            timestamp = datetime.utcnow()
+
+            block = Block(
+                index=index,
+                timestamp=timestamp,
+                transactions=transactions,
+                previous_hash=previous_hash,
+                hash=block_hash(index, timestamp, transactions, previous_hash)
+            )
+            db.add(block)
+            await db.flush()
+            await apply_block(db, index, transactions)
+            return block
+        except IntegrityError:
+            await db.rollback()
+            if attempt == APPEND_RETRIES - 1:
+                raise
+            await asyncio.sleep(0.01 * (attempt + 1))
+
+
+# Queued by MintBatcher.stop() to wake the batching task
+_STOP = (None, None)
+
+
+class MintBatcher:
+    # Packs reward transactions submitted concurrently into one block:
+    # a batch is flushed at MINT_BATCH_SIZE transactions or MINT_BATCH_DELAY
+    # seconds after its first transaction, whichever comes first.
+
+    def __init__(self, max_batch: int = MINT_BATCH_SIZE, max_delay: float = MINT_BATCH_DELAY):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        self.blocks_written = 0
+        self.transactions_written = 0
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        if not self.running:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Stopping is a message, not a cancel: on Python < 3.12 wait_for can
+        # swallow a cancel that arrives as queue.get() completes, and the
+        # task would then wait on the queue forever. The task flushes the
+        # batch it holds and returns.
+        if self.task is not None:
+            if self.running:
+                self.queue.put_nowait(_STOP)
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        # Flush whatever was still queued
+        batch = []
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is not _STOP:
+                batch.append(item)
+        if batch:
+            await self._flush(batch)
+
+    async def submit(self, transaction: dict) -> str:
+        # Resolves to the hash of the block the transaction landed in
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((transaction, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = []
+            stopping = False
+            try:
+                item = await self.queue.get()
+                if item is _STOP:
+                    return
+                batch.append(item)
+                deadline = loop.time() + self.max_delay
+                while len(batch) < self.max_batch:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    batch.append(item)
+            except asyncio.CancelledError:
+                # Cancelled from outside (event loop shutdown): don't lose
+                # the batch already taken off the queue
+                if batch:
+                    await self._flush(batch)
+                raise
+            await asyncio.shield(self._flush(batch))
+            if stopping:
+                return
+
+    async def _flush(self, batch: List[Tuple[dict, asyncio.Future]]):
+        # A malformed mint fails on its own instead of taking the whole
+        # block (and every other caller in it) down with it
+        valid = []
+        for tx, future in batch:
+            try:
+                check_mint(tx)
+            except ValueError as exc:
+                if not future.done():
+                    future.set_exception(exc)
+                continue
+            valid.append((tx, future))
+        if not valid:
+            return
+        try:
+            block_hash = await self._append([tx for tx, _ in valid])
+        except Exception as exc:
+            for _, future in valid:
+                if not future.done():
+                    future.set_exception(exc)
+            return
+        self.blocks_written += 1
+        self.transactions_written += len(valid)
+        for _, future in valid:
+            if not future.done():
+                future.set_result(block_hash)
+
+    async def _append(self, transactions: List[dict]) -> str:
+        async with AsyncSessionLocal() as db:
+            block = await append_block(db, transactions)
+            await db.commit()
+            return block.hash
+
+
+mint_batcher = MintBatcher()
+
+
+# --- Chain verification ---
+
+_verify_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_verify_pool() -> ProcessPoolExecutor:
+    global _verify_pool
+    if _verify_pool is None:
+        # spawn: forking a process that runs an event loop and threads is unsafe
+        _verify_pool = ProcessPoolExecutor(max_workers=VERIFY_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _verify_pool
+
+
+def shutdown_verify_pool():
+    global _verify_pool
+    if _verify_pool is not None:
+        _verify_pool.shutdown(cancel_futures=True)
+        _verify_pool = None
+
+
+class VerifyLimiter:
+    def __init__(self, min_interval: float = VERIFY_MIN_INTERVAL):
+        self.min_interval = min_interval
+        self.running = False
+        self.last_started: Optional[float] = None
+
+    def acquire(self) -> float:
+        # 0 when a verification may start now, else seconds to wait
+        now = time.monotonic()
+        if self.running:
+            return max(self.min_interval, 1.0)
+        if self.last_started is not None and now - self.last_started < self.min_interval:
+            return self.last_started + self.min_interval - now
+        self.running = True
+        self.last_started = now
+        return 0.0
+
+    def release(self):
+        self.running = False
+
+
+verify_limiter = VerifyLimiter()
+
+
+def verify_chunk(rows: List[tuple]) -> Optional[Tuple[int, str]]:
+    # rows: (index, timestamp, transactions, previous_hash, hash) in index
+    # order. Returns (index, reason) for the first bad block in the chunk.
+    previous = None
+    for index, timestamp, transactions, previous_hash, stored_hash in rows:
+        if block_hash(index, timestamp, transactions, previous_hash) != stored_hash:
+            return index, "hash mismatch"
+        if previous is not None:
+            if index != previous[0] + 1:
+                return index, f"index gap after {previous[0]}"
+            if previous_hash != previous[1]:
+                return index, "previous_hash does not match previous block"
+        previous = (index, stored_hash)
+    return None
+
+
+def _check_boundary(tail: Optional[tuple], head: tuple) -> Optional[Tuple[int, str]]:
+    # Link between the last block of one chunk and the first of the next
+    index, _, _, previous_hash, _ = head
+    if tail is None:
+        if index != 0:
+            return index, "chain does not start at index 0"
+        if previous_hash != GENESIS_PREVIOUS_HASH:
+            return index, "genesis previous_hash is not zero"
+        return None
+    if index != tail[0] + 1:
+        return index, f"index gap after {tail[0]}"
+    if previous_hash != tail[4]:
+        return index, "previous_hash does not match previous block"
+    return None
+
+
+async def verify_chain(db: AsyncSession, chunk_size: int = VERIFY_CHUNK_SIZE, parallel: bool = True) -> dict:
+    # Streams the chain with a server-side cursor and re-hashes chunks in a
+    # process pool, keeping a bounded number of chunks in flight. Chunks are
+    # settled in order, so the first failure reported is the earliest one.
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    executor = _get_verify_pool() if parallel else None
+    max_in_flight = (VERIFY_WORKERS * 2) if parallel else 1
+
+    in_flight = deque()
+    checked = 0
+    tail = None
+    first_invalid = None
+
+    async def settle():
+        nonlocal checked, tail, first_invalid
+        head, last, size, future = in_flight.popleft()
+        problem = _check_boundary(tail, head) or await future
+        if problem is not None:
+            first_invalid = {"index": problem[0], "reason": problem[1]}
+            return
+        checked += size
+        tail = last
+
+    stream = await db.stream(
+        select(Block.index, Block.timestamp, Block.transactions, Block.previous_hash, Block.hash)
+        .order_by(Block.index)
+        .execution_options(yield_per=chunk_size)
+    )
+    try:
+        async for partition in stream.partitions(chunk_size):
+            rows = [tuple(row) for row in partition]
+            if executor is not None:
+                future = loop.run_in_executor(executor, verify_chunk, rows)
+            else:
+                future = asyncio.to_thread(verify_chunk, rows)
+            in_flight.append((rows[0], rows[-1], len(rows), future))
+            while len(in_flight) >= max_in_flight and first_invalid is None:
+                await settle()
+            if first_invalid is not None:
+                break
+        while in_flight and first_invalid is None:
+            await settle()
+    finally:
+        await stream.close()
+        for _, _, _, future in in_flight:
+            if asyncio.isfuture(future):
+                future.cancel()
+            else:
+                future.close()
+
+    return {
+        "valid": first_invalid is None,
+        "blocks_checked": checked,
+        "first_invalid": first_invalid,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000.0, 2),
+    }
@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, case, delete, event, func, insert, literal, or_, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session
+
+from database import AsyncSessionLocal
+from tables import Activity, CarbonRollup
+
+logger = logging.getLogger(__name__)
+
+# Days of activity kept at daily resolution; whole months older than this
+# are compacted into one row per user
+ROLLUP_DAILY_DAYS = int(os.getenv("ROLLUP_DAILY_DAYS", "92"))
+ROLLUP_COMPACT_INTERVAL = float(os.getenv("ROLLUP_COMPACT_INTERVAL", "86400"))
+GRANULARITIES = ("day", "week", "month")
+
+RollupKey = Tuple[str, str, datetime]  # (user_id, period, period_start)
+
+
+def period_start(period: str, when: datetime) -> datetime:
+    day = datetime(when.year, when.month, when.day)
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+
+def compacted_before(now: datetime) -> datetime:
+    # Start of the oldest month still kept at daily resolution
+    return period_start("month", now - timedelta(days=ROLLUP_DAILY_DAYS))
+
+
+def _bucket(when: datetime, boundary: datetime) -> Tuple[str, datetime]:
+    period = "month" if when < boundary else "day"
+    return period, period_start(period, when)
+
+
+def rollup_deltas(new: Iterable, deleted: Iterable = (), now: Optional[datetime] = None) -> Dict[RollupKey, List[float]]:
+    # [co2, activities] per rollup row touched by a flush. Only activities
+    # with a positive impact count, as on the footprint chart.
+    now = now or datetime.utcnow()
+    boundary = compacted_before(now)
+    deltas: Dict[RollupKey, List[float]] = defaultdict(lambda: [0.0, 0])
+    for sign, objects in ((1, new), (-1, deleted)):
+        for obj in objects:
+            if not isinstance(obj, Activity) or not obj.user_id or not (obj.impact_co2 or 0) > 0:
+                continue
+            delta = deltas[(obj.user_id, *_bucket(obj.date or now, boundary))]
+            delta[0] += sign * obj.impact_co2
+            delta[1] += sign
+    return {key: delta for key, delta in deltas.items() if delta[1]}
+
+
+def _increment_statement(deltas: Dict[RollupKey, List[float]]):
+    now = datetime.utcnow()
+    # Sorted so concurrent writers lock rollup rows in the same order
+    stmt = pg_insert(CarbonRollup).values([
+        {"user_id": user_id, "period": period, "period_start": start, "co2": co2, "activities": count, "updated_at": now}
+        for (user_id, period, start), (co2, count) in sorted(deltas.items())
+    ])
+    return stmt.on_conflict_do_update(
+        index_elements=[CarbonRollup.user_id, CarbonRollup.period, CarbonRollup.period_start],
+        set_={
+            "co2": CarbonRollup.co2 + stmt.excluded.co2,
+            "activities": CarbonRollup.activities + stmt.excluded.activities,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+
+
+@event.listens_for(Session, "after_flush")
+def _roll_up_activities(session, flush_context):
+    deltas = rollup_deltas(session.new, session.deleted)
+    if deltas:
+        session.connection().execute(_increment_statement(deltas))
+
+
+def fold(rows: Iterable, granularity: str) -> List[dict]:
+    # Re-bucket (period, period_start, co2, activities) rows. Month rows
+    # can't be split, so they stay whole at day or week granularity; each
+    # point says which resolution it has.
+    points: Dict[datetime, List] = {}
+    for period, start, co2, count in rows:
+        if period == "month" or granularity == "month":
+            key, resolution = period_start("month", start), "month"
+        else:
+            key, resolution = period_start(granularity, start), granularity
+        point = points.setdefault(key, [0.0, 0, resolution])
+        point[0] += co2 or 0.0
+        point[1] += count or 0
+    return [
+        {"date": start.date().isoformat(), "co2": round(co2, 2), "activities": count, "period": resolution}
+        for start, (co2, count, resolution) in sorted(points.items())
+    ]
+
+
+def _range_filter(start: Optional[datetime], end: Optional[datetime]):
+    filters = []
+    if start is not None:
+        # A month row covering `start` is included whole
+        filters.append(or_(
+            and_(CarbonRollup.period == "day", CarbonRollup.period_start >= start),
+            and_(CarbonRollup.period == "month", CarbonRollup.period_start >= period_start("month", start)),
+        ))
+    if end is not None:
+        filters.append(CarbonRollup.period_start < end)
+    return filters
+
+
+def user_footprint_query(user_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None):
+    return (
+        select(CarbonRollup.period, CarbonRollup.period_start, CarbonRollup.co2, CarbonRollup.activities)
+        .filter(CarbonRollup.user_id == user_id, *_range_filter(start, end))
+    )
+
+
+async def user_footprint(db: AsyncSession, user_id: str, granularity: str = "day", start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[dict]:
+    result = await db.execute(user_footprint_query(user_id, start, end))
+    return fold(result.all(), granularity)
+
+
+async def city_footprint(db: AsyncSession, granularity: str = "day", start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[dict]:
+    # Every user's rollups summed per bucket
+    result = await db.execute(
+        select(CarbonRollup.period, CarbonRollup.period_start, func.sum(CarbonRollup.co2), func.sum(CarbonRollup.activities))
+        .filter(*_range_filter(start, end))
+        .group_by(CarbonRollup.period, CarbonRollup.period_start)
+    )
+    return fold(result.all(), granularity)
+
+
+async def compact_rollups(db: AsyncSession, now: Optional[datetime] = None) -> dict:
+    # Fold day rows of closed months into month rows. The lock holds off
+    # the flush hook for the moment it takes, so no day row lands in a
+    # month while it is being folded.
+    boundary = compacted_before(now or datetime.utcnow())
+    await db.execute(text("LOCK TABLE carbon_rollups IN SHARE ROW EXCLUSIVE MODE"))
+    month = func.date_trunc("month", CarbonRollup.period_start)
+    old_days = and_(CarbonRollup.period == "day", CarbonRollup.period_start < boundary)
+    stmt = pg_insert(CarbonRollup).from_select(
+        ["user_id", "period", "period_start", "co2", "activities", "updated_at"],
+        select(CarbonRollup.user_id, literal("month"), month, func.sum(CarbonRollup.co2), func.sum(CarbonRollup.activities), func.now())
+        .filter(old_days)
+        .group_by(CarbonRollup.user_id, month),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CarbonRollup.user_id, CarbonRollup.period, CarbonRollup.period_start],
+        set_={
+            "co2": CarbonRollup.co2 + stmt.excluded.co2,
+            "activities": CarbonRollup.activities + stmt.excluded.activities,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    months = (await db.execute(stmt)).rowcount
+    days = (await db.execute(delete(CarbonRollup).where(old_days))).rowcount
+    await db.commit()
+    return {"boundary": boundary, "days_compacted": days, "months_written": months}
+
+
+async def rebuild_rollups(db: AsyncSession, now: Optional[datetime] = None) -> dict:
+    # Recompute every rollup from the activities table (first deployment,
+    # or after writes that bypassed the ORM). Writers wait on the lock.
+    started = datetime.utcnow()
+    boundary = compacted_before(now or started)
+    await db.execute(text("LOCK TABLE carbon_rollups IN EXCLUSIVE MODE"))
+    period = case((Activity.date < boundary, literal("month")), else_=literal("day"))
+    bucket = case((Activity.date < boundary, func.date_trunc("month", Activity.date)), else_=func.date_trunc("day", Activity.date))
+    await db.execute(delete(CarbonRollup))
+    result = await db.execute(
+        insert(CarbonRollup).from_select(
+            ["user_id", "period", "period_start", "co2", "activities", "updated_at"],
+            select(Activity.user_id, period, bucket, func.sum(Activity.impact_co2), func.count(Activity.id), func.now())
+            .filter(Activity.user_id.isnot(None), Activity.date.isnot(None), Activity.impact_co2 > 0)
+            .group_by(Activity.user_id, period, bucket),
+        )
+    )
+    await db.commit()
+    return {"rows": result.rowcount, "elapsed_seconds": round((datetime.utcnow() - started).total_seconds(), 3)}
+
+
+class RollupCompactor:
+    # Builds the rollups on first start if the table is empty, then runs
+    # compact_rollups every ROLLUP_COMPACT_INTERVAL seconds
+
+    def __init__(self, interval: float = ROLLUP_COMPACT_INTERVAL):
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+        self.last_result: Optional[dict] = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        if not self.running:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _run(self):
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    if (await db.execute(select(CarbonRollup.user_id).limit(1))).first() is None:
+                        self.last_result = await rebuild_rollups(db)
+                    else:
+                        self.last_result = await compact_rollups(db)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Carbon rollup compaction failed")
+            await asyncio.sleep(self.interval)
+
+
+rollup_compactor = RollupCompactor()
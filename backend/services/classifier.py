@@ -0,0 +1,266 @@
+import asyncio
+import io
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+from prometheus_client import Histogram
+
+CATEGORIES = ["Organic", "Recyclable", "Hazardous"]
+
+CLASSIFIER_BACKEND = os.getenv("CLASSIFIER_BACKEND", "mock")
+CLASSIFIER_MODEL_PATH = os.getenv("CLASSIFIER_MODEL_PATH", "models/waste_classifier.npz")
+CLASSIFIER_MAX_BATCH = int(os.getenv("CLASSIFIER_MAX_BATCH", "32"))
+CLASSIFIER_MAX_WAIT_MS = float(os.getenv("CLASSIFIER_MAX_WAIT_MS", "5"))
+
+CLASSIFIER_QUEUE_WAIT = Histogram(
+    "classifier_queue_wait_seconds", "Time an upload waited before its batch started",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+CLASSIFIER_BATCH_SIZE = Histogram("classifier_batch_size", "Images per inference call", buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+CLASSIFIER_INFERENCE = Histogram(
+    "classifier_inference_seconds", "Wall time of one batched inference call",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+Prediction = Tuple[str, float]
+
+
+class ClassifierBackend:
+    # preprocess() is the per-upload work (decoding, resizing); the service
+    # runs it in parallel for each request before queueing, so a batch only
+    # holds the shared model call. predict_batch() gets what preprocess()
+    # returned.
+    name = "base"
+    # Whether preprocess() is worth a trip to a worker thread
+    threaded_preprocess = False
+
+    def load(self):
+        pass
+
+    def preprocess(self, image: bytes):
+        return image
+
+    def predict_batch(self, inputs: list) -> List[Prediction]:
+        raise NotImplementedError
+
+
+class MockClassifier(ClassifierBackend):
+    # Random predictions for demos, same distribution as the old endpoint
+    name = "mock"
+
+    def predict_batch(self, inputs: list) -> List[Prediction]:
+        return [(random.choice(CATEGORIES), random.uniform(0.85, 0.99)) for _ in inputs]
+
+
+class NumpyClassifier(ClassifierBackend):
+    # CPU-only softmax classifier over downscaled RGB pixels. Weights come
+    # from an .npz with W (features x classes), b (classes) and optionally
+    # labels; a whole batch is one matrix multiply.
+    name = "numpy"
+    image_size = 32
+    threaded_preprocess = True
+
+    def __init__(self, model_path: str = CLASSIFIER_MODEL_PATH):
+        self.model_path = model_path
+        self.weights = None
+        self.bias = None
+        self.labels = CATEGORIES
+
+    def load(self):
+        with np.load(self.model_path) as model:
+            self.weights = model["W"].astype(np.float32)
+            self.bias = model["b"].astype(np.float32)
+            if "labels" in model:
+                self.labels = [str(label) for label in model["labels"]]
+        expected = self.image_size * self.image_size * 3
+        if self.weights.shape != (expected, len(self.labels)) or self.bias.shape != (len(self.labels),):
+            raise ValueError(f"Model {self.model_path} has shape {self.weights.shape}, expected ({expected}, {len(self.labels)})")
+
+    def preprocess(self, image: bytes) -> np.ndarray:
+        from PIL import Image
+        with Image.open(io.BytesIO(image)) as img:
+            img = img.convert("RGB").resize((self.image_size, self.image_size))
+            return np.asarray(img, dtype=np.float32).reshape(-1) / 255.0
+
+    def predict_batch(self, inputs: List[np.ndarray]) -> List[Prediction]:
+        features = np.stack(inputs)
+        logits = features @ self.weights + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+        best = probs.argmax(axis=1)
+        return [(self.labels[i], float(probs[row, i])) for row, i in enumerate(best.tolist())]
+
+
+BACKENDS = {
+    "mock": MockClassifier,
+    "numpy": NumpyClassifier,
+}
+
+
+def create_backend(name: str = CLASSIFIER_BACKEND) -> ClassifierBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown CLASSIFIER_BACKEND '{name}', expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name]()
+
+
+class ClassificationService:
+    # Loads the backend once and micro-batches concurrent uploads: requests
+    # that queue up while an inference call is running are sent together in
+    # the next call (up to max_batch, holding the batch open for at most
+    # max_wait_ms). Each upload is preprocessed on its own worker thread
+    # before it is queued, so decoding runs in parallel and only the model
+    # call is batched. Nothing CPU-bound runs on the event loop.
+
+    def __init__(self, backend: Optional[ClassifierBackend] = None, max_batch: int = CLASSIFIER_MAX_BATCH, max_wait_ms: float = CLASSIFIER_MAX_WAIT_MS):
+        self.backend = backend
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.loaded = False
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.task: Optional[asyncio.Task] = None
+        # Uploads still being preprocessed, i.e. about to be queued
+        self.preprocessing = 0
+        # Batched inference gets its own thread so it never queues behind
+        # the preprocessing jobs in the default executor
+        self.executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def load(self):
+        if self.backend is None:
+            self.backend = create_backend()
+        if not self.loaded:
+            await asyncio.to_thread(self.backend.load)
+            # Warm-up so the first real request doesn't pay for lazy init
+            if isinstance(self.backend, NumpyClassifier):
+                await asyncio.to_thread(lambda: self.backend.predict_batch([self.backend.preprocess(_blank_png())]))
+            self.loaded = True
+
+    async def start(self):
+        await self.load()
+        if not self.running:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="classifier")
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # A queued None stops the task after its current batch. Cancelling
+        # it instead can be swallowed by wait_for on Python < 3.12, leaving
+        # stop() waiting forever.
+        if self.task is not None:
+            if self.running:
+                self.queue.put_nowait(None)
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        while not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is None:
+                continue
+            _, future, _ = item
+            if not future.done():
+                future.set_exception(RuntimeError("Classifier service stopped"))
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    async def preprocess(self, image: bytes):
+        # An unreadable upload fails here, in its own request
+        if self.backend.threaded_preprocess:
+            return await asyncio.to_thread(self.backend.preprocess, image)
+        return self.backend.preprocess(image)
+
+    async def classify(self, image: bytes) -> Prediction:
+        if not self.running:
+            # No batch worker (e.g. serverless): load lazily, infer alone
+            await self.load()
+            return (await self._infer([await self.preprocess(image)]))[0]
+        self.preprocessing += 1
+        try:
+            features = await self.preprocess(image)
+        finally:
+            self.preprocessing -= 1
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((features, future, time.perf_counter()))
+        return await future
+
+    async def _infer(self, inputs: list) -> List[Prediction]:
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, self.backend.predict_batch, inputs)
+        finally:
+            CLASSIFIER_INFERENCE.observe(time.perf_counter() - started)
+            CLASSIFIER_BATCH_SIZE.observe(len(inputs))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            while len(batch) < self.max_batch and not self.queue.empty():
+                item = self.queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            # Only hold the batch open for uploads known to be on their way
+            # (still preprocessing); otherwise waiting just adds latency
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch and not stopping and self.preprocessing > 0:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    stopping = True
+                else:
+                    batch.append(item)
+
+            now = time.perf_counter()
+            for _, _, enqueued in batch:
+                CLASSIFIER_QUEUE_WAIT.observe(now - enqueued)
+            try:
+                predictions = await self._infer([features for features, _, _ in batch])
+            except Exception:
+                # Retry one by one so a bad input only fails its own request
+                await self._infer_individually(batch)
+                continue
+            for (_, future, _), prediction in zip(batch, predictions):
+                if not future.done():
+                    future.set_result(prediction)
+
+    async def _infer_individually(self, batch):
+        for features, future, _ in batch:
+            try:
+                prediction = (await self._infer([features]))[0]
+            except Exception as exc:
+                if not future.done():
+                    future.set_exception(exc)
+                continue
+            if not future.done():
+                future.set_result(prediction)
+
+
+def _blank_png() -> bytes:
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new("RGB", (NumpyClassifier.image_size, NumpyClassifier.image_size)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+classifier_service = ClassificationService()
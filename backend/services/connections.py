@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import os
+from typing import Callable, Optional, Set, Union
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+WS_QUEUE_SIZE = int(os.getenv("WS_QUEUE_SIZE", "256"))
+# What to do when a client's queue is full: 'drop_oldest' keeps the newest
+# messages, 'disconnect' closes the socket so the client reconnects
+WS_SLOW_POLICY = os.getenv("WS_SLOW_POLICY", "drop_oldest")
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+SLOW_POLICIES = ("drop_oldest", "disconnect")
+# How often stuck sends are looked for
+WATCHDOG_INTERVAL = 1.0
+
+WS_CONNECTIONS = Gauge("ws_connections", "Open WebSocket connections", ["role"])
+WS_QUEUE_DEPTH = Gauge("ws_outbound_queue_depth", "Messages waiting in WebSocket outbound queues, all connections")
+WS_QUEUE_MAX_DEPTH = Gauge("ws_outbound_queue_max_depth", "Deepest WebSocket outbound queue")
+WS_MESSAGES_DROPPED = Counter("ws_messages_dropped_total", "Messages dropped because a client's outbound queue was full")
+WS_DISCONNECTS = Counter("ws_server_disconnects_total", "Connections closed by the server", ["reason"])
+
+_open_connections: Set["ClientConnection"] = set()
+_watchdog: Optional[asyncio.Task] = None
+
+
+async def _watch_sends():
+    # One task checks every connection's in-flight send, instead of a
+    # wait_for (and the extra task it creates) around every message
+    loop = asyncio.get_running_loop()
+    while _open_connections:
+        await asyncio.sleep(WATCHDOG_INTERVAL)
+        now = loop.time()
+        for connection in list(_open_connections):
+            started = connection.send_started
+            if started is not None and now - started > connection.send_timeout:
+                connection.close("send_timeout")
+
+
+# Computed at scrape time so the send path takes no metric locks
+WS_QUEUE_DEPTH.set_function(lambda: sum(connection.queue.qsize() for connection in list(_open_connections)))
+WS_QUEUE_MAX_DEPTH.set_function(lambda: max((connection.queue.qsize() for connection in list(_open_connections)), default=0))
+
+
+def _ensure_watchdog():
+    global _watchdog
+    if _watchdog is None or _watchdog.done():
+        _watchdog = asyncio.create_task(_watch_sends())
+
+
+class ClientConnection:
+    # Outbound side of one WebSocket. send() only enqueues; a writer task
+    # per connection drains the bounded queue, so a slow client never holds
+    # up a broadcast. A send that fails or takes longer than send_timeout
+    # (checked by _watch_sends) closes the connection and on_close removes
+    # it from its manager.
+
+    def __init__(
+        self,
+        websocket,
+        client_id: str,
+        role: str,
+        on_close: Optional[Callable[["ClientConnection"], None]] = None,
+        queue_size: int = WS_QUEUE_SIZE,
+        policy: str = WS_SLOW_POLICY,
+        send_timeout: float = WS_SEND_TIMEOUT,
+    ):
+        if policy not in SLOW_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy '{policy}', expected one of {SLOW_POLICIES}")
+        self.websocket = websocket
+        self.client_id = client_id
+        self.role = role
+        self.on_close = on_close
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.closed = False
+        self.send_started: Optional[float] = None
+        # Driver ids this client tracks, and whether it wants binary frames
+        self.subscriptions: Set[str] = set()
+        self.binary = False
+        self.task = asyncio.create_task(self._writer())
+        _open_connections.add(self)
+        _ensure_watchdog()
+        WS_CONNECTIONS.labels(role=role).inc()
+
+    def send(self, message: Union[str, bytes]) -> bool:
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            if self.policy == "disconnect":
+                self.close("slow_consumer")
+                return False
+            self.queue.get_nowait()
+            self.queue.put_nowait(message)
+            self.dropped += 1
+            WS_MESSAGES_DROPPED.inc()
+        return True
+
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await self.queue.get()
+            self.send_started = loop.time()
+            try:
+                if isinstance(message, bytes):
+                    await self.websocket.send_bytes(message)
+                else:
+                    await self.websocket.send_text(message)
+            except Exception:
+                self.close("send_error")
+                return
+            self.send_started = None
+
+    def close(self, reason: Optional[str] = None):
+        if self.closed:
+            return
+        self.closed = True
+        _open_connections.discard(self)
+        WS_CONNECTIONS.labels(role=self.role).dec()
+        if reason is not None:
+            WS_DISCONNECTS.labels(reason=reason).inc()
+            asyncio.create_task(self._close_socket())
+        if self.task is not asyncio.current_task():
+            self.task.cancel()
+        if self.on_close is not None:
+            self.on_close(self)
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close()
+        except Exception:
+            # Already gone
+            pass
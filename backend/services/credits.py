@@ -0,0 +1,111 @@
+from typing import Optional
+
+from sqlalchemy import update, func, case, exists, or_, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from tables import User, CreditTransaction
+
+# User.credit_points is the spendable balance (sum of all transactions) and
+# User.credits_earned the lifetime total of 'earned' transactions. Both are
+# maintained in the same transaction as the CreditTransaction insert, so
+# reads never have to aggregate the ledger.
+
+
+async def award_credits(db: AsyncSession, user_id: str, amount: int, description: str) -> CreditTransaction:
+    credit = CreditTransaction(
+        user_id=user_id,
+        amount=amount,
+        type="earned",
+        description=description
+    )
+    db.add(credit)
+    await db.execute(
+        update(User)
+        .where(User.id == user_id)
+        .values(
+            credit_points=func.coalesce(User.credit_points, 0) + amount,
+            credits_earned=func.coalesce(User.credits_earned, 0) + amount,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    return credit
+
+
+async def spend_credits(db: AsyncSession, user_id: str, amount: int, description: str) -> Optional[int]:
+    # Conditional decrement: the UPDATE row-locks the user, so two concurrent
+    # orders serialize and the second one sees the reduced balance.
+    # Returns the new balance, or None if the balance is insufficient.
+    # A non-positive amount would credit the user, so it is refused.
+    if amount <= 0:
+        raise ValueError(f"Spend amount must be positive, got {amount}")
+    result = await db.execute(
+        update(User)
+        .where(User.id == user_id, func.coalesce(User.credit_points, 0) >= amount)
+        .values(credit_points=func.coalesce(User.credit_points, 0) - amount)
+        .returning(User.credit_points)
+        .execution_options(synchronize_session=False)
+    )
+    balance = result.scalar()
+    if balance is None:
+        return None
+
+    db.add(CreditTransaction(
+        user_id=user_id,
+        amount=-amount,
+        type="spent",
+        description=description
+    ))
+    return balance
+
+
+async def get_balance(db: AsyncSession, user_id: str) -> int:
+    result = await db.execute(select(User.credit_points).filter(User.id == user_id))
+    return result.scalar() or 0
+
+
+async def reconcile_balances(db: AsyncSession) -> dict:
+    # Rebuild every balance from the ledger in one aggregate pass and fix
+    # only the rows that drifted. Blocks new ledger inserts while running
+    # so the snapshot and the update agree.
+    if db.bind.dialect.name == "postgresql":
+        await db.execute(text("LOCK TABLE credit_transactions IN SHARE MODE"))
+
+    totals = (
+        select(
+            CreditTransaction.user_id.label("user_id"),
+            func.coalesce(func.sum(CreditTransaction.amount), 0).label("balance"),
+            func.coalesce(func.sum(case((CreditTransaction.type == "earned", CreditTransaction.amount), else_=0)), 0).label("earned"),
+        )
+        .group_by(CreditTransaction.user_id)
+        .subquery()
+    )
+    corrected = await db.execute(
+        update(User)
+        .where(
+            User.id == totals.c.user_id,
+            or_(
+                func.coalesce(User.credit_points, 0) != totals.c.balance,
+                func.coalesce(User.credits_earned, 0) != totals.c.earned,
+            ),
+        )
+        .values(credit_points=totals.c.balance, credits_earned=totals.c.earned)
+        .execution_options(synchronize_session=False)
+    )
+    # Users with no ledger rows at all
+    zeroed = await db.execute(
+        update(User)
+        .where(
+            ~exists().where(CreditTransaction.user_id == User.id),
+            or_(
+                func.coalesce(User.credit_points, 0) != 0,
+                func.coalesce(User.credits_earned, 0) != 0,
+                User.credit_points.is_(None),
+                User.credits_earned.is_(None),
+            ),
+        )
+        .values(credit_points=0, credits_earned=0)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return {"corrected": corrected.rowcount, "zeroed": zeroed.rowcount}
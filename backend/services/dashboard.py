@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import JSON, Numeric, cast, func, literal_column
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import aliased
+
+from services.carbon import period_start
+from services.leaderboard import leaderboard
+from tables import Activity, CarbonRollup, Notification, User
+
+RECENT_ACTIVITIES = 5
+RECENT_NOTIFICATIONS = 10
+# Days of daily CO2 shown on the dashboard chart
+FOOTPRINT_DAYS = 30
+
+
+def _json_rows(subquery, *order_by):
+    # The subquery's rows as a JSON array ('[]' when empty)
+    return func.coalesce(
+        func.json_agg(aggregate_order_by(subquery.table_valued(), *order_by)),
+        literal_column("'[]'::json"),
+        type_=JSON,
+    )
+
+
+def citizen_rank(credits_earned):
+    # 1 + citizens who have earned more. A scan of users; only used until
+    # the in-memory leaderboard (services.leaderboard) has loaded
+    others = aliased(User)
+    return (
+        select(func.count(others.id) + 1)
+        .where(others.role == "citizen", others.credits_earned > func.coalesce(credits_earned, 0))
+        .scalar_subquery()
+    )
+
+
+def dashboard_query(email: str, now: Optional[datetime] = None, with_rank: bool = True):
+    # Everything on the citizen dashboard in one statement: the user is
+    # resolved once in a CTE and every panel is a correlated subquery on it
+    now = now or datetime.utcnow()
+    user = select(User.id, User.credits_earned).where(User.email == email).cte("dashboard_user")
+
+    co2_saved = select(func.coalesce(func.sum(Activity.impact_co2), 0.0)).where(Activity.user_id == user.c.id).scalar_subquery()
+    waste_collected = (
+        select(func.count(Activity.id))
+        .where(Activity.user_id == user.c.id, Activity.type == "pickup")
+        .scalar_subquery()
+    )
+    activities = (
+        select(Activity.user_id, Activity.type, Activity.description, Activity.date, Activity.impact_co2)
+        .where(Activity.user_id == user.c.id)
+        .order_by(Activity.date.desc())
+        .limit(RECENT_ACTIVITIES)
+        .correlate(user)
+        .subquery("recent_activities")
+    )
+    notifications = (
+        select(Notification.user_id, Notification.title, Notification.message, Notification.type, Notification.read, Notification.date)
+        .where(Notification.user_id == user.c.id)
+        .order_by(Notification.date.desc())
+        .limit(RECENT_NOTIFICATIONS)
+        .correlate(user)
+        .subquery("recent_notifications")
+    )
+    # Daily rollups (services.carbon); FOOTPRINT_DAYS is well inside the
+    # days they keep uncompacted
+    footprint = (
+        select(
+            func.to_char(CarbonRollup.period_start, "YYYY-MM-DD").label("date"),
+            func.round(cast(CarbonRollup.co2, Numeric), 2).label("co2"),
+            CarbonRollup.activities,
+        )
+        .where(
+            CarbonRollup.user_id == user.c.id,
+            CarbonRollup.period == "day",
+            CarbonRollup.period_start >= period_start("day", now - timedelta(days=FOOTPRINT_DAYS)),
+        )
+        .correlate(user)
+        .subquery("daily_footprint")
+    )
+    query = select(
+        user.c.id,
+        user.c.credits_earned,
+        co2_saved.label("co2_saved"),
+        waste_collected.label("waste_collected"),
+        select(_json_rows(activities, activities.c.date.desc())).scalar_subquery().label("activities"),
+        select(_json_rows(notifications, notifications.c.date.desc())).scalar_subquery().label("notifications"),
+        select(_json_rows(footprint, footprint.c.date)).scalar_subquery().label("carbon_footprint"),
+    )
+    if with_rank:
+        query = query.add_columns(citizen_rank(user.c.credits_earned).label("rank"))
+    return query
+
+
+async def load_dashboard(db: AsyncSession, email: str) -> Optional[dict]:
+    with_rank = not leaderboard.ready
+    row = (await db.execute(dashboard_query(email, with_rank=with_rank))).first()
+    if row is None:
+        return None
+    credits = row.credits_earned or 0
+    return {
+        "stats": {
+            "credits": credits,
+            "waste_collected": row.waste_collected,
+            "co2_saved": round(row.co2_saved, 2),
+            "rank": row.rank if with_rank else leaderboard.rank(credits),
+        },
+        "activities": row.activities,
+        "notifications": row.notifications,
+        "carbon_footprint": row.carbon_footprint,
+    }
@@ -0,0 +1,432 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+from prometheus_client import Gauge, Histogram
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from database import AsyncSessionLocal
+from tables import Activity, PickupRequest, WasteReport
+from services.routing import extract_coordinates
+
+logger = logging.getLogger(__name__)
+
+FORECAST_INTERVAL = float(os.getenv("FORECAST_INTERVAL", "900"))
+FORECAST_HISTORY_DAYS = int(os.getenv("FORECAST_HISTORY_DAYS", "365"))
+# Day boundaries and collection hours are computed in local time
+LOCAL_UTC_OFFSET_MINUTES = int(os.getenv("LOCAL_UTC_OFFSET_MINUTES", "0"))
+
+# Areas are square cells of ~550 m at the equator
+AREA_CELL_DEG = 0.005
+HORIZON_DAYS = 7
+OVERFLOW_HORIZON_DAYS = 3
+OVERFLOW_THRESHOLD = 0.5
+MAX_OVERFLOW_AREAS = 10
+MAX_TREND_AREAS = 20
+# Week-over-week change is the slope of the 7-day rolling mean over this many days
+TREND_DAYS = 28
+# Damped Holt smoothing of the deseasonalized daily series
+ALPHA, BETA, PHI = 0.2, 0.05, 0.9
+# Pseudo-events pulling sparse areas towards the city-wide profile/ratio
+SEASONAL_PRIOR = 50.0
+OVERFLOW_PRIOR = 20.0
+# Collection windows are 2 hours and start between 05:00 and 19:00
+WINDOW_HOURS = 2
+SERVICE_HOURS = (5, 21)
+LOAD_BATCH_SIZE = 10000
+# verify_pickup marks pickups 'collected'
+COLLECTED_STATUSES = ("completed", "collected")
+
+KIND_PICKUP, KIND_REPORT, KIND_OVERFLOW, KIND_ACTIVITY, KIND_COLLECTION, KIND_RECYCLED = range(6)
+LOAD_KINDS = (KIND_PICKUP, KIND_REPORT, KIND_OVERFLOW)
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+FORECAST_RUN_SECONDS = Gauge("forecast_run_seconds", "Duration of the last forecast run", ["stage"])
+FORECAST_LAST_SUCCESS = Gauge("forecast_last_success_timestamp", "Unix time of the last successful forecast run")
+FORECAST_EVENTS = Gauge("forecast_events", "Events in the history used by the last forecast run")
+FORECAST_RUNS = Histogram("forecast_run_total_seconds", "Forecast run duration, load plus compute", buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120))
+
+
+class EventHistory:
+    # Column buffers for the events a forecast is computed from. lat/lng
+    # are NaN for events without a location (activities).
+
+    def __init__(self):
+        self.lat: List[float] = []
+        self.lng: List[float] = []
+        self.when: List[datetime] = []
+        self.kind: List[int] = []
+
+    def __len__(self):
+        return len(self.kind)
+
+    def add(self, when: Optional[datetime], kind: int, point=None):
+        if when is None:
+            return
+        self.lat.append(point[0] if point is not None else np.nan)
+        self.lng.append(point[1] if point is not None else np.nan)
+        self.when.append(when)
+        self.kind.append(kind)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            "lat": np.asarray(self.lat, dtype=np.float64),
+            "lng": np.asarray(self.lng, dtype=np.float64),
+            "when": np.asarray(self.when, dtype="datetime64[s]"),
+            "kind": np.asarray(self.kind, dtype=np.int8),
+        }
+
+
+def _row_point(lat, lng, location):
+    if lat is not None and lng is not None:
+        return (lat, lng)
+    # Rows written before the lat/lng columns were backfilled
+    return extract_coordinates(location)
+
+
+async def load_history(db: AsyncSession, since: datetime) -> Dict[str, np.ndarray]:
+    history = EventHistory()
+
+    query = select(
+        PickupRequest.lat, PickupRequest.lng, PickupRequest.location, PickupRequest.request_date,
+        PickupRequest.collected_at, PickupRequest.status, PickupRequest.waste_type,
+    ).filter(PickupRequest.request_date >= since)
+    stream = await db.stream(query.execution_options(yield_per=LOAD_BATCH_SIZE))
+    async for rows in stream.partitions(LOAD_BATCH_SIZE):
+        for lat, lng, location, requested, collected, status, waste_type in rows:
+            point = _row_point(lat, lng, location)
+            history.add(requested, KIND_PICKUP, point)
+            if status in COLLECTED_STATUSES:
+                kind = KIND_RECYCLED if (waste_type or "").lower() == "recyclable" else KIND_COLLECTION
+                history.add(collected or requested, kind, point)
+    await stream.close()
+
+    query = select(
+        WasteReport.lat, WasteReport.lng, WasteReport.location, WasteReport.report_date, WasteReport.report_type,
+    ).filter(WasteReport.report_date >= since)
+    stream = await db.stream(query.execution_options(yield_per=LOAD_BATCH_SIZE))
+    async for rows in stream.partitions(LOAD_BATCH_SIZE):
+        for lat, lng, location, reported, report_type in rows:
+            kind = KIND_OVERFLOW if report_type == "overflow" else KIND_REPORT
+            history.add(reported, kind, _row_point(lat, lng, location))
+    await stream.close()
+
+    stream = await db.stream(select(Activity.date).filter(Activity.date >= since).execution_options(yield_per=LOAD_BATCH_SIZE))
+    async for rows in stream.partitions(LOAD_BATCH_SIZE):
+        for (when,) in rows:
+            history.add(when, KIND_ACTIVITY)
+    await stream.close()
+
+    return history.arrays()
+
+
+def _rolling_mean(series: np.ndarray, window: int) -> np.ndarray:
+    # Trailing mean along the last axis; column i covers days i..i+window-1
+    cumulative = np.cumsum(series, axis=-1, dtype=np.float64)
+    padded = np.concatenate((np.zeros(series.shape[:-1] + (1,)), cumulative), axis=-1)
+    return (padded[..., window:] - padded[..., :-window]) / window
+
+
+def weekly_change(counts: np.ndarray, days: int = TREND_DAYS) -> np.ndarray:
+    # Percent change per week: least-squares slope of the 7-day rolling mean
+    # (which already cancels the weekday pattern) over the last `days` days,
+    # relative to the latest rolling mean. NaN where there is no recent load.
+    rolling = _rolling_mean(counts, 7)[..., -days:]
+    x = np.arange(rolling.shape[-1], dtype=np.float64)
+    x -= x.mean()
+    slope = (rolling * x).sum(axis=-1) / (x ** 2).sum()
+    latest = rolling[..., -1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(latest > 0, 7.0 * slope / latest * 100.0, np.nan)
+
+
+def _seasonal_profile(counts: np.ndarray, weekday: np.ndarray) -> np.ndarray:
+    # Day-of-week index per row (1.0 = average day), shrunk towards the
+    # city-wide profile for rows with few events
+    onehot = np.zeros((counts.shape[1], 7))
+    onehot[np.arange(counts.shape[1]), weekday] = 1.0
+    per_weekday = counts @ onehot / np.maximum(onehot.sum(axis=0), 1.0)
+    mean = per_weekday.mean(axis=1, keepdims=True)
+
+    city = per_weekday.sum(axis=0)
+    city_index = city / city.mean() if city.mean() > 0 else np.ones(7)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        index = np.where(mean > 0, per_weekday / mean, city_index)
+    weight = counts.sum(axis=1, keepdims=True)
+    weight = weight / (weight + SEASONAL_PRIOR)
+    return np.clip(weight * index + (1.0 - weight) * city_index, 0.1, None)
+
+
+def holt_smooth(counts: np.ndarray, weekday: np.ndarray):
+    # Damped-trend exponential smoothing on the deseasonalized series, all
+    # rows at once: one vectorized update per day of history. Returns the
+    # weekday profile and the final level and daily trend per row.
+    season = _seasonal_profile(counts, weekday)
+    # Day-major so each step reads one contiguous row
+    adjusted = np.ascontiguousarray((counts / season[:, weekday]).T)
+    level = adjusted[:14].mean(axis=0)
+    trend = np.zeros(len(counts))
+    for row in adjusted:
+        previous = level
+        level = ALPHA * row + (1.0 - ALPHA) * (previous + PHI * trend)
+        trend = BETA * (level - previous) + (1.0 - BETA) * PHI * trend
+    return season, level, trend
+
+
+def holt_forecast(counts: np.ndarray, weekday: np.ndarray, future_weekday: np.ndarray) -> np.ndarray:
+    season, level, trend = holt_smooth(counts, weekday)
+    damping = np.cumsum(PHI ** np.arange(1, len(future_weekday) + 1))
+    forecast = (level[:, None] + trend[:, None] * damping[None, :]) * season[:, future_weekday]
+    return np.maximum(forecast, 0.0)
+
+
+def _format_hour(hour: int) -> str:
+    hour %= 24
+    return f"{(hour % 12) or 12:02d}:00 {'AM' if hour < 12 else 'PM'}"
+
+
+def _describe_trend(change: Optional[float]) -> str:
+    if change is None:
+        return "Not enough data"
+    if abs(change) < 2.0:
+        return "Stable this week"
+    return f"{'Increasing' if change > 0 else 'Decreasing'} by {abs(change):.0f}% this week"
+
+
+def _grade(percent: float) -> str:
+    if percent >= 80:
+        return "Excellent"
+    if percent >= 60:
+        return "Good"
+    if percent >= 40:
+        return "Fair"
+    return "Poor"
+
+
+def compute_forecast(history: Dict[str, np.ndarray], now: datetime, history_days: int = FORECAST_HISTORY_DAYS) -> dict:
+    # Per-area daily load (pickup requests and reports) over the last
+    # history_days complete local days, forecast HORIZON_DAYS ahead.
+    offset = np.timedelta64(LOCAL_UTC_OFFSET_MINUTES, "m")
+    local = history["when"].astype("datetime64[m]") + offset
+    today = (np.datetime64(now, "m") + offset).astype("datetime64[D]")
+    start = today - np.timedelta64(history_days, "D")
+    day = (local.astype("datetime64[D]") - start).astype(np.int64)
+    in_range = (day >= 0) & (day < history_days)
+    kind = history["kind"]
+    weekday = (np.arange(history_days) + int(start.astype(np.int64)) + 3) % 7  # 1970-01-01 was a Thursday
+    future_weekday = (np.arange(HORIZON_DAYS) + int(today.astype(np.int64)) + 3) % 7
+
+    load = in_range & np.isin(kind, LOAD_KINDS)
+    city_counts = np.bincount(day[load], minlength=history_days).astype(np.float64)
+    city_forecast = holt_forecast(city_counts[None, :], weekday, future_weekday)[0]
+    last_week = float(city_counts[-7:].sum())
+    city_change = float(weekly_change(city_counts))
+    change = None if np.isnan(city_change) else city_change
+
+    # Areas: only cells that generated load in the window
+    located = load & ~np.isnan(history["lat"])
+    cell_y = np.floor(history["lat"][located] / AREA_CELL_DEG).astype(np.int64)
+    cell_x = np.floor(history["lng"][located] / AREA_CELL_DEG).astype(np.int64)
+    areas = []
+    overflow = []
+    if len(cell_y):
+        width = int(cell_x.max() - cell_x.min()) + 1
+        keys = (cell_y - cell_y.min()) * width + (cell_x - cell_x.min())
+        unique, area = np.unique(keys, return_inverse=True)
+        area = area.reshape(-1)
+        n_areas = len(unique)
+        counts = np.bincount(area * history_days + day[located], minlength=n_areas * history_days)
+        counts = counts.reshape(n_areas, history_days).astype(np.float64)
+        totals = counts.sum(axis=1)
+        center_lat = np.bincount(area, weights=history["lat"][located], minlength=n_areas) / totals
+        center_lng = np.bincount(area, weights=history["lng"][located], minlength=n_areas) / totals
+
+        forecast = holt_forecast(counts, weekday, future_weekday)
+        area_change = weekly_change(counts)
+
+        # Overflow rate per unit of load, shrunk towards the city rate; the
+        # chance of at least one overflow report is Poisson in the expected count
+        overflows = np.bincount(area, weights=(kind[located] == KIND_OVERFLOW).astype(np.float64), minlength=n_areas)
+        city_rate = overflows.sum() / totals.sum()
+        rate = (overflows + OVERFLOW_PRIOR * city_rate) / (totals + OVERFLOW_PRIOR)
+        risk = 1.0 - np.exp(-forecast[:, :OVERFLOW_HORIZON_DAYS].sum(axis=1) * rate)
+
+        # Days since the last completed pickup in each area
+        collected = in_range & np.isin(kind, (KIND_COLLECTION, KIND_RECYCLED)) & ~np.isnan(history["lat"])
+        collected_y = np.floor(history["lat"][collected] / AREA_CELL_DEG).astype(np.int64) - cell_y.min()
+        collected_x = np.floor(history["lng"][collected] / AREA_CELL_DEG).astype(np.int64) - cell_x.min()
+        collection_keys = collected_y * width + collected_x
+        position = np.searchsorted(unique, collection_keys)
+        known = (collected_x >= 0) & (collected_x < width) & (position < n_areas)
+        known &= unique[np.minimum(position, n_areas - 1)] == collection_keys
+        last_collection = np.full(n_areas, -1, dtype=np.int64)
+        np.maximum.at(last_collection, position[known], day[collected][known])
+
+        def area_summary(i):
+            return {
+                "lat": round(float(center_lat[i]), 6),
+                "lng": round(float(center_lng[i]), 6),
+                "label": f"Area {center_lat[i]:.3f}, {center_lng[i]:.3f}",
+            }
+
+        for i in np.argsort(-forecast.sum(axis=1))[:MAX_TREND_AREAS].tolist():
+            areas.append({
+                **area_summary(i),
+                "last_7_days": int(counts[i, -7:].sum()),
+                "forecast_7_days": round(float(forecast[i].sum()), 1),
+                "trend_percent": None if np.isnan(area_change[i]) else round(float(area_change[i]), 1),
+                "busiest_weekday": WEEKDAYS[int(future_weekday[forecast[i].argmax()])],
+            })
+        at_risk = np.flatnonzero(risk >= OVERFLOW_THRESHOLD)
+        for i in at_risk[np.argsort(-risk[at_risk])][:MAX_OVERFLOW_AREAS].tolist():
+            overflow.append({
+                **area_summary(i),
+                "probability": round(float(risk[i]), 3),
+                "expected_load": round(float(forecast[i, :OVERFLOW_HORIZON_DAYS].sum()), 1),
+                "days_since_collection": int(history_days - 1 - last_collection[i]) if last_collection[i] >= 0 else None,
+            })
+
+    # Collect when the fewest citizens are generating requests, reports and
+    # activity; hours are local and the window must fit in service hours
+    hour = (local[in_range].astype("datetime64[h]").astype(np.int64) % 24)
+    by_hour = np.bincount(hour, minlength=24).astype(np.float64)
+    window_load = np.array([by_hour[h:h + WINDOW_HOURS].sum() for h in range(SERVICE_HOURS[0], SERVICE_HOURS[1] - WINDOW_HOURS + 1)])
+    best_start = SERVICE_HOURS[0] + int(window_load.argmin())
+
+    recent_days = in_range & (day >= history_days - 30)
+    collections = int(np.isin(kind[recent_days], (KIND_COLLECTION, KIND_RECYCLED)).sum())
+    recycled = int((kind[recent_days] == KIND_RECYCLED).sum())
+    recycling = recycled / collections * 100.0 if collections else None
+
+    return {
+        "waste_generation_trend": _describe_trend(change),
+        "optimal_collection_time": f"{_format_hour(best_start)} - {_format_hour(best_start + WINDOW_HOURS)}",
+        "recycling_efficiency": f"{recycling:.0f}% ({_grade(recycling)})" if recycling is not None else "No collections yet",
+        "predicted_overflow": [entry["label"] for entry in overflow],
+        "details": {
+            "trend": {
+                "change_percent": None if change is None else round(change, 1),
+                "last_7_days": int(last_week),
+                "forecast": [round(float(value), 1) for value in city_forecast],
+                "rolling_7_day_mean": round(float(_rolling_mean(city_counts[None, :], 7)[0, -1]), 2),
+            },
+            "collection_window": {"start_hour": best_start, "end_hour": best_start + WINDOW_HOURS, "activity_by_hour": by_hour.astype(int).tolist()},
+            "recycling_percent": None if recycling is None else round(recycling, 1),
+            "areas": areas,
+            "overflow": overflow,
+        },
+        "history_days": history_days,
+        "events": int(in_range.sum()),
+    }
+
+
+class ForecastService:
+    # Recomputes the insights every FORECAST_INTERVAL seconds in the
+    # background and serves the last result. Without the background run
+    # (serverless) a read recomputes once the result is that old. Loading
+    # streams from the database; the numpy work runs in a worker thread.
+
+    def __init__(self, interval: float = FORECAST_INTERVAL, history_days: int = FORECAST_HISTORY_DAYS):
+        self.interval = interval
+        self.history_days = history_days
+        self.result: Optional[dict] = None
+        self.computed_at: Optional[datetime] = None
+        self.load_seconds: Optional[float] = None
+        self.compute_seconds: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        if not self.running:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def age(self) -> Optional[float]:
+        if self.computed_at is None:
+            return None
+        return (datetime.utcnow() - self.computed_at).total_seconds()
+
+    async def refresh(self, db: Optional[AsyncSession] = None, max_age: Optional[float] = None):
+        # With max_age, skip if a result that fresh exists by the time the
+        # lock is ours (another request refreshed while we waited)
+        async with self._lock:
+            age = self.age()
+            if max_age is not None and age is not None and age < max_age:
+                return
+            now = datetime.utcnow()
+            started = time.perf_counter()
+            since = now - timedelta(days=self.history_days + 1)
+            if db is None:
+                async with AsyncSessionLocal() as session:
+                    history = await load_history(session, since)
+            else:
+                history = await load_history(db, since)
+            loaded = time.perf_counter()
+            result = await asyncio.to_thread(compute_forecast, history, now, self.history_days)
+            finished = time.perf_counter()
+
+            self.result = result
+            self.computed_at = now
+            self.load_seconds = loaded - started
+            self.compute_seconds = finished - loaded
+            self.last_error = None
+            FORECAST_RUN_SECONDS.labels(stage="load").set(self.load_seconds)
+            FORECAST_RUN_SECONDS.labels(stage="compute").set(self.compute_seconds)
+            FORECAST_RUNS.observe(finished - started)
+            FORECAST_EVENTS.set(result["events"])
+            FORECAST_LAST_SUCCESS.set(time.time())
+
+    async def insights(self, db: Optional[AsyncSession] = None) -> dict:
+        # Give a running background task a full interval of slack before
+        # doing its work on the request path
+        max_age = self.interval * 2 if self.running else self.interval
+        if self.result is None:
+            # First request before the scheduled run (or no scheduler, e.g. serverless)
+            await self.refresh(db, max_age)
+        elif self.age() >= max_age:
+            try:
+                await self.refresh(db, max_age)
+            except Exception as error:
+                # Serve the stale result; last_error says why
+                self.last_error = repr(error)
+                logger.exception("Forecast refresh on read failed")
+        return {
+            **self.result,
+            "computed_at": self.computed_at.isoformat(),
+            "staleness_seconds": round((datetime.utcnow() - self.computed_at).total_seconds(), 1),
+            "run_seconds": {"load": round(self.load_seconds, 3), "compute": round(self.compute_seconds, 3)},
+            "refresh_interval_seconds": self.interval,
+            "last_error": self.last_error,
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                self.last_error = repr(error)
+                logger.exception("Forecast run failed")
+            await asyncio.sleep(self.interval)
+
+
+forecast_service = ForecastService()
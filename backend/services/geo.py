@@ -0,0 +1,134 @@
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, func, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from tables import PickupRequest, WasteReport
+from services.routing import EARTH_RADIUS_KM, extract_coordinates
+
+# Tables whose location JSON is mirrored into indexed lat/lng columns
+GEO_MODELS = {"pickups": PickupRequest, "reports": WasteReport}
+KM_PER_DEG_LAT = 111.32
+BACKFILL_BATCH_SIZE = 1000
+MAX_RADIUS_KM = 50.0
+
+BBox = Tuple[float, float, float, float]  # min_lat, min_lng, max_lat, max_lng
+
+_postgis_available: Optional[bool] = None
+
+
+def coordinate_columns(location) -> Dict[str, Optional[float]]:
+    # Keyword args for the lat/lng columns, e.g. PickupRequest(**coordinate_columns(loc))
+    point = extract_coordinates(location)
+    if point is None:
+        return {"lat": None, "lng": None}
+    return {"lat": point[0], "lng": point[1]}
+
+
+def radius_bbox(lat: float, lng: float, radius_km: float) -> BBox:
+    # Smallest lat/lng box containing the circle; this is what the btree
+    # index on (lat, lng) can use before the exact distance check
+    dlat = radius_km / KM_PER_DEG_LAT
+    cos_lat = math.cos(math.radians(min(89.9, abs(lat))))
+    dlng = min(180.0, radius_km / (KM_PER_DEG_LAT * cos_lat))
+    return (max(-90.0, lat - dlat), max(-180.0, lng - dlng), min(90.0, lat + dlat), min(180.0, lng + dlng))
+
+
+def bbox_condition(model, bbox: BBox):
+    min_lat, min_lng, max_lat, max_lng = bbox
+    return and_(model.lat.between(min_lat, max_lat), model.lng.between(min_lng, max_lng))
+
+
+def distance_km_expression(model, lat: float, lng: float):
+    # Haversine in SQL, so filtering and ordering by distance stay in the database
+    dlat = func.radians(model.lat - lat)
+    dlng = func.radians(model.lng - lng)
+    h = func.power(func.sin(dlat / 2), 2) + math.cos(math.radians(lat)) * func.cos(func.radians(model.lat)) * func.power(func.sin(dlng / 2), 2)
+    return 2 * EARTH_RADIUS_KM * func.asin(func.sqrt(func.least(1.0, h)))
+
+
+def _geography(lat_column, lng_column):
+    return func.ST_SetSRID(func.ST_MakePoint(lng_column, lat_column), 4326).cast(text("geography"))
+
+
+async def has_postgis(db: AsyncSession) -> bool:
+    global _postgis_available
+    if _postgis_available is None:
+        if db.bind.dialect.name != "postgresql":
+            _postgis_available = False
+        else:
+            result = await db.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'postgis'"))
+            _postgis_available = result.first() is not None
+    return _postgis_available
+
+
+async def find_within(
+    db: AsyncSession,
+    model,
+    bbox: Optional[BBox] = None,
+    center: Optional[Tuple[float, float]] = None,
+    radius_km: Optional[float] = None,
+    filters: Sequence = (),
+    limit: int = 500,
+) -> List[Tuple[object, Optional[float]]]:
+    # Rows inside a bbox, or within radius_km of center ordered by distance.
+    # Returns (row, distance_km) pairs; distance is None for bbox queries.
+    query = select(model).filter(model.lat.isnot(None), *filters)
+    if center is not None:
+        lat, lng = center
+        if await has_postgis(db):
+            # GiST index on the geography expression (migrations/0005_indexes.py)
+            point = _geography(lat, lng)
+            location = _geography(model.lat, model.lng)
+            distance = func.ST_Distance(location, point) / 1000.0
+            query = query.filter(func.ST_DWithin(location, point, radius_km * 1000.0))
+        else:
+            distance = distance_km_expression(model, lat, lng)
+            query = query.filter(bbox_condition(model, radius_bbox(lat, lng, radius_km)), distance <= radius_km)
+        query = query.add_columns(distance.label("distance_km")).order_by("distance_km")
+    elif bbox is not None:
+        query = query.filter(bbox_condition(model, bbox))
+    else:
+        raise ValueError("Either bbox or center and radius_km is required")
+
+    result = await db.execute(query.limit(limit))
+    if center is not None:
+        return [(row, float(distance)) for row, distance in result.all()]
+    return [(row, None) for row in result.scalars().all()]
+
+
+async def backfill_locations(db: AsyncSession, batch_size: int = BACKFILL_BATCH_SIZE) -> dict:
+    # Copy lat/lng out of the location JSON for rows written before the
+    # columns existed (run by migrations/0004_backfill.py). Keyset batches by id, one commit per batch, so it can
+    # run against a live database and be resumed after an interruption.
+    summary = {}
+    for name, model in GEO_MODELS.items():
+        updated = unparseable = 0
+        last_id = ""
+        while True:
+            result = await db.execute(
+                select(model.id, model.location)
+                .filter(model.id > last_id, model.lat.is_(None), model.location.isnot(None))
+                .order_by(model.id)
+                .limit(batch_size)
+            )
+            rows = result.all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            values = []
+            for row_id, location in rows:
+                columns = coordinate_columns(location)
+                if columns["lat"] is None:
+                    unparseable += 1
+                else:
+                    values.append({"id": row_id, **columns})
+            if values:
+                await db.execute(update(model), values)
+                updated += len(values)
+            await db.commit()
+        summary[name] = {"updated": updated, "unparseable": unparseable}
+    return summary
@@ -0,0 +1,338 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from database import AsyncSessionLocal
+from tables import PickupRequest, WasteReport
+
+logger = logging.getLogger(__name__)
+
+# Base grid: cells of a zoom-14 web map tile split 64 ways (~38 m at the
+# equator). Coarser zoom levels merge 2^(14 - zoom) base cells per side.
+BASE_ZOOM = 14
+CELLS_PER_TILE = 64
+BASE_CELL_DEG = 360.0 / (2 ** BASE_ZOOM) / CELLS_PER_TILE
+
+WINDOWS = {"24h": 1, "7d": 7, "30d": 30, "90d": 90, "365d": 365, "all": None}
+KERNEL_SIGMA = 1.5  # in cells of the requested zoom
+KERNEL_RADIUS = 4
+MAX_RASTER_SIDE = 1024
+REFRESH_INTERVAL = 5.0
+# Rows committed slightly out of timestamp order are still picked up
+REFRESH_OVERLAP = timedelta(seconds=30)
+LOAD_BATCH_SIZE = 10000
+
+
+def _gaussian_kernel(sigma: float, radius: int) -> np.ndarray:
+    offsets = np.arange(-radius, radius + 1, dtype=np.float64)
+    kernel = np.exp(-0.5 * (offsets / sigma) ** 2)
+    return (kernel / kernel.sum()).astype(np.float32)
+
+
+KERNEL = _gaussian_kernel(KERNEL_SIGMA, KERNEL_RADIUS)
+
+
+def gaussian_blur(grid: np.ndarray, kernel: np.ndarray = KERNEL) -> np.ndarray:
+    # Separable convolution as a handful of shifted, weighted adds per axis
+    radius = len(kernel) // 2
+    rows = np.zeros_like(grid)
+    for k, weight in enumerate(kernel):
+        shift = k - radius
+        if shift < 0:
+            rows[:, :shift] += weight * grid[:, -shift:]
+        elif shift > 0:
+            rows[:, shift:] += weight * grid[:, :-shift]
+        else:
+            rows += weight * grid
+    out = np.zeros_like(grid)
+    for k, weight in enumerate(kernel):
+        shift = k - radius
+        if shift < 0:
+            out[:shift, :] += weight * rows[-shift:, :]
+        elif shift > 0:
+            out[shift:, :] += weight * rows[:-shift, :]
+        else:
+            out += weight * rows
+    return out
+
+
+def zoom_factor(zoom: int) -> int:
+    return 2 ** max(0, BASE_ZOOM - zoom)
+
+
+class _Aggregate:
+    # Sparse per-cell counts for one (window, category, zoom). Entries may
+    # repeat a cell; rasterizing sums them, and compact() merges them.
+    __slots__ = ("ys", "xs", "counts", "as_of_day", "compacted_size")
+
+    def __init__(self, ys, xs, counts, as_of_day):
+        self.ys, self.xs, self.counts = ys, xs, counts
+        self.as_of_day = as_of_day
+        self.compacted_size = 0
+
+    def extend(self, ys, xs):
+        self.ys = np.concatenate((self.ys, ys))
+        self.xs = np.concatenate((self.xs, xs))
+        self.counts = np.concatenate((self.counts, np.ones(len(ys), dtype=np.float32)))
+
+    def compact(self):
+        if len(self.ys) == 0:
+            return
+        # Pack (y, x) into one int64 key; far cheaper than a row-wise unique
+        y_min, x_min = self.ys.min(), self.xs.min()
+        width = int(self.xs.max() - x_min) + 1
+        keys = (self.ys - y_min) * width + (self.xs - x_min)
+        unique, inverse = np.unique(keys, return_inverse=True)
+        self.counts = np.bincount(inverse.reshape(-1), weights=self.counts).astype(np.float32)
+        self.ys, self.xs = unique // width + y_min, unique % width + x_min
+        self.compacted_size = len(self.ys)
+
+
+class HotspotIndex:
+    # Columnar store of located reports/pickups bucketed into the base
+    # grid, plus cached sparse aggregates per (window, category, zoom).
+    # New rows are folded into the cached aggregates instead of rebuilding.
+
+    def __init__(self):
+        self.ys = np.empty(0, dtype=np.int64)
+        self.xs = np.empty(0, dtype=np.int64)
+        self.days = np.empty(0, dtype=np.int32)
+        self.categories = np.empty(0, dtype=np.int16)
+        self.category_codes: Dict[str, int] = {}
+        self._aggregates: Dict[Tuple[Optional[int], Optional[int], int], _Aggregate] = {}
+        self._pending: List[tuple] = []
+        # Refresh bookkeeping, per source table
+        self._watermarks: Dict[str, Optional[datetime]] = {"reports": None, "pickups": None}
+        self._recent_ids: Dict[str, Dict[str, datetime]] = {"reports": {}, "pickups": {}}
+        self._last_refresh = 0.0
+        self._lock = asyncio.Lock()
+
+    def __len__(self):
+        return len(self.ys) + sum(len(chunk[0]) for chunk in self._pending)
+
+    def category_code(self, name: str) -> int:
+        name = (name or "unknown").lower()
+        if name not in self.category_codes:
+            self.category_codes[name] = len(self.category_codes)
+        return self.category_codes[name]
+
+    def add_points(self, points: List[Tuple[float, float, datetime, str]]):
+        # points: (lat, lng, when, category)
+        if not points:
+            return
+        lat = np.fromiter((p[0] for p in points), dtype=np.float64, count=len(points))
+        lng = np.fromiter((p[1] for p in points), dtype=np.float64, count=len(points))
+        days = np.fromiter(((p[2] or datetime.utcnow()).toordinal() for p in points), dtype=np.int32, count=len(points))
+        categories = np.fromiter((self.category_code(p[3]) for p in points), dtype=np.int16, count=len(points))
+        ys = np.floor(lat / BASE_CELL_DEG).astype(np.int64)
+        xs = np.floor(lng / BASE_CELL_DEG).astype(np.int64)
+        self._pending.append((ys, xs, days, categories))
+
+        for (window, category, zoom), aggregate in self._aggregates.items():
+            mask = self._mask(days, categories, window, category, aggregate.as_of_day)
+            factor = zoom_factor(zoom)
+            aggregate.extend(np.floor_divide(ys[mask], factor), np.floor_divide(xs[mask], factor))
+            if len(aggregate.ys) > 2 * aggregate.compacted_size + 10000:
+                aggregate.compact()
+
+    def _flush_pending(self):
+        if not self._pending:
+            return
+        ys, xs, days, categories = zip(*self._pending)
+        self.ys = np.concatenate((self.ys,) + ys)
+        self.xs = np.concatenate((self.xs,) + xs)
+        self.days = np.concatenate((self.days,) + days)
+        self.categories = np.concatenate((self.categories,) + categories)
+        self._pending = []
+
+    @staticmethod
+    def _mask(days, categories, window, category, as_of_day):
+        mask = np.ones(len(days), dtype=bool)
+        if window is not None:
+            mask &= days > as_of_day - window
+        if category is not None:
+            mask &= categories == category
+        return mask
+
+    def aggregate(self, window: Optional[int], category: Optional[int], zoom: int) -> _Aggregate:
+        today = datetime.utcnow().toordinal()
+        key = (window, category, zoom)
+        cached = self._aggregates.get(key)
+        if cached is not None and (window is None or cached.as_of_day == today):
+            return cached
+
+        self._flush_pending()
+        mask = self._mask(self.days, self.categories, window, category, today)
+        factor = zoom_factor(zoom)
+        aggregate = _Aggregate(
+            np.floor_divide(self.ys[mask], factor),
+            np.floor_divide(self.xs[mask], factor),
+            np.ones(int(mask.sum()), dtype=np.float32),
+            today,
+        )
+        aggregate.compact()
+        self._aggregates[key] = aggregate
+        return aggregate
+
+    def query(
+        self,
+        bbox: Optional[Tuple[float, float, float, float]] = None,
+        zoom: int = 13,
+        window: str = "30d",
+        waste_type: str = "all",
+        limit: int = 200,
+    ) -> List[dict]:
+        if window not in WINDOWS:
+            raise ValueError(f"Unknown window '{window}', expected one of {list(WINDOWS)}")
+        if waste_type in (None, "", "all"):
+            category = None
+        else:
+            category = self.category_codes.get(waste_type.lower())
+            if category is None:
+                return []
+
+        aggregate = self.aggregate(WINDOWS[window], category, zoom)
+        if len(aggregate.ys) == 0:
+            return []
+        cell = BASE_CELL_DEG * zoom_factor(zoom)
+
+        if bbox is None:
+            y0, y1 = int(aggregate.ys.min()), int(aggregate.ys.max())
+            x0, x1 = int(aggregate.xs.min()), int(aggregate.xs.max())
+        else:
+            min_lat, min_lng, max_lat, max_lng = bbox
+            y0, y1 = int(np.floor(min_lat / cell)), int(np.floor(max_lat / cell))
+            x0, x1 = int(np.floor(min_lng / cell)), int(np.floor(max_lng / cell))
+
+        # Visible cells plus a kernel-radius margin so edges blur correctly;
+        # very large views are coarsened to keep the raster bounded
+        step = max(1, int(np.ceil(max(y1 - y0 + 1, x1 - x0 + 1) / MAX_RASTER_SIDE)))
+        pad = KERNEL_RADIUS * step
+        ry0, rx0 = y0 - pad, x0 - pad
+        height = (y1 + pad - ry0) // step + 1
+        width = (x1 + pad - rx0) // step + 1
+
+        inside = (aggregate.ys >= ry0) & (aggregate.ys < ry0 + height * step) & (aggregate.xs >= rx0) & (aggregate.xs < rx0 + width * step)
+        if not inside.any():
+            return []
+        gy = (aggregate.ys[inside] - ry0) // step
+        gx = (aggregate.xs[inside] - rx0) // step
+        grid = np.bincount(gy * width + gx, weights=aggregate.counts[inside], minlength=height * width)
+        density = gaussian_blur(grid.reshape(height, width).astype(np.float32))
+
+        # Only report cells in the visible box
+        margin = KERNEL_RADIUS
+        visible = density[margin:height - margin, margin:width - margin]
+        flat = visible.reshape(-1)
+        candidates = np.flatnonzero(flat > 1e-3)
+        if len(candidates) == 0:
+            return []
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-flat[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-flat[candidates])]
+        peak = float(flat[candidates[0]])
+
+        vy, vx = np.divmod(candidates, visible.shape[1])
+        cell_size = cell * step
+        lats = (ry0 * cell) + (vy + margin + 0.5) * cell_size
+        lngs = (rx0 * cell) + (vx + margin + 0.5) * cell_size
+        intensity = np.clip(np.ceil(flat[candidates] / peak * 10), 1, 10).astype(int)
+        return [
+            {"lat": round(float(lat), 6), "lng": round(float(lng), 6), "intensity": int(level), "density": round(float(value), 3)}
+            for lat, lng, level, value in zip(lats.tolist(), lngs.tolist(), intensity.tolist(), flat[candidates].tolist())
+        ]
+
+    async def refresh(self, db: AsyncSession, force: bool = False):
+        # Pull rows added since the last refresh (from any worker) and fold
+        # them into the index; throttled to once per REFRESH_INTERVAL
+        if not force and time.monotonic() - self._last_refresh < REFRESH_INTERVAL:
+            return
+        async with self._lock:
+            if not force and time.monotonic() - self._last_refresh < REFRESH_INTERVAL:
+                return
+            await self._load(db, "reports", WasteReport, WasteReport.report_date, WasteReport.report_type)
+            await self._load(db, "pickups", PickupRequest, PickupRequest.request_date, PickupRequest.waste_type)
+            self._last_refresh = time.monotonic()
+
+    async def _load(self, db: AsyncSession, source: str, model, date_column, category_column):
+        watermark = self._watermarks[source]
+        recent = self._recent_ids[source]
+        # lat/lng are the indexed copies of location (services.geo); rows
+        # without coordinates never make it into the index
+        query = (
+            select(model.id, model.lat, model.lng, date_column, category_column)
+            .filter(model.lat.isnot(None), model.lng.isnot(None))
+            .order_by(date_column)
+        )
+        if watermark is not None:
+            query = query.filter(date_column > watermark - REFRESH_OVERLAP)
+
+        stream = await db.stream(query.execution_options(yield_per=LOAD_BATCH_SIZE))
+        async for rows in stream.partitions(LOAD_BATCH_SIZE):
+            points = []
+            for row_id, lat, lng, when, category in rows:
+                if row_id in recent:
+                    continue
+                if when is not None:
+                    recent[row_id] = when
+                    if watermark is None or when > watermark:
+                        watermark = when
+                points.append((lat, lng, when, category))
+            self.add_points(points)
+        await stream.close()
+
+        self._watermarks[source] = watermark
+        if watermark is not None:
+            cutoff = watermark - REFRESH_OVERLAP
+            self._recent_ids[source] = {row_id: when for row_id, when in recent.items() if when > cutoff}
+
+
+hotspot_index = HotspotIndex()
+
+
+class HotspotRefresher:
+    # Loads the index when the worker starts and folds in new rows every
+    # REFRESH_INTERVAL seconds, so requests never wait on the database.
+    # Without it (e.g. on Vercel) the route refreshes inline.
+
+    def __init__(self, index: HotspotIndex = hotspot_index, interval: float = REFRESH_INTERVAL):
+        self.index = index
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        if not self.running:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _run(self):
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    await self.index.refresh(db, force=True)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Hotspot index refresh failed")
+            await asyncio.sleep(self.interval)
+
+
+hotspot_refresher = HotspotRefresher()
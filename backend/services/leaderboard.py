@@ -0,0 +1,336 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from prometheus_client import Gauge
+from sqlalchemy import event, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session
+
+from database import AsyncSessionLocal
+from tables import CreditTransaction, User
+
+logger = logging.getLogger(__name__)
+
+# Full rebuild from the ledger; corrects drift from writes that bypass the
+# ORM or awards lost between workers
+LEADERBOARD_REBUILD_INTERVAL = float(os.getenv("LEADERBOARD_REBUILD_INTERVAL", "3600"))
+LEADERBOARD_WINDOW = 5
+
+LEADERBOARD_REBUILD_SECONDS = Gauge("leaderboard_rebuild_seconds", "Duration of the last leaderboard rebuild")
+LEADERBOARD_MEMORY_BYTES = Gauge("leaderboard_memory_bytes", "Approximate memory held by the leaderboard index")
+LEADERBOARD_CITIZENS = Gauge("leaderboard_citizens", "Citizens with earned credits in the leaderboard index")
+
+Award = Tuple[str, int]  # (user_id, credits earned)
+LedgerAward = Tuple[str, str, int]  # (transaction id, user_id, credits earned)
+
+# Slot in the low 32 bits of a key, credits above it
+SLOT_BITS = 32
+FRONT_SPARE = 1024
+# Above this many users changed in one batch, rewrite the array instead
+MERGE_BATCH = 16
+
+
+class CreditIndex:
+    # Citizens ordered by lifetime earned credits. Every member is one int64
+    # key, credits << 32 | slot, in a sorted array: rank is a binary search
+    # and top-N and windows are slices. An award moves one key, shifting
+    # only the keys between its old and new place; newcomers enter near the
+    # bottom, into spare room kept in front of the array. Slots map back to
+    # user ids. Citizens with no earned credits are left out; they share
+    # the last rank.
+
+    def __init__(self):
+        self._buffer = np.empty(FRONT_SPARE, dtype=np.int64)
+        self._start = FRONT_SPARE  # keys are _buffer[_start:]
+        self.credits = np.zeros(0, dtype=np.int64)  # by slot
+        self.user_ids: List[str] = []
+        self.slots: Dict[str, int] = {}
+
+    @classmethod
+    def build(cls, user_ids: List[str], credits: Iterable[int]) -> "CreditIndex":
+        index = cls()
+        index.user_ids = list(user_ids)
+        index.slots = {user_id: slot for slot, user_id in enumerate(index.user_ids)}
+        index.credits = np.maximum(np.fromiter(credits, dtype=np.int64, count=len(index.user_ids)), 0)
+        members = np.flatnonzero(index.credits > 0)
+        spare = max(len(members) // 8, FRONT_SPARE)
+        index._buffer = np.empty(spare + len(members), dtype=np.int64)
+        index._buffer[spare:] = np.sort((index.credits[members] << SLOT_BITS) | members)
+        index._start = spare
+        return index
+
+    @property
+    def keys(self) -> np.ndarray:
+        return self._buffer[self._start:]
+
+    def __len__(self) -> int:
+        return len(self._buffer) - self._start
+
+    def _slot(self, user_id: str) -> int:
+        slot = self.slots.get(user_id)
+        if slot is None:
+            slot = len(self.user_ids)
+            self.user_ids.append(user_id)
+            self.slots[user_id] = slot
+            if slot >= len(self.credits):
+                self.credits = np.concatenate((self.credits, np.zeros(max(len(self.credits), 1024), dtype=np.int64)))
+        return slot
+
+    def _insert(self, key: int):
+        if self._start == 0:
+            spare = max(len(self) // 8, FRONT_SPARE)
+            self._buffer = np.concatenate((np.empty(spare, dtype=np.int64), self._buffer))
+            self._start = spare
+        keys = self.keys
+        position = int(np.searchsorted(keys, key))
+        self._start -= 1
+        start = self._start
+        self._buffer[start:start + position] = self._buffer[start + 1:start + 1 + position]
+        self._buffer[start + position] = key
+
+    def _remove(self, key: int):
+        position = int(np.searchsorted(self.keys, key))
+        start = self._start
+        self._buffer[start + 1:start + position + 1] = self._buffer[start:start + position]
+        self._start += 1
+
+    def _move(self, old: int, new: int):
+        keys = self.keys
+        i = int(np.searchsorted(keys, old))
+        j = int(np.searchsorted(keys, new))
+        if new > old:
+            keys[i:j - 1] = keys[i + 1:j]
+            keys[j - 1] = new
+        else:
+            keys[j + 1:i + 1] = keys[j:i]
+            keys[j] = new
+
+    def _merge(self, changes: Dict[int, int]):
+        # Big batches: one delete and one insert pass over the whole array
+        slots = np.fromiter(changes, dtype=np.int64, count=len(changes))
+        old = self.credits[slots]
+        new = np.maximum(old + np.fromiter(changes.values(), dtype=np.int64, count=len(changes)), 0)
+        self.credits[slots] = new
+        keys = self.keys
+        stale = (old[old > 0] << SLOT_BITS) | slots[old > 0]
+        keys = np.delete(keys, np.searchsorted(keys, stale))
+        fresh = np.sort((new[new > 0] << SLOT_BITS) | slots[new > 0])
+        keys = np.insert(keys, np.searchsorted(keys, fresh), fresh)
+        spare = max(len(keys) // 8, FRONT_SPARE)
+        self._buffer = np.concatenate((np.empty(spare, dtype=np.int64), keys))
+        self._start = spare
+
+    def apply(self, awards: Iterable[Award]):
+        # Fold the batch into one change per user, then move keys one by
+        # one, or merge when the batch is big enough for a full pass to win
+        changes: Dict[int, int] = {}
+        for user_id, amount in awards:
+            slot = self._slot(user_id)
+            changes[slot] = changes.get(slot, 0) + amount
+        if len(changes) > MERGE_BATCH:
+            self._merge(changes)
+            return
+        for slot, amount in changes.items():
+            old = int(self.credits[slot])
+            new = max(old + amount, 0)
+            if new == old:
+                continue
+            self.credits[slot] = new
+            if old == 0:
+                self._insert(new << SLOT_BITS | slot)
+            elif new == 0:
+                self._remove(old << SLOT_BITS | slot)
+            else:
+                self._move(old << SLOT_BITS | slot, new << SLOT_BITS | slot)
+
+    def rank_of(self, credits) -> np.ndarray:
+        # 1 + members with more credits (ties share a rank); vectorized
+        above = np.searchsorted(self.keys, (np.maximum(np.asarray(credits, dtype=np.int64), 0) + 1) << SLOT_BITS)
+        return len(self.keys) - above + 1
+
+    def credits_of(self, user_id: str) -> int:
+        slot = self.slots.get(user_id)
+        return int(self.credits[slot]) if slot is not None else 0
+
+    def rank(self, user_id: str) -> int:
+        return int(self.rank_of(self.credits_of(user_id)))
+
+    def _entries(self, keys: np.ndarray) -> List[dict]:
+        credits = keys >> SLOT_BITS
+        ranks = self.rank_of(credits)
+        return [
+            {"rank": int(rank), "id": self.user_ids[slot], "points": int(points)}
+            for rank, slot, points in zip(ranks, keys & ((1 << SLOT_BITS) - 1), credits)
+        ]
+
+    def top(self, n: int) -> List[dict]:
+        return self._entries(self.keys[::-1][:n])
+
+    def around(self, user_id: str, window: int = LEADERBOARD_WINDOW) -> List[dict]:
+        # Up to `window` members either side of the user, best first
+        slot = self.slots.get(user_id)
+        if slot is None or self.credits[slot] <= 0:
+            # Not a member: below everyone, so just the lowest members
+            low, high = 0, window
+        else:
+            position = int(np.searchsorted(self.keys, (self.credits[slot] << SLOT_BITS) | slot))
+            low, high = max(position - window, 0), position + window + 1
+        return self._entries(self.keys[low:high][::-1])
+
+    def memory_bytes(self) -> int:
+        # Arrays exactly; ids and the dict estimated from one id
+        per_id = sys.getsizeof(self.user_ids[0]) if self.user_ids else 0
+        return (
+            self._buffer.nbytes + self.credits.nbytes + sys.getsizeof(self.user_ids)
+            + sys.getsizeof(self.slots) + per_id * len(self.user_ids)
+        )
+
+
+async def load_index(pending: Optional[Dict[str, Award]] = None) -> CreditIndex:
+    # Earned credits per citizen straight from the ledger, read in one
+    # REPEATABLE READ snapshot. Awards in `pending` (by transaction id)
+    # that the snapshot already counts are dropped from it; whatever is
+    # left committed after the snapshot and still has to be applied.
+    query = (
+        select(User.id, func.coalesce(func.sum(CreditTransaction.amount), 0))
+        .join(CreditTransaction, CreditTransaction.user_id == User.id)
+        .where(User.role == "citizen", CreditTransaction.type == "earned")
+        .group_by(User.id)
+    )
+    user_ids: List[str] = []
+    credits: List[int] = []
+    async with AsyncSessionLocal() as db:
+        await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        result = await db.stream(query.execution_options(yield_per=10000))
+        async for rows in result.partitions():
+            for user_id, total in rows:
+                user_ids.append(user_id)
+                credits.append(total)
+        # Awards keep arriving while we check, so check until none are new
+        checked = set()
+        while pending:
+            ids = [transaction_id for transaction_id in pending if transaction_id not in checked]
+            if not ids:
+                break
+            checked.update(ids)
+            result = await db.execute(select(CreditTransaction.id).where(CreditTransaction.id.in_(ids)))
+            for transaction_id in result.scalars():
+                pending.pop(transaction_id, None)
+    return CreditIndex.build(user_ids, credits)
+
+
+class Leaderboard:
+    # The worker's CreditIndex, rebuilt at startup and every
+    # LEADERBOARD_REBUILD_INTERVAL seconds. Awards (which only go to
+    # citizens) are picked up when their transaction commits and, once
+    # publish is set (the realtime pub/sub), reach every worker's index
+    # through apply_message.
+
+    def __init__(self, interval: float = LEADERBOARD_REBUILD_INTERVAL):
+        self.interval = interval
+        self.index = CreditIndex()
+        self.ready = False
+        self.publish: Optional[Callable[[str], None]] = None
+        self.task: Optional[asyncio.Task] = None
+        self._pending: Optional[Dict[str, Award]] = None  # awards seen while rebuilding
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        if not self.running:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def rebuild(self):
+        started = time.perf_counter()
+        self._pending = {}
+        try:
+            # Only the awards the snapshot missed are replayed, so none is
+            # counted twice
+            index = await load_index(self._pending)
+            index.apply(self._pending.values())
+        finally:
+            self._pending = None
+        self.index = index
+        self.ready = True
+        LEADERBOARD_REBUILD_SECONDS.set(time.perf_counter() - started)
+        LEADERBOARD_MEMORY_BYTES.set(index.memory_bytes())
+
+    async def _run(self):
+        while True:
+            try:
+                await self.rebuild()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Leaderboard rebuild failed")
+            await asyncio.sleep(self.interval)
+
+    def record(self, awards: List[LedgerAward]):
+        # Committed awards from this worker
+        if self.publish is not None:
+            self.publish(json.dumps(awards))
+        else:
+            self.apply(awards)
+
+    def apply_message(self, message: str):
+        self.apply([(transaction_id, user_id, int(amount)) for transaction_id, user_id, amount in json.loads(message)])
+
+    def apply(self, awards: List[LedgerAward]):
+        if self._pending is not None:
+            self._pending.update((transaction_id, (user_id, amount)) for transaction_id, user_id, amount in awards)
+        self.index.apply((user_id, amount) for _, user_id, amount in awards)
+
+    def rank(self, credits: int) -> int:
+        # Rank for a citizen's credits as read from their user row
+        return int(self.index.rank_of(credits))
+
+
+leaderboard = Leaderboard()
+LEADERBOARD_CITIZENS.set_function(lambda: len(leaderboard.index))
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_awards(session, flush_context):
+    awards = [
+        (row.id, row.user_id, row.amount) for row in session.new
+        if isinstance(row, CreditTransaction) and row.type == "earned" and row.amount
+    ]
+    if awards:
+        session.info.setdefault("leaderboard_awards", []).extend(awards)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_awards(session):
+    awards = session.info.pop("leaderboard_awards", None)
+    if awards:
+        leaderboard.record(awards)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_awards(session, previous_transaction):
+    session.info.pop("leaderboard_awards", None)
+
+
+async def with_names(db: AsyncSession, entries: List[dict]) -> List[dict]:
+    # Display names for index entries, one primary-key lookup
+    result = await db.execute(select(User.id, User.name).where(User.id.in_([entry["id"] for entry in entries])))
+    names = dict(result.all())
+    return [{**entry, "name": names.get(entry["id"]) or "Eco Warrior"} for entry in entries]
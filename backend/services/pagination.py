@@ -0,0 +1,87 @@
+import base64
+import csv
+import io
+import json
+import os
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+
+# Rows fetched per round trip while streaming an export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_FORMATS = ("ndjson", "csv")
+
+Cursor = Tuple[datetime, str]
+
+
+def encode_cursor(sort_value: datetime, row_id: str) -> str:
+    raw = json.dumps([sort_value.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw)
+        return datetime.fromisoformat(sort_value), str(row_id)
+    except (TypeError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def keyset_query(query, sort_column, id_column, cursor: Optional[str], limit: int):
+    # Newest first, one row past the page so we know whether there is more.
+    # Rows without a sort value can't be placed on the keyset and are left
+    # out; every writer sets them (column defaults).
+    query = query.filter(sort_column.isnot(None))
+    if cursor:
+        query = query.filter(tuple_(sort_column, id_column) < tuple_(*decode_cursor(cursor)))
+    return query.order_by(sort_column.desc(), id_column.desc()).limit(limit + 1)
+
+
+async def fetch_page(db: AsyncSession, query, sort_column, id_column, cursor: Optional[str], limit: int) -> Tuple[list, Optional[str]]:
+    # Returns (rows, cursor for the next page or None on the last page)
+    result = await db.execute(keyset_query(query, sort_column, id_column, cursor, limit))
+    rows = result.scalars().all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+
+
+async def stream_rows(query, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[Sequence]:
+    # Server-side cursor on its own session: the request's session is closed
+    # before a streaming body is sent, and only one batch is held at a time
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=batch_size))
+        async for rows in result.partitions():
+            yield rows
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+async def ndjson_lines(columns: List[str], batches: AsyncIterator[Sequence]) -> AsyncIterator[str]:
+    async for rows in batches:
+        yield "".join(
+            json.dumps({key: _value(value) for key, value in zip(columns, row)}, default=str) + "\n" for row in rows
+        )
+
+
+async def csv_lines(columns: List[str], batches: AsyncIterator[Sequence]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    async for rows in batches:
+        for row in rows:
+            writer.writerow([json.dumps(value) if isinstance(value, (dict, list)) else _value(value) for value in row])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
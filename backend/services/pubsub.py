@@ -0,0 +1,270 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from typing import Callable, List, Optional, Tuple
+
+from prometheus_client import Counter, Histogram
+from sqlalchemy.engine import make_url
+
+logger = logging.getLogger(__name__)
+
+# 'memory' keeps messages in this process (single worker, the default);
+# 'postgres' fans them out to every worker with LISTEN/NOTIFY
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "memory")
+PUBSUB_CHANNEL = os.getenv("PUBSUB_CHANNEL", "realtime")
+PUBSUB_BATCH_MS = float(os.getenv("PUBSUB_BATCH_MS", "5"))
+PUBSUB_MAX_BATCH = int(os.getenv("PUBSUB_MAX_BATCH", "200"))
+PUBSUB_RECONNECT_DELAY = 1.0
+# NOTIFY payloads must stay under 8000 bytes
+MAX_PAYLOAD_BYTES = 7800
+
+PUBSUB_PUBLISHED = Counter("pubsub_messages_published_total", "Realtime messages sent to other workers")
+PUBSUB_RECEIVED = Counter("pubsub_messages_received_total", "Realtime messages received from other workers")
+PUBSUB_DROPPED = Counter("pubsub_messages_dropped_total", "Realtime messages that could not be sent to other workers", ["reason"])
+PUBSUB_BATCH_SIZE = Histogram("pubsub_batch_size", "Realtime messages per pub/sub payload", buckets=(1, 2, 5, 10, 25, 50, 100, 200))
+
+Envelope = Tuple[str, str]  # (target, message)
+PayloadHandler = Callable[[str], None]
+
+
+class PubSubBackend:
+    # Transport between workers. start() subscribes handler to payloads
+    # published by any worker (including this one).
+    remote = True
+
+    async def start(self, handler: PayloadHandler):
+        raise NotImplementedError
+
+    async def publish(self, payload: str):
+        raise NotImplementedError
+
+    async def stop(self):
+        pass
+
+
+class InMemoryBackend(PubSubBackend):
+    # Single process: local delivery is all there is
+    remote = False
+
+    async def start(self, handler: PayloadHandler):
+        pass
+
+    async def publish(self, payload: str):
+        pass
+
+
+class LocalBroker:
+    # Stand-in for the Postgres channel so several PubSub instances in one
+    # process behave like separate workers (tests, benchmarks)
+
+    def __init__(self):
+        self.handlers: List[PayloadHandler] = []
+
+    def backend(self) -> "LocalBrokerBackend":
+        return LocalBrokerBackend(self)
+
+
+class LocalBrokerBackend(PubSubBackend):
+    def __init__(self, broker: LocalBroker):
+        self.broker = broker
+        self.handler: Optional[PayloadHandler] = None
+
+    async def start(self, handler: PayloadHandler):
+        self.handler = handler
+        self.broker.handlers.append(handler)
+
+    async def publish(self, payload: str):
+        loop = asyncio.get_running_loop()
+        for handler in list(self.broker.handlers):
+            # Asynchronous like a real NOTIFY
+            loop.call_soon(handler, payload)
+
+    async def stop(self):
+        if self.handler in self.broker.handlers:
+            self.broker.handlers.remove(self.handler)
+
+
+class PostgresBackend(PubSubBackend):
+    # LISTEN on a dedicated asyncpg connection (outside the SQLAlchemy pool,
+    # it is held for the life of the worker) and NOTIFY on a second one.
+    # Messages sent while the listener is reconnecting are lost; realtime
+    # messages are best effort.
+
+    def __init__(self, database_url: str, channel: str = PUBSUB_CHANNEL):
+        self.dsn = make_url(database_url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.channel = channel
+        self.handler: Optional[PayloadHandler] = None
+        self.listener = None
+        self.publisher = None
+        self.task: Optional[asyncio.Task] = None
+        self._lost = asyncio.Event()
+        self._publish_lock = asyncio.Lock()
+
+    async def start(self, handler: PayloadHandler):
+        self.handler = handler
+        await self._listen()
+        self.task = asyncio.create_task(self._keep_listening())
+
+    async def _listen(self):
+        import asyncpg
+
+        self._lost.clear()
+        self.listener = await asyncpg.connect(self.dsn)
+        self.listener.add_termination_listener(lambda connection: self._lost.set())
+        await self.listener.add_listener(self.channel, self._on_notify)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self.handler(payload)
+
+    async def _keep_listening(self):
+        while True:
+            await self._lost.wait()
+            logger.warning("Pub/sub listener connection lost, reconnecting")
+            while True:
+                try:
+                    await self._listen()
+                    break
+                except Exception:
+                    await asyncio.sleep(PUBSUB_RECONNECT_DELAY)
+
+    async def publish(self, payload: str):
+        import asyncpg
+
+        async with self._publish_lock:
+            if self.publisher is None or self.publisher.is_closed():
+                self.publisher = await asyncpg.connect(self.dsn)
+            await self.publisher.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        for connection in (self.listener, self.publisher):
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+        self.listener = self.publisher = None
+
+
+def create_backend(name: str = PUBSUB_BACKEND) -> PubSubBackend:
+    if name == "memory":
+        return InMemoryBackend()
+    if name == "postgres":
+        from database import DATABASE_URL
+        return PostgresBackend(DATABASE_URL)
+    raise ValueError(f"Unknown PUBSUB_BACKEND '{name}', expected 'memory' or 'postgres'")
+
+
+class PubSub:
+    # publish() delivers to this worker's clients right away and queues the
+    # message for the other workers. Queued messages are sent as one payload
+    # per batch_ms window (or sooner, once max_batch are waiting); payloads
+    # from this worker are ignored when they come back.
+
+    def __init__(
+        self,
+        deliver: Callable[[str, str], None],
+        backend: Optional[PubSubBackend] = None,
+        batch_ms: float = PUBSUB_BATCH_MS,
+        max_batch: int = PUBSUB_MAX_BATCH,
+    ):
+        self.deliver = deliver
+        self.backend = backend
+        self.batch_delay = batch_ms / 1000.0
+        self.max_batch = max_batch
+        self.worker_id = uuid.uuid4().hex
+        self.pending: List[Envelope] = []
+        self.started = False
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._sends: set = set()
+
+    async def start(self):
+        if self.backend is None:
+            self.backend = create_backend()
+        await self.backend.start(self._on_payload)
+        self.started = True
+
+    async def stop(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._flush()
+        if self._sends:
+            await asyncio.gather(*self._sends, return_exceptions=True)
+        if self.backend is not None:
+            await self.backend.stop()
+        self.started = False
+
+    def publish(self, target: str, message: str):
+        self.deliver(target, message)
+        if not self.started or not self.backend.remote:
+            return
+        self.pending.append((target, message))
+        if len(self.pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.batch_delay, self._flush)
+
+    def _payloads(self, envelopes: List[Envelope]) -> List[Tuple[str, int]]:
+        # Split into payloads that fit a NOTIFY; returns (payload, message count)
+        payloads = []
+        head = '{"origin":"%s","messages":[' % self.worker_id
+        chunk: List[str] = []
+        size = len(head) + 2
+        for envelope in envelopes:
+            encoded = json.dumps(envelope)
+            length = len(encoded.encode()) + 1
+            if len(head) + 2 + length > MAX_PAYLOAD_BYTES:
+                PUBSUB_DROPPED.labels(reason="too_large").inc()
+                logger.warning("Realtime message of %d bytes is too large for other workers", length)
+                continue
+            if chunk and size + length > MAX_PAYLOAD_BYTES:
+                payloads.append((head + ",".join(chunk) + "]}", len(chunk)))
+                chunk, size = [], len(head) + 2
+            chunk.append(encoded)
+            size += length
+        if chunk:
+            payloads.append((head + ",".join(chunk) + "]}", len(chunk)))
+        return payloads
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        envelopes, self.pending = self.pending, []
+        for payload, count in self._payloads(envelopes):
+            task = asyncio.ensure_future(self._send(payload, count))
+            self._sends.add(task)
+            task.add_done_callback(self._sends.discard)
+
+    async def _send(self, payload: str, count: int):
+        try:
+            await self.backend.publish(payload)
+        except Exception:
+            PUBSUB_DROPPED.labels(reason="publish_failed").inc(count)
+            logger.exception("Could not publish %d realtime messages", count)
+            return
+        PUBSUB_PUBLISHED.inc(count)
+        PUBSUB_BATCH_SIZE.observe(count)
+
+    def _on_payload(self, payload: str):
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed pub/sub payload")
+            return
+        if data.get("origin") == self.worker_id:
+            return
+        messages = data.get("messages") or []
+        PUBSUB_RECEIVED.inc(len(messages))
+        for target, message in messages:
+            # One bad message mustn't cost the rest of the batch
+            try:
+                self.deliver(target, message)
+            except Exception:
+                logger.exception("Could not deliver pub/sub message for %s", target)
@@ -0,0 +1,442 @@
+import math
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Above this many nodes the full (n+1)^2 float32 matrix costs more to fill
+# (and hold) than it saves, so distances are computed on demand instead.
+MATRIX_MAX_NODES = 2000
+# Share of the time budget the matrix and the nearest-neighbour seed may
+# use; past it they give way to on-demand distances / a space-filling curve
+MATRIX_BUDGET_SHARE = 0.2
+SEED_BUDGET_SHARE = 0.4
+# Candidate neighbours per stop considered by 2-opt / Or-opt moves
+NEIGHBOUR_COUNT = 10
+# Average stops per spatial grid cell when finding neighbours
+GRID_CELL_POINTS = 8
+HILBERT_ORDER = 16
+ROW_CHUNK = 512
+OR_OPT_MAX_SEGMENT = 3
+EPSILON = 1e-9
+
+
+def extract_coordinates(location) -> Optional[Tuple[float, float]]:
+    # location JSON looks like {lat: float, lng: float, address: str}
+    if not isinstance(location, dict):
+        return None
+    try:
+        lat = float(location.get("lat"))
+        lng = float(location.get("lng", location.get("lon")))
+    except (TypeError, ValueError):
+        return None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0):
+        return None
+    return lat, lng
+
+
+def _haversine_radians(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # a: (n, 2), b: (m, 2) in radians -> (n, m) distances in km
+    dlat = b[None, :, 0] - a[:, None, 0]
+    dlng = b[None, :, 1] - a[:, None, 1]
+    h = np.sin(dlat / 2.0) ** 2 + np.cos(a[:, None, 0]) * np.cos(b[None, :, 0]) * np.sin(dlng / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def haversine_matrix(coords_a: Sequence[Tuple[float, float]], coords_b: Optional[Sequence[Tuple[float, float]]] = None) -> np.ndarray:
+    a = np.radians(np.asarray(coords_a, dtype=np.float64).reshape(-1, 2))
+    b = a if coords_b is None else np.radians(np.asarray(coords_b, dtype=np.float64).reshape(-1, 2))
+    return _haversine_radians(a, b)
+
+
+def path_length(coords: Sequence[Tuple[float, float]], order: Sequence[int]) -> float:
+    # Length of an open path visiting coords in the given order
+    if len(order) < 2:
+        return 0.0
+    pts = np.radians(np.asarray(coords, dtype=np.float64)[list(order)])
+    dlat = pts[1:, 0] - pts[:-1, 0]
+    dlng = pts[1:, 1] - pts[:-1, 1]
+    h = np.sin(dlat / 2.0) ** 2 + np.cos(pts[:-1, 0]) * np.cos(pts[1:, 0]) * np.sin(dlng / 2.0) ** 2
+    return float(np.sum(2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))))
+
+
+def _hilbert_keys(cells: np.ndarray, order: int = HILBERT_ORDER) -> np.ndarray:
+    # Position of each (x, y) cell in [0, 2^order)^2 along a Hilbert curve
+    side = 1 << order
+    x, y = cells[:, 0].copy(), cells[:, 1].copy()
+    keys = np.zeros(len(cells), dtype=np.int64)
+    s = side >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        keys += s * s * ((3 * rx.astype(np.int64)) ^ ry.astype(np.int64))
+        flip = ~ry & rx
+        x = np.where(flip, side - 1 - x, x)
+        y = np.where(flip, side - 1 - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= 1
+    return keys
+
+
+class _Distances:
+    # Distance oracle over the real nodes plus one "dummy" node (index n)
+    # that is 0 km from everything. Closing the tour through the dummy turns
+    # the symmetric TSP into an open path with a free end.
+
+    def __init__(self, coords: np.ndarray, deadline: Optional[float] = None):
+        self.n = len(coords)
+        self.dummy = self.n
+        self.rad = np.radians(coords)
+        # Local planar projection (km), used to bucket and order stops
+        self.xy = np.column_stack((self.rad[:, 1] * np.cos(self.rad[:, 0].mean()), self.rad[:, 0])) * EARTH_RADIUS_KM
+        self.matrix = None
+        if self.n <= MATRIX_MAX_NODES:
+            matrix = np.zeros((self.n + 1, self.n + 1), dtype=np.float32)
+            for start in range(0, self.n, ROW_CHUNK):
+                if deadline is not None and time.perf_counter() > deadline:
+                    matrix = None
+                    break
+                stop = min(start + ROW_CHUNK, self.n)
+                matrix[start:stop, :self.n] = _haversine_radians(self.rad[start:stop], self.rad)
+            self.matrix = matrix
+        if self.matrix is not None:
+            self.get = self.matrix.item
+        else:
+            lat = self.rad[:, 0].tolist()
+            lng = self.rad[:, 1].tolist()
+            cos_lat = np.cos(self.rad[:, 0]).tolist()
+            dummy = self.dummy
+            sin, asin, sqrt = math.sin, math.asin, math.sqrt
+
+            def get(i, j):
+                if i == dummy or j == dummy or i == j:
+                    return 0.0
+                h = sin((lat[j] - lat[i]) / 2.0) ** 2 + cos_lat[i] * cos_lat[j] * sin((lng[j] - lng[i]) / 2.0) ** 2
+                return 2.0 * EARTH_RADIUS_KM * asin(sqrt(min(1.0, h)))
+
+            self.get = get
+
+    def rows(self, start: int, stop: int) -> np.ndarray:
+        # Distances from real nodes [start, stop) to every real node
+        if self.matrix is not None:
+            return self.matrix[start:stop, :self.n].astype(np.float64)
+        return _haversine_radians(self.rad[start:stop], self.rad)
+
+    def hilbert_keys(self) -> np.ndarray:
+        low = self.xy.min(axis=0)
+        span = max(float((self.xy.max(axis=0) - low).max()), EPSILON)
+        cells = ((self.xy - low) / span * ((1 << HILBERT_ORDER) - 1)).astype(np.int64)
+        return _hilbert_keys(cells)
+
+    def neighbours(self, k: int, deadline: Optional[float] = None) -> Optional[np.ndarray]:
+        # The k nearest stops of every stop, nearest first. Stops are
+        # bucketed into a grid of ~GRID_CELL_POINTS per cell and each cell
+        # only compared with the cells around it; a stop whose k-th
+        # candidate lies beyond that window falls back to a full row.
+        # None if the deadline passes first.
+        k = max(0, min(k, self.n - 1))
+        result = np.empty((self.n, k), dtype=np.int64)
+        if k == 0:
+            return result
+        low = self.xy.min(axis=0)
+        side = max(1, int(math.ceil(math.sqrt(self.n / GRID_CELL_POINTS))))
+        cell = max(float((self.xy.max(axis=0) - low).max()) / side, EPSILON)
+        grid = np.minimum(((self.xy - low) / cell).astype(np.int64), side - 1)
+        keys = grid[:, 0] * side + grid[:, 1]
+        by_cell = np.argsort(keys, kind="stable")
+        occupied, first, counts = np.unique(keys[by_cell], return_index=True, return_counts=True)
+        slots = {int(key): (int(f), int(f + c)) for key, f, c in zip(occupied, first, counts)}
+
+        for key, (f, l) in slots.items():
+            if deadline is not None and time.perf_counter() > deadline:
+                return None
+            members = by_cell[f:l]
+            cx, cy = divmod(key, side)
+            reach = 1
+            while True:
+                window = [
+                    by_cell[slice(*slots[x * side + y])]
+                    for x in range(max(0, cx - reach), min(side, cx + reach + 1))
+                    for y in range(max(0, cy - reach), min(side, cy + reach + 1))
+                    if x * side + y in slots
+                ]
+                candidates = np.concatenate(window)
+                if len(candidates) > k or len(candidates) == self.n:
+                    break
+                reach += 1
+            block = _haversine_radians(self.rad[members], self.rad[candidates])
+            block[members[:, None] == candidates[None, :]] = np.inf
+            nearest = np.argpartition(block, k - 1, axis=1)[:, :k]
+            near = np.take_along_axis(block, nearest, axis=1)
+            order = np.argsort(near, axis=1)
+            result[members] = candidates[np.take_along_axis(nearest, order, axis=1)]
+            # Anything closer than the window's edge is in the window
+            for row in np.flatnonzero(near.max(axis=1) > reach * cell).tolist():
+                node = int(members[row])
+                full = self.rows(node, node + 1)[0]
+                full[node] = np.inf
+                nearest_full = np.argpartition(full, k - 1)[:k]
+                result[node] = nearest_full[np.argsort(full[nearest_full])]
+        return result
+
+
+@dataclass
+class RouteSolution:
+    order: List[int]
+    distance_km: float
+    initial_distance_km: float
+    elapsed_ms: float = 0.0
+    iterations: int = 0
+    two_opt_moves: int = 0
+    or_opt_moves: int = 0
+    timed_out: bool = False
+    stats_extra: dict = field(default_factory=dict)
+
+    def stats(self) -> dict:
+        return {
+            "initial_distance_km": round(self.initial_distance_km, 3),
+            "elapsed_ms": round(self.elapsed_ms, 2),
+            "iterations": self.iterations,
+            "two_opt_moves": self.two_opt_moves,
+            "or_opt_moves": self.or_opt_moves,
+            "timed_out": self.timed_out,
+            **self.stats_extra,
+        }
+
+
+class _Tour:
+    # Cyclic tour over real nodes + dummy. Positions outside [lo, hi] are
+    # pinned (the depot and/or the dummy) and never moved.
+
+    def __init__(self, nodes: List[int], lo: int, hi: int):
+        self.tour = np.asarray(nodes, dtype=np.int64)
+        self.size = len(nodes)
+        self.pos = np.empty(self.size, dtype=np.int64)
+        self.pos[self.tour] = np.arange(self.size)
+        self.lo = lo
+        self.hi = hi
+
+    def at(self, p: int) -> int:
+        return int(self.tour[p % self.size])
+
+    def reverse(self, i: int, j: int):
+        segment = self.tour[i:j + 1][::-1].copy()
+        self.tour[i:j + 1] = segment
+        self.pos[segment] = np.arange(i, j + 1)
+
+    def move_segment(self, p: int, length: int, after: int, reverse: bool):
+        # Move tour[p:p+length] so it follows position `after`
+        segment = self.tour[p:p + length].copy()
+        if reverse:
+            segment = segment[::-1]
+        rest = np.concatenate((self.tour[:p], self.tour[p + length:]))
+        insert_at = (after if after < p else after - length) + 1
+        self.tour = np.concatenate((rest[:insert_at], segment, rest[insert_at:]))
+        self.pos[self.tour] = np.arange(self.size)
+
+    def length(self, dist) -> float:
+        total = 0.0
+        tour = self.tour.tolist()
+        for k in range(self.size):
+            total += dist(tour[k], tour[(k + 1) % self.size])
+        return total
+
+
+def _space_filling_order(dist: _Distances, start: int, remaining: np.ndarray) -> List[int]:
+    # Remaining stops along a Hilbert curve, entered where `start` sits on it
+    keys = dist.hilbert_keys()
+    ordered = remaining[np.argsort(keys[remaining], kind="stable")]
+    entry = int(np.searchsorted(keys[ordered], keys[start]))
+    return np.concatenate((ordered[entry:], ordered[:entry])).tolist()
+
+
+def _nearest_neighbour(
+    dist: _Distances,
+    start: int,
+    candidates: np.ndarray,
+    neigh: Optional[np.ndarray] = None,
+    deadline: Optional[float] = None,
+) -> List[int]:
+    # Greedy seed tour. The nearest unvisited stop is usually in the
+    # current stop's neighbour list; otherwise it takes a vectorized argmin
+    # over a row. Stops still unvisited at the deadline follow in
+    # space-filling-curve order.
+    visited = np.ones(dist.n, dtype=bool)
+    visited[candidates] = False
+    visited[start] = True
+    order = [start]
+    current = start
+    for step in range(int(np.count_nonzero(~visited))):
+        if deadline is not None and step % 64 == 0 and time.perf_counter() > deadline:
+            order.extend(_space_filling_order(dist, current, np.flatnonzero(~visited)))
+            break
+        following = -1
+        if neigh is not None:
+            for node in neigh[current].tolist():
+                if not visited[node]:
+                    following = node
+                    break
+        if following < 0:
+            row = dist.rows(current, current + 1)[0]
+            row[visited] = np.inf
+            following = int(np.argmin(row))
+        current = following
+        visited[current] = True
+        order.append(current)
+    return order
+
+
+def _two_opt(tour: _Tour, dist, neigh: np.ndarray, deadline: float, solution: RouteSolution) -> bool:
+    size, lo, hi = tour.size, tour.lo, tour.hi
+    queue = deque(int(x) for x in tour.tour[lo:hi + 1] if x < len(neigh))
+    queued = set(queue)
+    improved_any = False
+
+    while queue:
+        solution.iterations += 1
+        if solution.iterations % 64 == 0 and time.perf_counter() > deadline:
+            solution.timed_out = True
+            break
+        a = queue.popleft()
+        queued.discard(a)
+        improved = False
+        for step in (1, -1):
+            pa = int(tour.pos[a])
+            na = tour.at(pa + step)
+            d_a = dist(a, na)
+            for c in neigh[a].tolist():
+                d_ac = dist(a, c)
+                if d_ac >= d_a - EPSILON:
+                    break
+                pc = int(tour.pos[c])
+                nc = tour.at(pc + step)
+                if nc == a or c == na:
+                    continue
+                delta = d_ac + dist(na, nc) - d_a - dist(c, nc)
+                if delta >= -EPSILON:
+                    continue
+                i, j = (pa, pc) if pa < pc else (pc, pa)
+                # succ variant reverses (i, j], pred variant reverses [i, j)
+                first, last = (i + 1, j) if step == 1 else (i, j - 1)
+                if first < lo or last > hi or first >= last:
+                    continue
+                tour.reverse(first, last)
+                solution.two_opt_moves += 1
+                improved = improved_any = True
+                for node in (a, na, c, nc):
+                    if node < len(neigh) and node not in queued:
+                        queue.append(node)
+                        queued.add(node)
+                break
+            if improved:
+                break
+    return improved_any
+
+
+def _or_opt(tour: _Tour, dist, neigh: np.ndarray, deadline: float, solution: RouteSolution) -> bool:
+    improved_any = False
+    p = tour.lo
+    while p <= tour.hi:
+        solution.iterations += 1
+        if solution.iterations % 64 == 0 and time.perf_counter() > deadline:
+            solution.timed_out = True
+            break
+        moved = False
+        for length in range(1, OR_OPT_MAX_SEGMENT + 1):
+            if p + length - 1 > tour.hi:
+                break
+            first, last = tour.at(p), tour.at(p + length - 1)
+            prev, nxt = tour.at(p - 1), tour.at(p + length)
+            removal_gain = dist(prev, first) + dist(last, nxt) - dist(prev, nxt)
+            if removal_gain <= EPSILON:
+                continue
+            for end in (first, last):
+                if end >= len(neigh):
+                    continue
+                for c in neigh[end].tolist():
+                    if dist(end, c) >= removal_gain:
+                        break
+                    q = int(tour.pos[c])
+                    if p - 1 <= q < p + length or q < tour.lo - 1 or q > tour.hi:
+                        continue
+                    d = tour.at(q + 1)
+                    base = dist(c, d)
+                    forward = dist(c, first) + dist(last, d) - base
+                    backward = dist(c, last) + dist(first, d) - base
+                    if min(forward, backward) < removal_gain - EPSILON:
+                        tour.move_segment(p, length, q, reverse=backward < forward)
+                        solution.or_opt_moves += 1
+                        moved = improved_any = True
+                        break
+                if moved:
+                    break
+            if moved:
+                break
+        if not moved:
+            p += 1
+    return improved_any
+
+
+def solve_route(
+    coords: Sequence[Tuple[float, float]],
+    start: Optional[Tuple[float, float]] = None,
+    time_budget: float = 2.0,
+    neighbours: int = NEIGHBOUR_COUNT,
+) -> RouteSolution:
+    # Open-path TSP: nearest-neighbour seed, then 2-opt and Or-opt with
+    # neighbour lists until a local optimum or the time budget runs out.
+    # Every phase checks the deadline, so the budget covers setup too.
+    # `order` indexes into coords; `start` (e.g. the depot) is never included.
+    started = time.perf_counter()
+    budget = max(0.0, time_budget)
+    deadline = started + budget
+    n_stops = len(coords)
+    if n_stops == 0:
+        return RouteSolution(order=[], distance_km=0.0, initial_distance_km=0.0)
+
+    points = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if start is not None:
+        points = np.vstack((points, np.asarray(start, dtype=np.float64).reshape(1, 2)))
+    dist = _Distances(points, deadline=started + budget * MATRIX_BUDGET_SHARE)
+    get = dist.get
+    stops = np.arange(n_stops)
+    neigh = dist.neighbours(neighbours, deadline) if n_stops > 2 else None
+    seed_deadline = started + budget * SEED_BUDGET_SHARE
+
+    if start is not None:
+        depot = n_stops
+        seed = _nearest_neighbour(dist, depot, stops, neigh, seed_deadline)
+        # [depot, ..., dummy]: depot and dummy pinned, closing edge costs 0
+        tour = _Tour(seed + [dist.dummy], lo=1, hi=len(seed) - 1)
+    else:
+        seed = _nearest_neighbour(dist, 0, stops, neigh, seed_deadline)
+        # [dummy, ...]: both path ends are free
+        tour = _Tour([dist.dummy] + seed, lo=1, hi=len(seed))
+
+    solution = RouteSolution(order=[], distance_km=0.0, initial_distance_km=tour.length(get))
+    solution.stats_extra["stops"] = n_stops
+    solution.stats_extra["distance_matrix"] = dist.matrix is not None
+
+    if n_stops > 2 and neigh is None:
+        solution.timed_out = True
+    elif n_stops > 2:
+        while time.perf_counter() < deadline:
+            improved = _two_opt(tour, get, neigh, deadline, solution)
+            if solution.timed_out:
+                break
+            improved = _or_opt(tour, get, neigh, deadline, solution) or improved
+            if solution.timed_out or not improved:
+                break
+        else:
+            solution.timed_out = True
+
+    nodes = tour.tour.tolist()
+    solution.order = [node for node in nodes if node < n_stops]
+    solution.distance_km = tour.length(get)
+    solution.elapsed_ms = (time.perf_counter() - started) * 1000.0
+    return solution
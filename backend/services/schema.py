@@ -0,0 +1,179 @@
+import importlib
+import logging
+import pkgutil
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+import migrations
+from database import engine
+
+logger = logging.getLogger(__name__)
+
+# Schema changes are numbered scripts in migrations/ (0001_baseline.py,
+# ...), applied in order by `python manage.py migrate` and recorded in
+# schema_migrations. Workers never change the schema; at startup they only
+# check that the database is at the version this build expects.
+#
+# Each script defines `async def upgrade(conn)`. By default it runs in one
+# transaction, together with its schema_migrations row. Scripts that build
+# indexes concurrently or backfill in batches set TRANSACTIONAL = False
+# and get an autocommit connection (conn.engine for sessions of their
+# own); those must be safe to re-run after an
+# interruption (IF NOT EXISTS, backfills that skip finished rows).
+# Scripts use explicit DDL for the schema as of their version, never
+# tables.py, which keeps changing: 0001 is the schema the old
+# create_all-at-startup produced, and each later script starts from what
+# the ones before it left.
+MIGRATION_LOCK_KEY = 0x57494954  # one migrate at a time across hosts
+BACKFILL_BATCH_SIZE = 5000
+
+
+@dataclass
+class Migration:
+    version: int
+    name: str
+    upgrade: Callable
+    transactional: bool = True
+
+
+def _scripts() -> List[Tuple[int, str, str]]:
+    # (version, name, module) for each NNNN_name.py in migrations/
+    scripts = []
+    for module_info in pkgutil.iter_modules(migrations.__path__):
+        prefix, _, name = module_info.name.partition("_")
+        if prefix.isdigit():
+            scripts.append((int(prefix), name, module_info.name))
+    scripts.sort()
+    versions = [version for version, _, _ in scripts]
+    if versions != list(range(1, len(scripts) + 1)):
+        raise RuntimeError(f"Migration versions must run 1..n without gaps, found {versions}")
+    return scripts
+
+
+def load_migrations() -> List[Migration]:
+    migrations_found = []
+    for version, name, module_name in _scripts():
+        module = importlib.import_module(f"migrations.{module_name}")
+        migrations_found.append(Migration(version, name, module.upgrade, getattr(module, "TRANSACTIONAL", True)))
+    return migrations_found
+
+
+def latest_version() -> int:
+    # Without importing the scripts, so the startup check stays cheap
+    return len(_scripts())
+
+
+async def _ensure_version_table(conn):
+    await conn.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migrations "
+        "(version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at TIMESTAMP NOT NULL DEFAULT (now() at time zone 'utc'))"
+    ))
+
+
+async def applied_versions(conn) -> List[int]:
+    exists = (await conn.execute(text("SELECT to_regclass('schema_migrations') IS NOT NULL"))).scalar()
+    if not exists:
+        return []
+    return list((await conn.execute(text("SELECT version FROM schema_migrations ORDER BY version"))).scalars())
+
+
+def _record(conn, migration: Migration):
+    return conn.execute(
+        text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+        {"version": migration.version, "name": migration.name},
+    )
+
+
+async def migrate(target: Optional[int] = None, bind: Optional[AsyncEngine] = None) -> dict:
+    # Apply pending migrations up to `target` (default: all)
+    bind = bind or engine
+    applied = []
+    async with bind.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        try:
+            await _ensure_version_table(conn)
+            done = set(await applied_versions(conn))
+            pending = [
+                migration for migration in load_migrations()
+                if migration.version not in done and (target is None or migration.version <= target)
+            ]
+            for migration in pending:
+                started = time.perf_counter()
+                logger.info("Applying migration %04d_%s", migration.version, migration.name)
+                if migration.transactional:
+                    async with bind.begin() as transaction:
+                        await migration.upgrade(transaction)
+                        await _record(transaction, migration)
+                else:
+                    await migration.upgrade(conn)
+                    await _record(conn, migration)
+                applied.append({"version": migration.version, "name": migration.name, "seconds": round(time.perf_counter() - started, 3)})
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+    return {"applied": applied, "version": max(done | {step["version"] for step in applied}, default=0)}
+
+
+async def schema_version(bind: Optional[AsyncEngine] = None) -> int:
+    async with (bind or engine).connect() as conn:
+        return max(await applied_versions(conn), default=0)
+
+
+async def check_schema_version():
+    # Startup check: refuse to serve against a database that is behind
+    # this build. A newer database is fine (rolling deploys start the new
+    # migrations before the old workers are gone).
+    current, expected = await schema_version(), latest_version()
+    if current < expected:
+        raise RuntimeError(
+            f"Database schema is at version {current} but this build needs {expected}; "
+            "run `python manage.py migrate`"
+        )
+    if current > expected:
+        logger.warning("Database schema version %d is newer than this build (%d)", current, expected)
+
+
+# --- Helpers for migration scripts ---
+
+async def create_index_concurrently(conn, name: str, ddl: str):
+    # `ddl` is the full CREATE [UNIQUE] INDEX CONCURRENTLY statement. A
+    # build that was interrupted leaves an invalid index behind; it is
+    # dropped and built again.
+    valid = (await conn.execute(
+        text("SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+             "WHERE c.relname = :name AND pg_table_is_visible(c.oid)"),
+        {"name": name},
+    )).scalar()
+    if valid:
+        return
+    if valid is not None:
+        await conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+    logger.info("Creating index %s", name)
+    await conn.execute(text(ddl))
+
+
+async def backfill_in_batches(conn, table: str, assignments: str, where: str, batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    # UPDATE table SET assignments WHERE where, batch_size rows at a time
+    # in id order. On an autocommit connection every batch commits on its
+    # own, so row locks are short and an interrupted run picks up where it
+    # stopped (as long as `where` excludes finished rows).
+    updated = 0
+    last_id = ""
+    while True:
+        # Batch bounds come from the database so they follow its collation
+        ids = (await conn.execute(
+            text(f"SELECT id FROM {table} WHERE id > :last_id AND ({where}) ORDER BY id LIMIT :batch_size"),
+            {"last_id": last_id, "batch_size": batch_size},
+        )).scalars().all()
+        if not ids:
+            return updated
+        result = await conn.execute(
+            text(f"UPDATE {table} SET {assignments} WHERE id > :last_id AND id <= :batch_last AND ({where})"),
+            {"last_id": last_id, "batch_last": ids[-1]},
+        )
+        updated += result.rowcount
+        last_id = ids[-1]
@@ -0,0 +1,304 @@
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import and_, delete, event, func, insert, text, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session
+
+from database import AsyncSessionLocal
+from tables import Activity, CreditTransaction, PickupRequest, StatsBucket, StatsDelta, User
+
+logger = logging.getLogger(__name__)
+
+STATS_RECONCILE_INTERVAL = float(os.getenv("STATS_RECONCILE_INTERVAL", "3600"))
+STATS_FOLD_INTERVAL = float(os.getenv("STATS_FOLD_INTERVAL", "2"))
+
+# The admin dashboard reads counters from stats_buckets instead of scanning
+# the tables. Write transactions never touch those shared rows: the flush
+# hook (_journal_flushed_rows) appends its increments to stats_deltas,
+# plain inserts that don't contend, and one worker at a time folds the
+# journal into the buckets every STATS_FOLD_INTERVAL seconds. Reads add
+# the not yet folded journal rows, so they are exact. A periodic
+# reconciliation corrects drift from writes that bypass the ORM.
+METRICS = ("users", "activities", "pickup_requests", "credits_spent", "co2_saved", "collections")
+PERIODS = ("day", "week")
+TOTAL = ("total", datetime(1970, 1, 1))
+INSERT_CHUNK = 1000
+FOLD_BATCH = 10000
+# Advisory locks: one folder and one reconciler across all workers
+FOLD_LOCK_KEY = 0x57494955
+RECONCILE_LOCK_KEY = 0x57494956
+
+BucketKey = Tuple[str, datetime]
+
+
+def period_start(period: str, when: datetime) -> datetime:
+    day = datetime(when.year, when.month, when.day)
+    if period == "week":
+        day -= timedelta(days=day.weekday())
+    return day
+
+
+def _contributions(obj) -> List[Tuple[str, float, Optional[datetime]]]:
+    # (metric, amount, timestamp) for each counter a row adds to
+    if isinstance(obj, User):
+        return [("users", 1, obj.created_at)]
+    if isinstance(obj, Activity):
+        contributions = [("activities", 1, obj.date), ("co2_saved", obj.impact_co2 or 0.0, obj.date)]
+        if obj.type == "collection":
+            # Logged by verify_pickup for every verified collection
+            contributions.append(("collections", 1, obj.date))
+        return contributions
+    if isinstance(obj, PickupRequest):
+        return [("pickup_requests", 1, obj.request_date)]
+    if isinstance(obj, CreditTransaction) and obj.type == "spent":
+        return [("credits_spent", abs(obj.amount or 0), obj.date)]
+    return []
+
+
+def flush_deltas(new: Iterable, deleted: Iterable = ()) -> Dict[BucketKey, Dict[str, float]]:
+    deltas: Dict[BucketKey, Dict[str, float]] = defaultdict(lambda: defaultdict(int))
+    for sign, objects in ((1, new), (-1, deleted)):
+        for obj in objects:
+            for metric, amount, when in _contributions(obj):
+                when = when or datetime.utcnow()
+                deltas[TOTAL][metric] += sign * amount
+                for period in PERIODS:
+                    deltas[(period, period_start(period, when))][metric] += sign * amount
+    deltas = {key: {metric: value for metric, value in values.items() if value} for key, values in deltas.items()}
+    return {key: values for key, values in deltas.items() if values}
+
+
+def _bucket_rows(deltas: Dict[BucketKey, Dict[str, float]]) -> List[dict]:
+    now = datetime.utcnow()
+    # Sorted so concurrent writers lock bucket rows in the same order
+    return [
+        {"period": period, "period_start": start, **{metric: values.get(metric, 0) for metric in METRICS}, "updated_at": now}
+        for (period, start), values in sorted(deltas.items())
+    ]
+
+
+def _increment_statement(rows: List[dict]):
+    # Adds rows (one per bucket) onto stats_buckets
+    stmt = pg_insert(StatsBucket).values(rows)
+    set_ = {metric: getattr(StatsBucket, metric) + getattr(stmt.excluded, metric) for metric in METRICS}
+    set_["updated_at"] = stmt.excluded.updated_at
+    return stmt.on_conflict_do_update(index_elements=[StatsBucket.period, StatsBucket.period_start], set_=set_)
+
+
+def _journal_statement(deltas: Dict[BucketKey, Dict[str, float]]):
+    return insert(StatsDelta).values([
+        {"period": period, "period_start": start, **{metric: values.get(metric, 0) for metric in METRICS}}
+        for (period, start), values in deltas.items()
+    ])
+
+
+@event.listens_for(Session, "after_flush")
+def _journal_flushed_rows(session, flush_context):
+    # session.new/deleted still hold what this flush wrote; defaults such
+    # as created_at have been filled in by now
+    deltas = flush_deltas(session.new, session.deleted)
+    if deltas:
+        session.connection().execute(_journal_statement(deltas))
+
+
+def fold_statement(batch_size: int = FOLD_BATCH):
+    # Moves up to batch_size journal rows into the buckets in one statement:
+    # delete them, sum them per bucket and add the sums on
+    moved = (
+        delete(StatsDelta)
+        .where(StatsDelta.id.in_(select(StatsDelta.id).order_by(StatsDelta.id).limit(batch_size)))
+        .returning(StatsDelta.period, StatsDelta.period_start, *[getattr(StatsDelta, metric) for metric in METRICS])
+        .cte("moved")
+    )
+    summed = (
+        select(moved.c.period, moved.c.period_start, *[func.sum(moved.c[metric]) for metric in METRICS], func.now())
+        .group_by(moved.c.period, moved.c.period_start)
+        .order_by(moved.c.period, moved.c.period_start)
+    )
+    stmt = pg_insert(StatsBucket).from_select(["period", "period_start", *METRICS, "updated_at"], summed)
+    set_ = {metric: getattr(StatsBucket, metric) + getattr(stmt.excluded, metric) for metric in METRICS}
+    set_["updated_at"] = stmt.excluded.updated_at
+    return stmt.on_conflict_do_update(index_elements=[StatsBucket.period, StatsBucket.period_start], set_=set_).add_cte(moved)
+
+
+async def fold_deltas(db: AsyncSession) -> int:
+    # Returns the buckets updated, or -1 if another worker is folding
+    if not (await db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": FOLD_LOCK_KEY})).scalar():
+        await db.rollback()
+        return -1
+    updated = 0
+    while True:
+        result = await db.execute(fold_statement())
+        await db.commit()
+        updated += result.rowcount
+        if result.rowcount == 0:
+            return updated
+        if not (await db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": FOLD_LOCK_KEY})).scalar():
+            await db.rollback()
+            return updated
+
+
+def _to_dict(row) -> dict:
+    return {metric: getattr(row, metric) or 0 for metric in METRICS}
+
+
+def _bucket_values(*filters):
+    # Buckets plus the journal rows not folded into them yet
+    columns = lambda model: [model.period, model.period_start, *[getattr(model, metric) for metric in METRICS]]
+    both = union_all(
+        select(*columns(StatsBucket)).filter(*[f(StatsBucket) for f in filters]),
+        select(*columns(StatsDelta)).filter(*[f(StatsDelta) for f in filters]),
+    ).subquery()
+    return (
+        select(both.c.period, both.c.period_start, *[func.sum(both.c[metric]).label(metric) for metric in METRICS])
+        .group_by(both.c.period, both.c.period_start)
+        .order_by(both.c.period_start)
+    )
+
+
+def _is_total(model):
+    return and_(model.period == TOTAL[0], model.period_start == TOTAL[1])
+
+
+async def get_totals(db: AsyncSession) -> dict:
+    # The 'total' bucket; built once if it doesn't exist yet
+    row = (await db.execute(_bucket_values(_is_total))).first()
+    if row is None:
+        await reconcile_stats(db)
+        row = (await db.execute(_bucket_values(_is_total))).first()
+    return _to_dict(row) if row is not None else {metric: 0 for metric in METRICS}
+
+
+async def get_trend(db: AsyncSession, period: str, since: datetime) -> List[dict]:
+    result = await db.execute(_bucket_values(
+        lambda model: model.period == period,
+        lambda model: model.period_start >= period_start(period, since),
+    ))
+    return [{"period_start": row.period_start, **_to_dict(row)} for row in result.all()]
+
+
+def _sources():
+    # (metric, timestamp column, aggregate, filters) per counted table
+    return [
+        ("users", User.created_at, func.count(User.id), ()),
+        ("activities", Activity.date, func.count(Activity.id), ()),
+        ("pickup_requests", PickupRequest.request_date, func.count(PickupRequest.id), ()),
+        ("credits_spent", CreditTransaction.date, func.coalesce(func.sum(func.abs(CreditTransaction.amount)), 0), (CreditTransaction.type == "spent",)),
+        ("co2_saved", Activity.date, func.coalesce(func.sum(Activity.impact_co2), 0.0), ()),
+        ("collections", Activity.date, func.count(Activity.id), (Activity.type == "collection",)),
+    ]
+
+
+def drift_rows(counts: Dict[BucketKey, Dict[str, float]], current: Dict[BucketKey, Dict[str, float]]) -> List[dict]:
+    # What to add to each bucket to turn `current` into `counts`. The
+    # 'total' bucket is always written so get_totals finds it.
+    drift = {}
+    for key in set(counts) | set(current) | {TOTAL}:
+        values = {metric: counts.get(key, {}).get(metric, 0) - current.get(key, {}).get(metric, 0) for metric in METRICS}
+        if any(values.values()) or (key == TOTAL and key not in current):
+            drift[key] = values
+    return _bucket_rows(drift)
+
+
+async def reconcile_stats(db: AsyncSession) -> Optional[dict]:
+    # Recount every bucket from the raw tables and add the difference. The
+    # counts, the buckets and the journal are all read in one REPEATABLE
+    # READ snapshot, so rows committed during the scan are neither in the
+    # counts nor in the counters, and nothing is locked while scanning;
+    # applying the drift is a short additive upsert. Returns None if
+    # another worker is already reconciling.
+    started = datetime.utcnow()
+    async with db.bind.connect() as conn:
+        if not (await conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": RECONCILE_LOCK_KEY})).scalar():
+            await conn.rollback()
+            return None
+        await conn.commit()
+        try:
+            snapshot = await conn.execution_options(isolation_level="REPEATABLE READ")
+            counts: Dict[BucketKey, Dict[str, float]] = defaultdict(dict)
+            async with snapshot.begin():
+                for metric, column, aggregate, filters in _sources():
+                    counts[TOTAL][metric] = (await snapshot.execute(select(aggregate).filter(*filters))).scalar() or 0
+                    for period in PERIODS:
+                        bucket = func.date_trunc(period, column)
+                        result = await snapshot.execute(select(bucket, aggregate).filter(column.isnot(None), *filters).group_by(bucket))
+                        for start, value in result.all():
+                            counts[(period, start)][metric] = value or 0
+                result = await snapshot.execute(_bucket_values())
+                current = {(row.period, row.period_start): _to_dict(row) for row in result.all()}
+
+            rows = drift_rows(counts, current)
+            writer = await conn.execution_options(isolation_level="READ COMMITTED")
+            async with writer.begin():
+                for start in range(0, len(rows), INSERT_CHUNK):
+                    await writer.execute(_increment_statement(rows[start:start + INSERT_CHUNK]))
+        finally:
+            await conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": RECONCILE_LOCK_KEY})
+            await conn.commit()
+
+    return {
+        "buckets": len(counts),
+        "totals": dict(counts[TOTAL]),
+        "drift": {metric: counts[TOTAL].get(metric, 0) - current.get(TOTAL, {}).get(metric, 0) for metric in METRICS},
+        "drifted_buckets": len(rows),
+        "elapsed_seconds": round((datetime.utcnow() - started).total_seconds(), 3),
+    }
+
+
+class StatsReconciler:
+    # Folds the journal every STATS_FOLD_INTERVAL seconds and runs
+    # reconcile_stats every STATS_RECONCILE_INTERVAL seconds
+
+    def __init__(self, interval: float = STATS_RECONCILE_INTERVAL, fold_interval: float = STATS_FOLD_INTERVAL):
+        self.interval = interval
+        self.fold_interval = fold_interval
+        self.task: Optional[asyncio.Task] = None
+        self.last_result: Optional[dict] = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        if not self.running:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        next_reconcile = loop.time() + self.interval
+        while True:
+            await asyncio.sleep(self.fold_interval)
+            try:
+                async with AsyncSessionLocal() as db:
+                    await fold_deltas(db)
+                if loop.time() >= next_reconcile:
+                    next_reconcile = loop.time() + self.interval
+                    async with AsyncSessionLocal() as db:
+                        result = await reconcile_stats(db)
+                    if result is not None:
+                        self.last_result = result
+                        if any(result["drift"].values()):
+                            logger.warning("Stats counters drifted: %s", result["drift"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Stats fold or reconciliation failed")
+
+
+stats_reconciler = StatsReconciler()
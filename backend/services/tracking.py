@@ -0,0 +1,107 @@
+import asyncio
+import math
+import os
+import struct
+import time
+from typing import Callable, Dict, Optional
+
+# A driver's position goes out at most once per TRACKING_INTERVAL seconds;
+# updates in between only replace the pending position
+TRACKING_INTERVAL = float(os.getenv("TRACKING_INTERVAL", "1.0"))
+
+# Binary tracking frame: kind (1 = tracking), lat, lng as float32 (~1 m at
+# city latitudes), unix time in seconds, then the driver id in UTF-8
+FRAME_TRACKING = 1
+_FRAME = struct.Struct("<BffI")
+
+
+def _number(value) -> Optional[float]:
+    # JSON numbers only: strings, booleans, NaN and infinities are rejected
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        return None
+    return float(value)
+
+
+def clean_position(location) -> Optional[dict]:
+    # The position as published, or None if it isn't a valid one
+    if not isinstance(location, dict):
+        return None
+    lat, lng = _number(location.get("lat")), _number(location.get("lng"))
+    if lat is None or lng is None or not -90 <= lat <= 90 or not -180 <= lng <= 180:
+        return None
+    position = {"lat": lat, "lng": lng}
+    timestamp = _number(location.get("timestamp"))
+    if timestamp is not None and 0 <= timestamp < 2 ** 32:
+        position["timestamp"] = int(timestamp)
+    return position
+
+
+def encode_position(driver_id: str, location: dict) -> bytes:
+    return _FRAME.pack(
+        FRAME_TRACKING,
+        float(location.get("lat", 0.0)),
+        float(location.get("lng", 0.0)),
+        int(location.get("timestamp") or time.time()),
+    ) + driver_id.encode()
+
+
+def decode_position(frame: bytes) -> dict:
+    kind, lat, lng, timestamp = _FRAME.unpack_from(frame)
+    return {"driver_id": frame[_FRAME.size:].decode(), "lat": lat, "lng": lng, "timestamp": timestamp}
+
+
+class DriverTracker:
+    # Coalesces location updates per driver. The first update after a quiet
+    # interval is published immediately; later ones wait for the interval to
+    # end and only the latest position is published.
+
+    def __init__(self, publish: Callable[[str, dict], None], interval: float = TRACKING_INTERVAL):
+        self.publish = publish
+        self.interval = interval
+        self.pending: Dict[str, dict] = {}
+        self.last_sent: Dict[str, float] = {}
+        self.timers: Dict[str, asyncio.TimerHandle] = {}
+        self.received = 0
+        self.published = 0
+        self.rejected = 0
+
+    def update(self, driver_id: str, location: Optional[dict]):
+        # Malformed positions are dropped here, before anything is published
+        location = clean_position(location)
+        if location is None:
+            self.rejected += 1
+            return
+        self.received += 1
+        loop = asyncio.get_running_loop()
+        wait = self.last_sent.get(driver_id, float("-inf")) + self.interval - loop.time()
+        if wait <= 0 and driver_id not in self.timers:
+            self._send(driver_id, location)
+            return
+        self.pending[driver_id] = location
+        if driver_id not in self.timers:
+            self.timers[driver_id] = loop.call_later(wait, self._flush, driver_id)
+
+    def _flush(self, driver_id: str):
+        self.timers.pop(driver_id, None)
+        location = self.pending.pop(driver_id, None)
+        if location is not None:
+            self._send(driver_id, location)
+
+    def _send(self, driver_id: str, location: dict):
+        self.last_sent[driver_id] = asyncio.get_running_loop().time()
+        self.published += 1
+        self.publish(driver_id, location)
+
+    def forget(self, driver_id: str):
+        # Driver went offline
+        timer = self.timers.pop(driver_id, None)
+        if timer is not None:
+            timer.cancel()
+        self.pending.pop(driver_id, None)
+        self.last_sent.pop(driver_id, None)
+
+    def stop(self):
+        for timer in self.timers.values():
+            timer.cancel()
+        self.timers.clear()
+        self.pending.clear()
@@ -0,0 +1,316 @@
+import asyncio
+import logging
+import math
+import os
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from database import AsyncSessionLocal
+from tables import User, PickupRequest
+from services.routing import extract_coordinates
+
+logger = logging.getLogger(__name__)
+
+KM_PER_DEG_LAT = 110.574
+KM_PER_DEG_LNG = 111.320
+UPDATE_CHUNK = 5000
+# New pickups reach a collector's route within this many seconds
+ZONE_ASSIGN_INTERVAL = float(os.getenv("ZONE_ASSIGN_INTERVAL", "30"))
+# pg_advisory_xact_lock key: one assignment run at a time across workers
+ASSIGN_LOCK_KEY = 0x57494958
+
+
+def project_km(coords: Sequence[Tuple[float, float]]) -> np.ndarray:
+    # Equirectangular projection around the mean latitude; plenty accurate
+    # at city scale and lets k-means work with plain euclidean distances.
+    points = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+    if len(points) == 0:
+        return points
+    lat0 = math.radians(float(points[:, 0].mean()))
+    return np.column_stack((points[:, 1] * KM_PER_DEG_LNG * math.cos(lat0), points[:, 0] * KM_PER_DEG_LAT))
+
+
+def _squared_distances(points: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # |p|^2 - 2 p.c + |c|^2 keeps memory at n x k instead of n x k x 2
+    d = (points ** 2).sum(axis=1)[:, None] - 2.0 * points @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]
+    return np.maximum(d, 0.0)
+
+
+def _kmeans_plus_plus(points: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    centroids = np.empty((k, 2))
+    centroids[0] = points[rng.integers(len(points))]
+    closest = ((points - centroids[0]) ** 2).sum(axis=1)
+    for i in range(1, k):
+        total = closest.sum()
+        if total <= 0:
+            centroids[i:] = points[rng.integers(len(points), size=k - i)]
+            break
+        centroids[i] = points[rng.choice(len(points), p=closest / total)]
+        closest = np.minimum(closest, ((points - centroids[i]) ** 2).sum(axis=1))
+    return centroids
+
+
+def _capacitated_assign(dist: np.ndarray, capacity) -> np.ndarray:
+    # Nearest-centroid assignment, then evict the members of overfull zones
+    # that lose the least by moving and place them in the nearest open zone.
+    # capacity is one limit for every zone or an array with one per zone.
+    n, k = dist.shape
+    capacity = np.broadcast_to(np.asarray(capacity, dtype=np.int64), (k,))
+    labels = dist.argmin(axis=1)
+    load = np.bincount(labels, minlength=k)
+    if (load <= capacity).all():
+        return labels
+
+    evicted = []
+    for c in np.flatnonzero(load > capacity):
+        members = np.flatnonzero(labels == c)
+        others = dist[members].copy()
+        others[:, c] = np.inf
+        # Largest penalty for leaving zone c stays
+        penalty = others.min(axis=1) - dist[members, c]
+        keep_order = np.argsort(-penalty)
+        evicted.append(members[keep_order[capacity[c]:]])
+        load[c] = capacity[c]
+
+    evicted = np.concatenate(evicted)
+    evicted = evicted[np.argsort(dist[evicted].min(axis=1))]
+    for i in evicted.tolist():
+        row = dist[i].copy()
+        row[load >= capacity] = np.inf
+        c = int(row.argmin())
+        labels[i] = c
+        load[c] += 1
+    return labels
+
+
+def partition_zones(
+    coords: Sequence[Tuple[float, float]],
+    k: int,
+    capacity_slack: float = 0.1,
+    iterations: int = 25,
+    seed: int = 0,
+) -> np.ndarray:
+    # Capacity-constrained k-means over lat/lng: returns a zone label in
+    # [0, k) per coordinate, with no zone larger than ceil(n/k * (1+slack)).
+    if k <= 0:
+        raise ValueError("k must be positive")
+    points = project_km(coords)
+    n = len(points)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    k = min(k, n)
+    capacity = max(1, math.ceil(n / k * (1.0 + max(0.0, capacity_slack))))
+    rng = np.random.default_rng(seed)
+
+    centroids = _kmeans_plus_plus(points, k, rng)
+    labels = np.full(n, -1, dtype=np.int64)
+    for _ in range(iterations):
+        new_labels = _capacitated_assign(_squared_distances(points, centroids), capacity)
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        counts = np.bincount(labels, minlength=k)
+        sums_x = np.bincount(labels, weights=points[:, 0], minlength=k)
+        sums_y = np.bincount(labels, weights=points[:, 1], minlength=k)
+        filled = counts > 0
+        centroids[filled, 0] = sums_x[filled] / counts[filled]
+        centroids[filled, 1] = sums_y[filled] / counts[filled]
+        for c in np.flatnonzero(~filled):
+            # Reseed an empty zone on the point worst served by its centroid
+            worst = int(((points - centroids[labels]) ** 2).sum(axis=1).argmax())
+            centroids[c] = points[worst]
+    return labels
+
+
+def extend_zones(
+    zone_coords: Sequence[Sequence[Tuple[float, float]]],
+    coords: Sequence[Tuple[float, float]],
+    capacity_slack: float = 0.1,
+) -> np.ndarray:
+    # Incremental counterpart of partition_zones: zone_coords holds the
+    # pickups each zone already has. Every new coordinate joins the zone
+    # whose centroid is nearest, with no zone growing past
+    # ceil(total/k * (1+slack)). Zones that are still empty are seeded on
+    # the new pickups farthest from every existing centroid.
+    k = len(zone_coords)
+    if k == 0:
+        raise ValueError("at least one zone is needed")
+    n = len(coords)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    existing = [point for zone in zone_coords for point in zone]
+    # One projection for old and new points so distances are comparable
+    points = project_km(list(coords) + existing)
+    new_points, old_points = points[:n], points[n:]
+    owners = np.repeat(np.arange(k), [len(zone) for zone in zone_coords])
+    load = np.bincount(owners, minlength=k)
+    if not load.any():
+        return partition_zones(coords, k, capacity_slack=capacity_slack)
+
+    centroids = np.zeros((k, 2))
+    filled = load > 0
+    centroids[filled, 0] = np.bincount(owners, weights=old_points[:, 0], minlength=k)[filled] / load[filled]
+    centroids[filled, 1] = np.bincount(owners, weights=old_points[:, 1], minlength=k)[filled] / load[filled]
+    closest = _squared_distances(new_points, centroids[filled]).min(axis=1)
+    for c in np.flatnonzero(~filled):
+        centroids[c] = new_points[int(closest.argmax())]
+        closest = np.minimum(closest, ((new_points - centroids[c]) ** 2).sum(axis=1))
+
+    capacity = max(1, math.ceil((n + len(existing)) / k * (1.0 + max(0.0, capacity_slack))))
+    return _capacitated_assign(_squared_distances(new_points, centroids), np.maximum(capacity - load, 0))
+
+
+async def get_active_collector_ids(db: AsyncSession) -> List[str]:
+    result = await db.execute(
+        select(User.id)
+        .filter(User.role == "collector", User.is_verified == True)
+        .order_by(User.id)
+    )
+    return list(result.scalars().all())
+
+
+def pickups_to_assign(rebalance: bool = False):
+    query = select(PickupRequest.id, PickupRequest.location)
+    if rebalance:
+        return query.filter(PickupRequest.status.in_(["pending", "assigned"]))
+    return query.filter(PickupRequest.status == "pending", PickupRequest.collector_id.is_(None))
+
+
+def assigned_pickups(collector_ids: List[str]):
+    # The pickups that make up each collector's current zone
+    return (
+        select(PickupRequest.collector_id, PickupRequest.location)
+        .filter(PickupRequest.collector_id.in_(collector_ids), PickupRequest.status == "assigned")
+    )
+
+
+async def current_zones(db: AsyncSession, collector_ids: List[str]) -> List[List[Tuple[float, float]]]:
+    zones = {collector_id: [] for collector_id in collector_ids}
+    for collector_id, location in (await db.execute(assigned_pickups(collector_ids))).all():
+        point = extract_coordinates(location)
+        if point is not None:
+            zones[collector_id].append(point)
+    return [zones[collector_id] for collector_id in collector_ids]
+
+
+def fallback_labels(load: Sequence[int], count: int) -> np.ndarray:
+    # Zones for pickups without coordinates: each goes to the least loaded
+    # collector at that point, so they are spread evenly and still served
+    load = np.asarray(load, dtype=np.int64).copy()
+    labels = np.empty(count, dtype=np.int64)
+    for i in range(count):
+        labels[i] = int(load.argmin())
+        load[labels[i]] += 1
+    return labels
+
+
+async def assign_pending_pickups(
+    db: AsyncSession, rebalance: bool = False, capacity_slack: float = 0.1, wait: bool = True,
+) -> Optional[dict]:
+    # Batch job: one geographic zone per active collector, written back as
+    # collector_id + status 'assigned'. A normal run only places new
+    # pickups, each in the nearest existing zone that has room
+    # (extend_zones), so collectors keep their areas between runs. With
+    # rebalance=True every pickup not yet collected is re-clustered.
+    # Pickups without coordinates go to the least loaded collectors.
+    # Runs are serialized across workers; with wait=False a run that finds
+    # another one in progress returns None instead of queueing behind it.
+    if db.bind.dialect.name == "postgresql":
+        lock = "pg_advisory_xact_lock" if wait else "pg_try_advisory_xact_lock"
+        acquired = (await db.execute(text(f"SELECT {lock}(:key)"), {"key": ASSIGN_LOCK_KEY})).scalar()
+        if acquired is False:
+            await db.rollback()
+            return None
+    collector_ids = await get_active_collector_ids(db)
+    if not collector_ids:
+        await db.commit()
+        return {"collectors": 0, "assigned": 0, "unlocated": 0, "zones": {}}
+
+    rows = (await db.execute(pickups_to_assign(rebalance))).all()
+
+    ids, coords, unlocated_ids = [], [], []
+    for pickup_id, location in rows:
+        point = extract_coordinates(location)
+        if point is None:
+            unlocated_ids.append(pickup_id)
+            continue
+        ids.append(pickup_id)
+        coords.append(point)
+
+    if rebalance:
+        labels = partition_zones(coords, len(collector_ids), capacity_slack=capacity_slack)
+        load = np.bincount(labels, minlength=len(collector_ids))
+    else:
+        existing = await current_zones(db, collector_ids)
+        labels = extend_zones(existing, coords, capacity_slack=capacity_slack)
+        load = np.bincount(labels, minlength=len(collector_ids)) + np.asarray([len(zone) for zone in existing])
+    ids += unlocated_ids
+    labels = np.concatenate((np.asarray(labels, dtype=np.int64), fallback_labels(load, len(unlocated_ids))))
+
+    zones = {}
+    for zone in np.unique(labels).tolist():
+        collector_id = collector_ids[zone]
+        zone_ids = [ids[i] for i in np.flatnonzero(labels == zone).tolist()]
+        zones[collector_id] = len(zone_ids)
+        for start in range(0, len(zone_ids), UPDATE_CHUNK):
+            await db.execute(
+                update(PickupRequest)
+                .where(
+                    PickupRequest.id.in_(zone_ids[start:start + UPDATE_CHUNK]),
+                    PickupRequest.status.in_(["pending", "assigned"]),
+                )
+                .values(collector_id=collector_id, status="assigned")
+                .execution_options(synchronize_session=False)
+            )
+    await db.commit()
+
+    return {"collectors": len(collector_ids), "assigned": len(ids), "unlocated": len(unlocated_ids), "zones": zones}
+
+
+class ZoneAssigner:
+    # Places new pickups in collector zones every ZONE_ASSIGN_INTERVAL
+    # seconds; collectors only see assigned pickups, so without this run a
+    # new pickup would wait for an admin to trigger assignment by hand
+
+    def __init__(self, interval: float = ZONE_ASSIGN_INTERVAL):
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+        self.last_result: Optional[dict] = None
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    def start(self):
+        if not self.running:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    async def _run(self):
+        while True:
+            try:
+                async with AsyncSessionLocal() as db:
+                    # Another worker's run covers this interval when busy
+                    result = await assign_pending_pickups(db, wait=False)
+                if result is not None:
+                    self.last_result = result
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Zone assignment failed")
+            await asyncio.sleep(self.interval)
+
+
+zone_assigner = ZoneAssigner()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, Boolean, DateTime, ForeignKey, JSON
+from sqlalchemy import and_, BigInteger, Column, String, Integer, Float, Boolean, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime
 import uuid
@@ -16,7 +16,8 @@ class User(Base):
     password = Column(String)
     role = Column(String)
     name = Column(String, nullable=True)
-    credit_points = Column(Integer, default=0)
+    credit_points = Column(Integer, default=0) # spendable balance, maintained by services.credits
+    credits_earned = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Verification & OTP
@@ -25,6 +26,16 @@ class User(Base):
     otp = Column(String, nullable=True)
     otp_expiry = Column(DateTime, nullable=True)
 
+    __table_args__ = (
+        Index("ix_users_created_at", "created_at", "id"),
+        Index("ix_users_role_credits_earned", "role", "credits_earned"),
+        # Admin verification queue
+        Index(
+            "ix_users_pending_verification", "created_at", "id",
+            postgresql_where=and_(id_photo_url.isnot(None), is_verified == False),
+        ),
+    )
+
 class UserSession(Base):
     __tablename__ = "sessions"
 
@@ -47,6 +58,8 @@ class Notification(Base):
     read = Column(Boolean, default=False)
     date = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (Index("ix_notifications_user_id_date", "user_id", "date", "id"),)
+
 class AuditLog(Base):
     __tablename__ = "audit_logs"
 
@@ -55,8 +68,12 @@ class AuditLog(Base):
     action = Column(String)
     endpoint = Column(String)
     ip_address = Column(String)
+    status_code = Column(Integer, nullable=True)
+    duration_ms = Column(Float, nullable=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (Index("ix_audit_logs_timestamp", "timestamp", "id"),)
+
 class CreditTransaction(Base):
     __tablename__ = "credit_transactions"
 
@@ -67,6 +84,8 @@ class CreditTransaction(Base):
     description = Column(String)
     date = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (Index("ix_credit_transactions_user_id_type", "user_id", "type"),)
+
 class Activity(Base):
     __tablename__ = "activities"
 
@@ -77,6 +96,8 @@ class Activity(Base):
     date = Column(DateTime, default=datetime.utcnow)
     impact_co2 = Column(Float, default=0.0)
 
+    __table_args__ = (Index("ix_activities_user_id_date", "user_id", "date", "id"),)
+
 class PickupRequest(Base):
     __tablename__ = "pickup_requests"
 
@@ -85,12 +106,21 @@ class PickupRequest(Base):
     waste_type = Column(String) # 'organic', 'recyclable', 'hazardous'
     amount_approx = Column(String) # '1 bag', '2-5 bags', 'truck load'
     location = Column(JSON) # {lat: float, lng: float, address: str}
+    lat = Column(Float, nullable=True) # copied from location by services.geo
+    lng = Column(Float, nullable=True)
     scheduled_date = Column(DateTime)
     status = Column(String, default="pending") # 'pending', 'assigned', 'completed', 'cancelled'
     request_date = Column(DateTime, default=datetime.utcnow)
     collected_at = Column(DateTime, nullable=True)
     collector_id = Column(String, ForeignKey("users.id"), nullable=True)
 
+    __table_args__ = (
+        Index("ix_pickup_requests_lat_lng", "lat", "lng"),
+        Index("ix_pickup_requests_collector_id_status", "collector_id", "status"),
+        # Pending pickups are a small, hot slice of the table
+        Index("ix_pickup_requests_pending", "request_date", postgresql_where=status == "pending"),
+    )
+
 class WasteReport(Base):
     __tablename__ = "waste_reports"
 
@@ -99,10 +129,17 @@ class WasteReport(Base):
     report_type = Column(String) # 'overflow', 'illegal_dumping', 'missed_pickup'
     description = Column(String)
     location = Column(JSON) # {lat: float, lng: float, address: str}
+    lat = Column(Float, nullable=True) # copied from location by services.geo
+    lng = Column(Float, nullable=True)
     image_url = Column(String, nullable=True)
     status = Column(String, default="reported") # 'reported', 'investigating', 'resolved'
     report_date = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("ix_waste_reports_lat_lng", "lat", "lng"),
+        Index("ix_waste_reports_report_date", "report_date", "id"),
+    )
+
 class Announcement(Base):
     __tablename__ = "announcements"
 
@@ -113,6 +150,8 @@ class Announcement(Base):
     target_role = Column(String, default="all") # 'all', 'citizen', 'collector'
     date = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (Index("ix_announcements_date", "date", "id"),)
+
 class Product(Base):
     __tablename__ = "products"
 
@@ -138,12 +177,69 @@ class Block(Base):
     __tablename__ = "blockchain"
 
     id = Column(String, primary_key=True, default=generate_uuid)
-    index = Column(Integer)
+    index = Column(Integer, unique=True, index=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
     transactions = Column(JSON)
     previous_hash = Column(String)
     hash = Column(String)
 
+class TokenBalance(Base):
+    __tablename__ = "token_balances"
+
+    # Projection of the chain, maintained by services.blockchain
+    address = Column(String, primary_key=True) # 'user_<id>'
+    balance = Column(Float, default=0.0)
+    last_block_index = Column(Integer, default=-1)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class StatsBucket(Base):
+    __tablename__ = "stats_buckets"
+
+    # Row counters maintained by services.stats: one 'total' row plus one
+    # row per 'day' and per 'week' (weeks start on Monday)
+    period = Column(String, primary_key=True) # 'total', 'day', 'week'
+    period_start = Column(DateTime, primary_key=True)
+    users = Column(Integer, default=0)
+    activities = Column(Integer, default=0)
+    pickup_requests = Column(Integer, default=0)
+    credits_spent = Column(Integer, default=0)
+    co2_saved = Column(Float, default=0.0)
+    collections = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class StatsDelta(Base):
+    __tablename__ = "stats_deltas"
+
+    # Counter increments journaled by write transactions (one row per
+    # bucket per flush, never updated), folded into stats_buckets in the
+    # background by services.stats
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    period = Column(String) # 'total', 'day', 'week'
+    period_start = Column(DateTime)
+    users = Column(Integer, default=0)
+    activities = Column(Integer, default=0)
+    pickup_requests = Column(Integer, default=0)
+    credits_spent = Column(Integer, default=0)
+    co2_saved = Column(Float, default=0.0)
+    collections = Column(Integer, default=0)
+
+    __table_args__ = (Index("ix_stats_deltas_period_start", "period", "period_start"),)
+
+class CarbonRollup(Base):
+    __tablename__ = "carbon_rollups"
+
+    # Per-user CO2 from activities, maintained by services.carbon: 'day'
+    # rows for recent activity, compacted into 'month' rows once a month is
+    # older than ROLLUP_DAILY_DAYS
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    period = Column(String, primary_key=True) # 'day', 'month'
+    period_start = Column(DateTime, primary_key=True)
+    co2 = Column(Float, default=0.0)
+    activities = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_carbon_rollups_period_start", "period", "period_start"),)
+
 class Order(Base):
     __tablename__ = "orders"
 
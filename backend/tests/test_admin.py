@@ -125,3 +125,58 @@ async def test_admin_access_denied_for_citizen():
         # Try to access admin stats
         response = await ac.get("/api/admin/stats", headers=headers)
         assert response.status_code == 403
+
+@pytest.mark.asyncio
+async def test_admin_audit_logs_cursor_pages(admin_token):
+    transport = ASGITransport(app=app)
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    from services.audit import audit_row, write_audit_rows
+    import time
+    await write_audit_rows([
+        audit_row({"method": "GET", "endpoint": "/api/test", "ip_address": "127.0.0.1", "timestamp": time.time() + i})
+        for i in range(5)
+    ])
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        first = await ac.get("/api/admin/audit-logs?limit=2", headers=headers)
+        assert first.status_code == 200
+        assert len(first.json()) == 2
+        cursor = first.headers["X-Next-Cursor"]
+        second = await ac.get("/api/admin/audit-logs", params={"limit": 2, "cursor": cursor}, headers=headers)
+        assert second.status_code == 200
+        assert first.json()[-1]["timestamp"] >= second.json()[0]["timestamp"]
+        assert first.json() != second.json()
+        bad = await ac.get("/api/admin/audit-logs?cursor=nonsense", headers=headers)
+        assert bad.status_code == 400
+
+@pytest.mark.asyncio
+async def test_admin_export_streams_rows(admin_token):
+    transport = ASGITransport(app=app)
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.get("/api/admin/export/users?format=ndjson", headers=headers)
+        assert response.status_code == 200
+        users = [json.loads(line) for line in response.text.splitlines()]
+        assert any(user["email"] == "admin@waste.com" for user in users)
+        assert all("password" not in user for user in users)
+        response = await ac.get("/api/admin/export/users?format=csv", headers=headers)
+        assert response.text.splitlines()[0].startswith("id,email")
+        response = await ac.get("/api/admin/export/users?format=xml", headers=headers)
+        assert response.status_code == 400
+
+@pytest.mark.asyncio
+async def test_chain_verification_is_admin_only_and_rate_capped(admin_token):
+    import services.blockchain as ledger
+    ledger.verify_limiter.last_started = None
+    transport = ASGITransport(app=app)
+    headers = {"Authorization": f"Bearer {admin_token}"}
+    async with AsyncClient(transport=transport, base_url="http://test") as ac:
+        response = await ac.get("/api/blockchain/verify")
+        assert response.status_code == 401
+
+        response = await ac.get("/api/blockchain/verify", params={"parallel": False}, headers=headers)
+        assert response.status_code == 200
+        assert "valid" in response.json()
+
+        response = await ac.get("/api/blockchain/verify", params={"parallel": False}, headers=headers)
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) > 0
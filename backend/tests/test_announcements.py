@@ -0,0 +1,63 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from services.announcements import announcement_message, decode_cursor, encode_cursor, missed_announcements
+from tables import Announcement
+
+
+class FakeResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    # Records the query; returns rows newest first, as the database would
+    def __init__(self, rows):
+        self.rows = rows
+        self.query = None
+
+    async def execute(self, query):
+        self.query = query
+        return FakeResult(self.rows)
+
+
+def announcement(i, role="all"):
+    return Announcement(id=f"id-{i}", title=f"t{i}", message="m", priority="normal", target_role=role, date=datetime(2026, 5, 1, 9, i))
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(announcement(3))
+    assert decode_cursor(cursor) == (datetime(2026, 5, 1, 9, 3), "id-3")
+    assert decode_cursor(None) is None
+    assert decode_cursor("garbage") is None
+
+
+def test_message_carries_cursor():
+    message = announcement_message(announcement(1, role=None))
+    assert message["target_role"] == "all"
+    assert decode_cursor(message["cursor"]) == (datetime(2026, 5, 1, 9, 1), "id-1")
+
+
+@pytest.mark.asyncio
+async def test_missed_announcements_after_cursor_for_role():
+    db = FakeSession([announcement(5), announcement(4, role="collector")])
+    items = await missed_announcements(db, "collector", decode_cursor(encode_cursor(announcement(3))), limit=10)
+    assert [item["id"] for item in items] == ["id-4", "id-5"]
+    sql = str(db.query.compile(dialect=postgresql.dialect()))
+    assert "announcements.target_role IN" in sql
+    assert "(announcements.date, announcements.id) >" in sql
+    assert "ORDER BY announcements.date DESC, announcements.id DESC" in sql
+
+
+@pytest.mark.asyncio
+async def test_first_connection_gets_latest_without_cursor():
+    db = FakeSession([])
+    assert await missed_announcements(db, "citizen", None) == []
+    assert ">" not in str(db.query.compile(dialect=postgresql.dialect()))
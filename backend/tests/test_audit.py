@@ -0,0 +1,57 @@
+import asyncio
+import time
+import pytest
+import services.audit as audit
+
+
+def entry(i):
+    return {"method": "POST", "endpoint": f"/api/test/{i}", "ip_address": "127.0.0.1", "user_id": None,
+            "status_code": 200, "duration": 0.012, "timestamp": time.time()}
+
+
+@pytest.fixture
+def written(monkeypatch):
+    batches = []
+
+    async def fake_write(rows):
+        batches.append(rows)
+
+    monkeypatch.setattr(audit, "write_audit_rows", fake_write)
+    return batches
+
+
+@pytest.mark.asyncio
+async def test_audit_writer_batches_rows(written):
+    writer = audit.AuditLogWriter(queue_size=100, batch_size=10, flush_interval=0.05)
+    writer.start()
+    for i in range(25):
+        assert writer.submit(entry(i))
+    await asyncio.sleep(0.2)
+    await writer.stop()
+    assert sum(len(batch) for batch in written) == 25
+    assert max(len(batch) for batch in written) <= 10
+    assert written[0][0]["status_code"] == 200
+    assert written[0][0]["duration_ms"] == 12.0
+
+
+@pytest.mark.asyncio
+async def test_audit_writer_drops_when_full_and_flushes_on_stop(written):
+    writer = audit.AuditLogWriter(queue_size=5, batch_size=100, flush_interval=10)
+    accepted = [writer.submit(entry(i)) for i in range(8)]
+    assert accepted.count(True) == 5
+    assert writer.dropped == 3
+    await writer.stop()
+    assert sum(len(batch) for batch in written) == 5
+
+
+@pytest.mark.asyncio
+async def test_audit_writer_stops_while_a_row_arrives(written):
+    writer = audit.AuditLogWriter(queue_size=100, batch_size=100, flush_interval=10)
+    writer.start()
+    writer.submit(entry(0))
+    await asyncio.sleep(0.01)
+    # The task holds row 0 and is waiting for more when row 1 and stop() land
+    writer.submit(entry(1))
+    await asyncio.wait_for(writer.stop(), 1)
+    assert [len(batch) for batch in written] == [2]
+    assert not writer.running
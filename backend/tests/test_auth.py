@@ -41,3 +41,18 @@ async def test_health_check():
         response = await ac.get("/")
     assert response.status_code == 200
     assert response.json() == {"message": "Welcome to Waste Management API"}
+
+@pytest.mark.asyncio
+async def test_password_pool_sheds_load_when_saturated(monkeypatch):
+    """Hashing beyond the queue limit fails fast with 503 instead of queueing"""
+    import utils
+    from fastapi import HTTPException
+    monkeypatch.setattr(utils, "PASSWORD_HASH_QUEUE_LIMIT", 2)
+    hashed = utils.get_password_hash("citizen123")
+    results = await asyncio.gather(
+        *(utils.verify_password_async("citizen123", hashed) for _ in range(4)),
+        return_exceptions=True
+    )
+    assert results.count(True) == 2
+    shed = [r for r in results if isinstance(r, HTTPException)]
+    assert len(shed) == 2 and shed[0].status_code == 503
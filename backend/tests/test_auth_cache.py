@@ -0,0 +1,110 @@
+import asyncio
+import functools
+import json
+import time
+
+import pytest
+from routes.realtime import ConnectionManager
+from services.auth_cache import CHANGE_LOG_SIZE, UserCache, token_digest, user_cache
+from services.pubsub import LocalBroker, PubSub
+
+
+def user(user_id, role="citizen"):
+    return {"id": user_id, "email": f"{user_id}@waste.com", "role": role}
+
+
+def test_user_cache_hit_requires_validated_token():
+    cache = UserCache(maxsize=10, ttl=60)
+    cache.put("a@waste.com", "token-1", user("a"))
+    assert cache.get("a@waste.com", "token-1")["id"] == "a"
+    # Same user, but this token was never checked against a session
+    assert cache.get("a@waste.com", "token-2") is None
+
+
+def test_user_cache_revocation_and_invalidation():
+    cache = UserCache(maxsize=10, ttl=60)
+    cache.put("a@waste.com", "token-1", user("a"))
+    cache.put("a@waste.com", "token-2", user("a"))
+    cache.revoke_token("token-1")
+    assert cache.get("a@waste.com", "token-1") is None
+    assert cache.get("a@waste.com", "token-2") is not None
+
+    cache.invalidate_user("a")
+    assert cache.get("a@waste.com", "token-2") is None
+    assert len(cache) == 0
+
+
+def test_user_cache_skips_lookups_raced_by_a_change():
+    cache = UserCache(maxsize=10, ttl=60)
+    # The token is revoked while its session row is being read
+    generation = cache.generation
+    cache.revoke_token("token-1")
+    cache.put("a@waste.com", "token-1", user("a"), generation)
+    assert cache.get("a@waste.com", "token-1") is None
+
+    # Same for the user being invalidated; unrelated changes don't matter
+    generation = cache.generation
+    cache.invalidate_user("a")
+    cache.revoke_token("token-9")
+    cache.put("a@waste.com", "token-2", user("a"), generation)
+    assert cache.get("a@waste.com", "token-2") is None
+    generation = cache.generation
+    cache.invalidate_user("b")
+    cache.put("a@waste.com", "token-2", user("a"), generation)
+    assert cache.get("a@waste.com", "token-2") is not None
+
+    # Too many changes since to tell: not cached
+    generation = cache.generation
+    for i in range(CHANGE_LOG_SIZE + 1):
+        cache.revoke_token(f"other-{i}")
+    cache.put("a@waste.com", "token-3", user("a"), generation)
+    assert cache.get("a@waste.com", "token-3") is None
+
+
+def test_user_cache_ttl_and_lru():
+    cache = UserCache(maxsize=2, ttl=0.05)
+    cache.put("a@waste.com", "ta", user("a"))
+    cache.put("b@waste.com", "tb", user("b"))
+    cache.get("a@waste.com", "ta")
+    cache.put("c@waste.com", "tc", user("c"))
+    # b was least recently used
+    assert cache.get("b@waste.com", "tb") is None
+    assert cache.get("a@waste.com", "ta") is not None
+    time.sleep(0.06)
+    assert cache.get("a@waste.com", "ta") is None
+
+
+@pytest.mark.asyncio
+async def test_revocation_reaches_other_workers():
+    broker = LocalBroker()
+    caches = []
+    for _ in range(2):
+        cache = UserCache(maxsize=10, ttl=60)
+        pubsub = PubSub(lambda target, message, cache=cache: cache.apply_message(message), broker.backend(), batch_ms=1)
+        await pubsub.start()
+        cache.publish = functools.partial(pubsub.publish, "auth")
+        cache.put("a@waste.com", "token-1", user("a"))
+        cache.put("a@waste.com", "token-2", user("a"))
+        caches.append((cache, pubsub))
+    (first, _), (second, _) = caches
+
+    first.revoke_token("token-1")
+    # Applied on the revoking worker at once
+    assert first.get("a@waste.com", "token-1") is None
+    await asyncio.sleep(0.02)
+    assert second.get("a@waste.com", "token-1") is None
+    assert second.get("a@waste.com", "token-2") is not None
+
+    second.invalidate_user("a")
+    await asyncio.sleep(0.02)
+    assert first.get("a@waste.com", "token-2") is None
+    for _, pubsub in caches:
+        await pubsub.stop()
+
+
+def test_realtime_routes_auth_messages_to_the_cache():
+    manager = ConnectionManager()
+    user_cache.put("b@waste.com", "token-b", user("b"))
+    manager.deliver_local("auth", json.dumps({"revoke_token": token_digest("token-b")}))
+    assert user_cache.get("b@waste.com", "token-b") is None
+    user_cache.clear()
@@ -0,0 +1,295 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.pool import NullPool
+
+from httpx import ASGITransport, AsyncClient
+
+from database import DATABASE_URL, get_db
+from main import app
+from services.blockchain import (
+    GENESIS_PREVIOUS_HASH, MINT_ADDRESS, MintBatcher, append_block, check_mint, get_token_balance, transaction_deltas,
+    user_address,
+)
+from tables import Base, Block, User
+
+
+def test_transaction_deltas_mint_and_transfer():
+    alice, bob = user_address("alice"), user_address("bob")
+    deltas = transaction_deltas([
+        {"from": MINT_ADDRESS, "to": alice, "amount": 10, "type": "MINT"},
+        {"from": alice, "to": bob, "amount": 2.5, "type": "TRANSFER"},
+    ])
+    assert deltas == {alice: 7.5, bob: 2.5}
+    assert MINT_ADDRESS not in deltas
+
+
+def test_transaction_deltas_accumulates_across_blocks():
+    alice = user_address("alice")
+    deltas = transaction_deltas([{"from": MINT_ADDRESS, "to": alice, "amount": 5}])
+    transaction_deltas([{"from": MINT_ADDRESS, "to": alice, "amount": "5"}], deltas)
+    transaction_deltas(None, deltas)
+    assert deltas[alice] == 10.0
+
+
+def make_chain(length):
+    from datetime import datetime, timedelta
+    from services.blockchain import GENESIS_PREVIOUS_HASH, block_hash
+    rows, previous = [], GENESIS_PREVIOUS_HASH
+    start = datetime(2024, 1, 1)
+    for index in range(length):
+        timestamp = start + timedelta(minutes=index)
+        transactions = [{"from": MINT_ADDRESS, "to": user_address(str(index)), "amount": index, "type": "MINT"}]
+        current = block_hash(index, timestamp, transactions, previous)
+        rows.append((index, timestamp, transactions, previous, current))
+        previous = current
+    return rows
+
+
+def test_verify_chunk_accepts_valid_chain():
+    from services.blockchain import verify_chunk
+    assert verify_chunk(make_chain(20)) is None
+
+
+def test_verify_chunk_reports_first_broken_block():
+    from services.blockchain import verify_chunk
+    rows = make_chain(20)
+    index, timestamp, transactions, previous, current = rows[7]
+    rows[7] = (index, timestamp, [{"from": MINT_ADDRESS, "to": "user_x", "amount": 1000}], previous, current)
+    assert verify_chunk(rows) == (7, "hash mismatch")
+
+    rows = make_chain(20)
+    del rows[5]
+    assert verify_chunk(rows)[0] == 6
+
+
+def test_verify_limiter_caps_runs():
+    from services.blockchain import VerifyLimiter
+    limiter = VerifyLimiter(min_interval=60)
+    assert limiter.acquire() == 0
+    # Still running
+    assert limiter.acquire() >= 1
+    limiter.release()
+    # Finished, but started less than min_interval ago
+    assert 0 < limiter.acquire() <= 60
+    limiter.last_started -= 61
+    assert limiter.acquire() == 0
+
+
+class RecordingBatcher(MintBatcher):
+    # Records batches instead of writing blocks
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.batches = []
+
+    async def _append(self, transactions):
+        self.batches.append([tx["amount"] for tx in transactions])
+        return f"block-{len(self.batches)}"
+
+
+def mint(amount, to=user_address("alice")):
+    return {"from": MINT_ADDRESS, "to": to, "amount": amount, "type": "MINT"}
+
+
+@pytest.mark.asyncio
+async def test_mint_batcher_flushes_on_size():
+    batcher = RecordingBatcher(max_batch=3, max_delay=10)
+    batcher.start()
+    hashes = await asyncio.wait_for(asyncio.gather(*[batcher.submit(mint(i + 1)) for i in range(6)]), 1)
+    assert batcher.batches == [[1, 2, 3], [4, 5, 6]]
+    assert hashes == ["block-1"] * 3 + ["block-2"] * 3
+    await batcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_mint_batcher_flushes_on_interval():
+    batcher = RecordingBatcher(max_batch=100, max_delay=0.05)
+    batcher.start()
+    first = asyncio.ensure_future(batcher.submit(mint(1)))
+    await asyncio.sleep(0.01)
+    second = asyncio.ensure_future(batcher.submit(mint(2)))
+    assert await asyncio.wait_for(asyncio.gather(first, second), 1) == ["block-1", "block-1"]
+    assert batcher.batches == [[1, 2]]
+    await batcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_mint_batcher_flushes_on_stop():
+    batcher = RecordingBatcher(max_batch=100, max_delay=10)
+    batcher.start()
+    # Taken off the queue and waiting for more when stop() is called
+    first = asyncio.ensure_future(batcher.submit(mint(1)))
+    await asyncio.sleep(0.01)
+    second = asyncio.ensure_future(batcher.submit(mint(2)))
+    await asyncio.sleep(0)
+    await asyncio.wait_for(batcher.stop(), 1)
+    assert await asyncio.wait_for(asyncio.gather(first, second), 1) == ["block-1", "block-1"]
+    assert batcher.batches == [[1, 2]] and not batcher.running
+
+
+@pytest.mark.asyncio
+async def test_mint_batcher_flushes_held_batch_on_cancellation():
+    batcher = RecordingBatcher(max_batch=100, max_delay=10)
+    batcher.start()
+    first = asyncio.ensure_future(batcher.submit(mint(1)))
+    await asyncio.sleep(0.01)
+    batcher.task.cancel()
+    assert await asyncio.wait_for(first, 1) == "block-1"
+    with pytest.raises(asyncio.CancelledError):
+        await batcher.task
+
+
+@pytest.mark.parametrize("transaction", [
+    mint("10"), mint(0), mint(-5), mint(float("nan")), mint(float("inf")), mint(True), mint(None), mint(5, to=None), mint(5, to="user_"),
+])
+def test_check_mint_rejects_malformed(transaction):
+    with pytest.raises(ValueError):
+        check_mint(transaction)
+
+
+@pytest.mark.asyncio
+async def test_mint_batcher_drops_only_the_malformed_mint():
+    batcher = RecordingBatcher(max_batch=3, max_delay=10)
+    batcher.start()
+    results = await asyncio.wait_for(asyncio.gather(
+        batcher.submit(mint(1)), batcher.submit(mint("oops")), batcher.submit(mint(2)), return_exceptions=True,
+    ), 1)
+    await batcher.stop()
+    assert results[0] == results[2] == "block-1"
+    assert isinstance(results[1], ValueError)
+    assert batcher.batches == [[1, 2]] and batcher.transactions_written == 2
+
+
+SCHEMA = "blockchain_check"
+
+
+async def run_appends() -> dict:
+    admin = create_async_engine(DATABASE_URL, poolclass=NullPool)
+    engine = create_async_engine(DATABASE_URL, poolclass=NullPool, connect_args={"server_settings": {"search_path": SCHEMA}})
+    try:
+        async with admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        result = {}
+
+        async def append(amount):
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                block = await append_block(db, [mint(amount)])
+                await db.commit()
+                return block
+
+        # A writer that bypasses the advisory lock takes index 0 first; the
+        # append waits on the unique index, fails once and retries at 1
+        async with engine.connect() as other:
+            await other.execute(text(
+                "INSERT INTO blockchain (id, index, timestamp, transactions, previous_hash, hash) "
+                "VALUES ('rogue', 0, now(), '[]', :genesis, 'rogue-hash')"
+            ), {"genesis": GENESIS_PREVIOUS_HASH})
+            pending = asyncio.ensure_future(append(5))
+            await asyncio.sleep(0.3)
+            await other.commit()
+        retried = await pending
+        result["retried"] = (retried.index, retried.previous_hash)
+
+        blocks = [await append(amount) for amount in (1, 2)]
+        result["indexes"] = [block.index for block in blocks]
+        result["links"] = blocks[1].previous_hash == blocks[0].hash
+
+        async with AsyncSession(engine) as db:
+            db.add(Block(index=1, timestamp=datetime.utcnow(), transactions=[], previous_hash="x", hash="dup"))
+            try:
+                await db.commit()
+                result["duplicate_rejected"] = False
+            except IntegrityError:
+                result["duplicate_rejected"] = True
+                await db.rollback()
+            result["balance"] = await get_token_balance(db, user_address("alice"))
+        async with admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+        return result
+    finally:
+        await engine.dispose()
+        await admin.dispose()
+
+
+def test_append_block_retries_after_index_conflict():
+    try:
+        result = asyncio.run(run_appends())
+    except (OSError, ConnectionError) as error:
+        pytest.skip(f"Postgres not reachable: {error}")
+    assert result["retried"] == (1, "rogue-hash")
+    assert result["indexes"] == [2, 3] and result["links"]
+    assert result["duplicate_rejected"]
+    assert result["balance"] == 8.0
+
+
+async def run_mint_routes() -> dict:
+    admin = create_async_engine(DATABASE_URL, poolclass=NullPool)
+    engine = create_async_engine(DATABASE_URL, poolclass=NullPool, connect_args={"server_settings": {"search_path": SCHEMA}})
+
+    async def scratch_db():
+        # Like AsyncSessionLocal
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            yield session
+
+    def call(function, params):
+        return client.post("/api/blockchain/smart-contract/execute", json={"contract_address": "wiis", "function": function, "params": params})
+
+    try:
+        async with admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine) as db:
+            db.add(User(id="alice", email="alice@example.com", role="citizen"))
+            await db.commit()
+
+        app.dependency_overrides[get_db] = scratch_db
+        try:
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+                rejected = [
+                    await call("mintReward", {"user_id": "alice", "amount": "ten"}),
+                    await call("mintReward", {"user_id": "alice", "amount": -3}),
+                    await call("mintReward", {"user_id": "mallory", "amount": 3}),
+                    await call("mintReward", {"amount": 3}),
+                    await call("mintRewardBatch", {"rewards": [{"user_id": "alice", "amount": 2}, {"user_id": "alice", "amount": 0}]}),
+                ]
+                accepted = await call("mintRewardBatch", {"rewards": [{"user_id": "alice", "amount": 2}, {"user_id": "alice", "amount": 3}]})
+        finally:
+            app.dependency_overrides.clear()
+
+        async with AsyncSession(engine) as db:
+            blocks = (await db.execute(select(func.count()).select_from(Block))).scalar()
+            balance = await get_token_balance(db, user_address("alice"))
+        async with admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+        return {
+            "rejected": [(response.status_code, response.json()["detail"]) for response in rejected],
+            "accepted": accepted.status_code,
+            "blocks": blocks,
+            "balance": balance,
+        }
+    finally:
+        await engine.dispose()
+        await admin.dispose()
+
+
+def test_mint_routes_reject_malformed_rewards():
+    try:
+        result = asyncio.run(run_mint_routes())
+    except (OSError, ConnectionError) as error:
+        pytest.skip(f"Postgres not reachable: {error}")
+    statuses = [status for status, _ in result["rejected"]]
+    assert statuses == [400] * 5
+    assert result["rejected"][2][1] == "Unknown user_id: mallory"
+    assert result["accepted"] == 200
+    # Only the valid batch was written
+    assert (result["blocks"], result["balance"]) == (1, 5.0)
@@ -0,0 +1,64 @@
+from datetime import datetime
+
+from sqlalchemy.dialects import postgresql
+from services.carbon import _increment_statement, compacted_before, fold, period_start, rollup_deltas
+from tables import Activity, CreditTransaction
+
+NOW = datetime(2026, 6, 20, 12, 0)
+RECENT = datetime(2026, 6, 18, 9, 30)
+OLD = datetime(2026, 1, 10, 8, 0)
+
+
+def test_boundary_is_a_month_start():
+    assert period_start("month", RECENT) == datetime(2026, 6, 1)
+    assert compacted_before(NOW) == datetime(2026, 3, 1)
+
+
+def test_deltas_bucket_recent_by_day_and_old_by_month():
+    deltas = rollup_deltas([
+        Activity(user_id="u1", impact_co2=2.0, date=RECENT),
+        Activity(user_id="u1", impact_co2=1.5, date=RECENT),
+        Activity(user_id="u1", impact_co2=4.0, date=OLD),
+        Activity(user_id="u2", impact_co2=0.0, date=RECENT),
+        Activity(user_id=None, impact_co2=3.0, date=RECENT),
+        CreditTransaction(user_id="u1", amount=10, type="earned"),
+    ], now=NOW)
+    assert deltas == {
+        ("u1", "day", datetime(2026, 6, 18)): [3.5, 2],
+        ("u1", "month", datetime(2026, 1, 1)): [4.0, 1],
+    }
+
+
+def test_deleted_activities_subtract():
+    activity = Activity(user_id="u1", impact_co2=2.0, date=RECENT)
+    assert rollup_deltas([], [activity], now=NOW) == {("u1", "day", datetime(2026, 6, 18)): [-2.0, -1]}
+    assert rollup_deltas([activity], [Activity(user_id="u1", impact_co2=2.0, date=RECENT)], now=NOW) == {}
+
+
+def test_increment_statement_adds_to_existing_rows():
+    deltas = rollup_deltas([Activity(user_id="u1", impact_co2=2.0, date=RECENT)], now=NOW)
+    sql = str(_increment_statement(deltas).compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (user_id, period, period_start) DO UPDATE" in sql
+    assert "co2 = (carbon_rollups.co2 + excluded.co2)" in sql
+
+
+def test_fold_to_weeks_keeps_months_whole():
+    rows = [
+        ("month", datetime(2026, 1, 1), 10.0, 4),
+        ("day", datetime(2026, 6, 15), 1.0, 1),  # Monday
+        ("day", datetime(2026, 6, 18), 2.5, 2),
+        ("day", datetime(2026, 6, 22), 0.5, 1),
+    ]
+    assert fold(rows, "week") == [
+        {"date": "2026-01-01", "co2": 10.0, "activities": 4, "period": "month"},
+        {"date": "2026-06-15", "co2": 3.5, "activities": 3, "period": "week"},
+        {"date": "2026-06-22", "co2": 0.5, "activities": 1, "period": "week"},
+    ]
+    assert fold(rows, "month")[1] == {"date": "2026-06-01", "co2": 4.0, "activities": 4, "period": "month"}
+    assert [point["date"] for point in fold(rows, "day")] == ["2026-01-01", "2026-06-15", "2026-06-18", "2026-06-22"]
+
+
+def test_fold_merges_month_rows_with_uncompacted_days():
+    # Days of a month that has crossed the boundary but not been compacted yet
+    rows = [("month", datetime(2026, 2, 1), 1.0, 1), ("day", datetime(2026, 2, 3), 2.0, 1)]
+    assert fold(rows, "month") == [{"date": "2026-02-01", "co2": 3.0, "activities": 2, "period": "month"}]
@@ -0,0 +1,99 @@
+import asyncio
+import io
+import time
+import numpy as np
+import pytest
+from PIL import Image
+from services.classifier import CATEGORIES, ClassificationService, ClassifierBackend, NumpyClassifier
+
+
+class RecordingBackend(ClassifierBackend):
+    def __init__(self):
+        self.batches = []
+
+    def predict_batch(self, images):
+        self.batches.append(len(images))
+        return [("Organic", 0.9) for _ in images]
+
+
+def png(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_uploads_share_inference_calls():
+    backend = RecordingBackend()
+    service = ClassificationService(backend, max_batch=16, max_wait_ms=20)
+    await service.start()
+    results = await asyncio.gather(*(service.classify(b"img") for _ in range(40)))
+    await service.stop()
+    assert results == [("Organic", 0.9)] * 40
+    assert sum(backend.batches) == 40
+    assert max(backend.batches) <= 16
+    assert len(backend.batches) < 40
+
+
+@pytest.mark.asyncio
+async def test_numpy_backend_isolates_unreadable_upload(tmp_path):
+    model_path = tmp_path / "model.npz"
+    features = NumpyClassifier.image_size ** 2 * 3
+    weights = np.zeros((features, len(CATEGORIES)))
+    weights[:, 1] = 1.0 # always "Recyclable"
+    np.savez(model_path, W=weights, b=np.zeros(len(CATEGORIES)))
+
+    service = ClassificationService(NumpyClassifier(str(model_path)), max_batch=8, max_wait_ms=20)
+    await service.start()
+    good, bad = await asyncio.gather(service.classify(png("green")), service.classify(b"not an image"), return_exceptions=True)
+    await service.stop()
+    assert good[0] == "Recyclable"
+    assert isinstance(bad, Exception)
+
+
+@pytest.mark.asyncio
+async def test_stop_finishes_the_current_batch():
+    backend = RecordingBackend()
+    service = ClassificationService(backend, max_batch=16, max_wait_ms=1000)
+    await service.start()
+    requests = [asyncio.ensure_future(service.classify(b"img")) for _ in range(3)]
+    await asyncio.sleep(0.01)
+    await asyncio.wait_for(service.stop(), 1)
+    assert await asyncio.gather(*requests) == [("Organic", 0.9)] * 3
+    assert not service.running
+
+
+@pytest.mark.asyncio
+async def test_batching_keeps_throughput_at_moderate_concurrency(tmp_path):
+    # Decoding dominates; it runs per upload before batching, so the batched
+    # service must keep up with one inference call per upload
+    model_path = tmp_path / "model.npz"
+    features = NumpyClassifier.image_size ** 2 * 3
+    np.savez(model_path, W=np.zeros((features, len(CATEGORIES))), b=np.zeros(len(CATEGORIES)))
+    rng = np.random.default_rng(0)
+    images = []
+    for _ in range(96):
+        buffer = io.BytesIO()
+        Image.fromarray(rng.integers(0, 255, (224, 224, 3), dtype=np.uint8)).save(buffer, format="JPEG")
+        images.append(buffer.getvalue())
+
+    async def throughput(service):
+        semaphore = asyncio.Semaphore(8)
+
+        async def one(image):
+            async with semaphore:
+                await service.classify(image)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(image) for image in images))
+        return len(images) / (time.perf_counter() - started)
+
+    unbatched = ClassificationService(NumpyClassifier(str(model_path)))
+    await unbatched.load()
+    batched = ClassificationService(NumpyClassifier(str(model_path)))
+    await batched.start()
+    # Best of three to ride out scheduler noise
+    plain = max([await throughput(unbatched) for _ in range(3)])
+    pooled = max([await throughput(batched) for _ in range(3)])
+    await batched.stop()
+    assert pooled >= plain * 0.8
@@ -0,0 +1,81 @@
+# verify_pickup against Postgres in a scratch schema: concurrent
+# verifications of one pickup award credits once. Needs DATABASE_URL;
+# skipped when Postgres can't be reached.
+import asyncio
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.pool import NullPool
+
+from database import DATABASE_URL, get_db
+from main import app
+from tables import Base, CreditTransaction, PickupRequest, User
+from utils import get_current_user
+
+SCHEMA = "collector_check"
+
+
+async def run_verifications() -> dict:
+    admin = create_async_engine(DATABASE_URL, poolclass=NullPool)
+    engine = create_async_engine(DATABASE_URL, poolclass=NullPool, connect_args={"server_settings": {"search_path": SCHEMA}})
+
+    async def scratch_db():
+        async with AsyncSession(engine) as session:
+            yield session
+
+    try:
+        async with admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine) as db:
+            db.add_all([
+                User(id="c1", email="c1@example.com", role="collector"),
+                User(id="u1", email="u1@example.com", role="citizen", credit_points=0, credits_earned=0),
+            ])
+            await db.commit()
+            db.add(PickupRequest(id="p1", user_id="u1", waste_type="recyclable", status="assigned", collector_id="c1"))
+            await db.commit()
+
+        app.dependency_overrides[get_db] = scratch_db
+        app.dependency_overrides[get_current_user] = lambda: User(id="c1", email="c1@example.com", role="collector")
+        try:
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+                responses = await asyncio.gather(*[client.post("/api/collector/verify-pickup/p1") for _ in range(5)])
+                missing = await client.post("/api/collector/verify-pickup/nope")
+        finally:
+            app.dependency_overrides.clear()
+
+        async with AsyncSession(engine) as db:
+            earned = (await db.execute(select(CreditTransaction.amount).filter(CreditTransaction.user_id == "u1"))).scalars().all()
+            balance = (await db.execute(select(User.credit_points).filter(User.id == "u1"))).scalar()
+            status = (await db.execute(select(PickupRequest.status).filter(PickupRequest.id == "p1"))).scalar()
+        async with admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+        return {
+            "statuses": sorted(response.status_code for response in responses),
+            "details": {response.json().get("detail") for response in responses if response.status_code != 200},
+            "missing": (missing.status_code, missing.json()["detail"]),
+            "earned": earned,
+            "balance": balance,
+            "status": status,
+        }
+    finally:
+        await engine.dispose()
+        await admin.dispose()
+
+
+def test_concurrent_verifications_award_credits_once():
+    try:
+        result = asyncio.run(run_verifications())
+    except (OSError, ConnectionError) as error:
+        pytest.skip(f"Postgres not reachable: {error}")
+    assert result["statuses"] == [200, 404, 404, 404, 404]
+    assert result["details"] == {"Pickup already collected"}
+    assert result["missing"] == (404, "Pickup not found")
+    assert result["earned"] == [20] and result["balance"] == 20
+    assert result["status"] == "collected"
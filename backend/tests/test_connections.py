@@ -0,0 +1,98 @@
+import asyncio
+import pytest
+from routes.realtime import ConnectionManager
+from services.connections import ClientConnection
+
+
+class FakeSocket:
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.sent = []
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        if self.fail:
+            raise RuntimeError("socket is gone")
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_slow_client_does_not_delay_others():
+    manager = ConnectionManager()
+    slow = FakeSocket(delay=1.0)
+    fast = [FakeSocket() for _ in range(20)]
+    await manager.connect(slow, "collector_slow")
+    for i, socket in enumerate(fast):
+        await manager.connect(socket, f"collector_{i}")
+
+    await manager.broadcast_to_collectors("pickup")
+    await asyncio.sleep(0.05)
+    assert all(socket.sent == ["pickup"] for socket in fast)
+    assert slow.sent == []
+    for connection in list(manager.collector_connections):
+        manager.disconnect(connection)
+    assert manager.connection_count() == 0
+
+
+@pytest.mark.asyncio
+async def test_drop_oldest_keeps_newest_messages():
+    socket = FakeSocket(delay=0.05)
+    connection = ClientConnection(socket, "admin_1", "admin", queue_size=2, policy="drop_oldest")
+    for i in range(6):
+        assert connection.send(str(i))
+    await asyncio.sleep(0.2)
+    assert socket.sent == ["4", "5"]
+    assert connection.dropped == 4
+    connection.close()
+
+
+@pytest.mark.asyncio
+async def test_slow_and_failed_connections_are_pruned():
+    manager = ConnectionManager()
+    await manager.connect(FakeSocket(fail=True), "admin_broken")
+    stalled = FakeSocket(delay=10.0)
+    connection = await manager.connect(stalled, "citizen_1")
+    connection.queue = asyncio.Queue(maxsize=1)
+    connection.policy = "disconnect"
+
+    await manager.broadcast_to_admins("stats")
+    for _ in range(3):
+        await manager.send_personal_message("pickup update", "citizen_1")
+    await asyncio.sleep(0.05)
+    assert manager.admin_connections == []
+    assert manager.active_connections == {}
+    assert stalled.closed
+
+
+@pytest.mark.asyncio
+async def test_reconnect_replaces_previous_socket():
+    manager = ConnectionManager()
+    old, new = FakeSocket(), FakeSocket()
+    await manager.connect(old, "citizen_7")
+    await manager.connect(new, "citizen_7")
+    await manager.send_personal_message("hello", "citizen_7")
+    await asyncio.sleep(0.01)
+    assert old.closed and new.sent == ["hello"]
+    assert manager.connection_count() == 1
+    manager.disconnect(manager.active_connections["citizen_7"])
+
+
+@pytest.mark.asyncio
+async def test_stuck_send_times_out(monkeypatch):
+    monkeypatch.setattr("services.connections.WATCHDOG_INTERVAL", 0.02)
+    socket = FakeSocket(delay=10.0)
+    closed = []
+    connection = ClientConnection(socket, "collector_1", "collector", on_close=closed.append, send_timeout=0.05)
+    connection.send("route")
+    await asyncio.sleep(0.2)
+    assert closed == [connection] and socket.closed
+    assert not connection.send("another")
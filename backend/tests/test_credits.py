@@ -0,0 +1,168 @@
+# Credit balances against Postgres in a scratch schema: the conditional
+# decrement in spend_credits, concurrent orders and reconcile_balances.
+# Needs DATABASE_URL; skipped when Postgres can't be reached.
+import asyncio
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.pool import NullPool
+
+from database import DATABASE_URL, get_db
+from main import app
+from services.credits import get_balance, reconcile_balances, spend_credits
+from tables import Base, CreditTransaction, Product, User
+from utils import get_current_user
+
+SCHEMA = "credits_check"
+
+
+async def spends(engine) -> dict:
+    result = {}
+    async with AsyncSession(engine, expire_on_commit=False) as db:
+        db.add_all([
+            User(id="u1", email="u1@example.com", role="citizen", credit_points=100, credits_earned=100),
+            User(id="u2", email="u2@example.com", role="citizen", credit_points=100, credits_earned=100),
+        ])
+        await db.commit()
+
+        result["spent"] = await spend_credits(db, "u1", 30, "Purchase")
+        await db.commit()
+        result["insufficient"] = await spend_credits(db, "u1", 500, "Too much")
+        await db.rollback()
+        for amount in (0, -50):
+            with pytest.raises(ValueError):
+                await spend_credits(db, "u1", amount, "Refund in disguise")
+        result["u1_balance"] = await get_balance(db, "u1")
+        result["u1_ledger"] = (await db.execute(
+            select(CreditTransaction.amount, CreditTransaction.type).filter(CreditTransaction.user_id == "u1")
+        )).all()
+
+    # Two orders of 60 against a balance of 100: the second waits on the
+    # first one's row lock, then finds 40 left
+    async with AsyncSession(engine) as first, AsyncSession(engine) as second:
+        result["first"] = await spend_credits(first, "u2", 60, "Order A")
+        competing = asyncio.ensure_future(spend_credits(second, "u2", 60, "Order B"))
+        await asyncio.sleep(0.3)
+        result["second_waited"] = not competing.done()
+        await first.commit()
+        result["second"] = await competing
+        await second.rollback()
+    async with AsyncSession(engine) as db:
+        result["u2_balance"] = await get_balance(db, "u2")
+        result["u2_spends"] = (await db.execute(
+            select(CreditTransaction.amount).filter(CreditTransaction.user_id == "u2", CreditTransaction.type == "spent")
+        )).scalars().all()
+    return result
+
+
+async def order_route(engine) -> dict:
+    # place_order turns an insufficient balance or a non-positive quantity
+    # into a 400
+    async with AsyncSession(engine) as db:
+        db.add(Product(id="p1", name="Compost bin", cost=1000, stock=5))
+        await db.commit()
+
+    async def scratch_db():
+        async with AsyncSession(engine) as session:
+            yield session
+
+    app.dependency_overrides[get_db] = scratch_db
+    app.dependency_overrides[get_current_user] = lambda: User(id="u1", email="u1@example.com", role="citizen")
+    try:
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+            response = await client.post("/api/marketplace/order", json={"product_id": "p1", "quantity": 1})
+            refused = [
+                (await client.post("/api/marketplace/order", json={"product_id": "p1", "quantity": quantity})).status_code
+                for quantity in (0, -3)
+            ]
+    finally:
+        app.dependency_overrides.clear()
+    async with AsyncSession(engine) as db:
+        stock = (await db.execute(select(Product.stock).filter(Product.id == "p1"))).scalar()
+        balance = await get_balance(db, "u1")
+    return {"status": response.status_code, "detail": response.json()["detail"], "refused": refused, "stock": stock, "balance": balance}
+
+
+async def reconcile(engine) -> dict:
+    async with engine.begin() as conn:
+        # Ledger for u3 is 50 earned, 20 spent; its cached balance drifted.
+        # u4 has no ledger rows but a balance.
+        await conn.execute(text(
+            "INSERT INTO users (id, email, role, credit_points, credits_earned) VALUES "
+            "('u3', 'u3@example.com', 'citizen', 999, 7), ('u4', 'u4@example.com', 'citizen', 15, 15)"
+        ))
+        await conn.execute(text(
+            "INSERT INTO credit_transactions (id, user_id, amount, type) VALUES "
+            "('t1', 'u3', 50, 'earned'), ('t2', 'u3', -20, 'spent')"
+        ))
+    async with AsyncSession(engine) as db:
+        first = await reconcile_balances(db)
+        second = await reconcile_balances(db)
+        rows = (await db.execute(
+            select(User.id, User.credit_points, User.credits_earned).filter(User.id.in_(["u3", "u4"])).order_by(User.id)
+        )).all()
+    return {"first": first, "second": second, "rows": [tuple(row) for row in rows]}
+
+
+async def run_credits() -> dict:
+    admin = create_async_engine(DATABASE_URL, poolclass=NullPool)
+    engine = create_async_engine(DATABASE_URL, poolclass=NullPool, connect_args={"server_settings": {"search_path": SCHEMA}})
+    try:
+        async with admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        result = {"spends": await spends(engine), "route": await order_route(engine), "reconcile": await reconcile(engine)}
+        async with admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+        return result
+    finally:
+        await engine.dispose()
+        await admin.dispose()
+
+
+@pytest.fixture(scope="module")
+def credits():
+    try:
+        return asyncio.run(run_credits())
+    except (OSError, ConnectionError) as error:
+        pytest.skip(f"Postgres not reachable: {error}")
+
+
+def test_spend_decrements_and_records(credits):
+    assert credits["spends"]["spent"] == 70
+    assert credits["spends"]["u1_balance"] == 70
+    assert [tuple(row) for row in credits["spends"]["u1_ledger"]] == [(-30, "spent")]
+
+
+def test_insufficient_balance_changes_nothing(credits):
+    assert credits["spends"]["insufficient"] is None
+    route = credits["route"]
+    assert route["status"] == 400 and route["detail"].startswith("Insufficient credits. Balance: 70")
+    assert (route["stock"], route["balance"]) == (5, 70)
+
+
+def test_non_positive_orders_are_refused(credits):
+    # Neither a negative spend nor a negative quantity may add credits
+    assert credits["route"]["refused"] == [400, 400]
+    assert (credits["route"]["stock"], credits["route"]["balance"]) == (5, 70)
+
+
+def test_concurrent_spends_cannot_overdraw(credits):
+    spends = credits["spends"]
+    assert spends["second_waited"]
+    assert (spends["first"], spends["second"]) == (40, None)
+    assert spends["u2_balance"] == 40
+    assert spends["u2_spends"] == [-60]
+
+
+def test_reconcile_fixes_drifted_balances(credits):
+    reconciled = credits["reconcile"]
+    # u1 and u2 were seeded with credits_earned but no 'earned' rows
+    assert reconciled["first"] == {"corrected": 3, "zeroed": 1}
+    assert reconciled["rows"] == [("u3", 30, 50), ("u4", 0, 0)]
+    assert reconciled["second"] == {"corrected": 0, "zeroed": 0}
@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy.dialects import postgresql
+from services.dashboard import FOOTPRINT_DAYS, dashboard_query
+
+
+def compiled(query):
+    return str(query.compile(dialect=postgresql.dialect()))
+
+
+def test_dashboard_is_one_statement_on_one_user_lookup():
+    sql = compiled(dashboard_query("citizen@waste.com", now=datetime(2026, 6, 1)))
+    assert sql.count("WHERE users.email =") == 1
+    assert sql.startswith("WITH dashboard_user AS")
+    # Panels correlate to the CTE rather than joining it again
+    assert sql.count("dashboard_user.id") == 6
+    assert "FROM activities, dashboard_user" not in sql
+    assert "json_agg(recent_activities ORDER BY recent_activities.date DESC)" in sql
+
+
+def test_rank_counts_citizens_with_more_credits():
+    sql = compiled(dashboard_query("citizen@waste.com"))
+    assert "count(users_1.id) +" in sql
+    assert "users_1.credits_earned > coalesce(dashboard_user.credits_earned" in sql
+
+
+def test_footprint_window():
+    query = dashboard_query("citizen@waste.com", now=datetime(2026, 6, 1))
+    compiled_query = query.compile(dialect=postgresql.dialect())
+    assert datetime(2026, 6, 1) - compiled_query.params["period_start_1"] == timedelta(days=FOOTPRINT_DAYS)
+    # Read from the daily rollups, not the activities
+    assert "FROM carbon_rollups" in str(compiled_query)
@@ -0,0 +1,101 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+import services.forecast
+from services.forecast import (
+    EventHistory, ForecastService, KIND_ACTIVITY, KIND_COLLECTION, KIND_OVERFLOW, KIND_PICKUP, KIND_RECYCLED,
+    KIND_REPORT, compute_forecast, holt_forecast,
+)
+
+NOW = datetime(2026, 6, 15, 12, 0)  # a Monday
+BUSY = (28.2096, 83.9856)
+QUIET = (28.2400, 84.0200)
+
+
+def build_history(rng, days=120, growth=0.0):
+    history = EventHistory()
+    for d in range(days, 0, -1):
+        day = NOW.replace(hour=0) - timedelta(days=d)
+        # Busy area: heavier on Mondays, frequent overflows
+        rate = 20.0 * (1.0 + growth) ** ((days - d) / 7.0) * (1.6 if day.weekday() == 0 else 1.0)
+        for _ in range(rng.poisson(rate)):
+            when = day + timedelta(hours=int(rng.integers(9, 20)))
+            history.add(when, KIND_PICKUP, BUSY)
+            history.add(when, KIND_ACTIVITY)
+        for _ in range(rng.poisson(4.0)):
+            history.add(day + timedelta(hours=10), KIND_OVERFLOW, BUSY)
+        for _ in range(rng.poisson(1.0)):
+            history.add(day + timedelta(hours=11), KIND_REPORT, QUIET)
+        history.add(day + timedelta(hours=7), KIND_RECYCLED if d % 2 else KIND_COLLECTION, BUSY)
+    return history.arrays()
+
+
+def test_holt_forecast_tracks_level_and_weekday_profile():
+    weekday = np.arange(70) % 7
+    counts = np.where(weekday == 0, 20.0, 10.0)[None, :].repeat(3, axis=0)
+    forecast = holt_forecast(counts, weekday, np.arange(7))
+    assert forecast.shape == (3, 7)
+    assert forecast[0, 0] == pytest.approx(20.0, rel=0.05)
+    assert forecast[0, 1:] == pytest.approx(10.0, rel=0.05)
+
+
+def test_growing_area_reports_increasing_trend():
+    result = compute_forecast(build_history(np.random.default_rng(0), growth=0.1), NOW, history_days=120)
+    assert result["waste_generation_trend"].startswith("Increasing")
+    assert 5.0 < result["details"]["trend"]["change_percent"] < 15.0
+    busiest = result["details"]["areas"][0]
+    assert abs(busiest["lat"] - BUSY[0]) < 0.005 and abs(busiest["lng"] - BUSY[1]) < 0.005
+    assert busiest["busiest_weekday"] == "Monday"
+
+
+def test_overflow_prediction_ranks_busy_area():
+    result = compute_forecast(build_history(np.random.default_rng(1)), NOW, history_days=120)
+    overflow = result["details"]["overflow"]
+    assert len(overflow) == 1 and overflow[0]["probability"] > 0.9
+    assert overflow[0]["days_since_collection"] == 0
+    assert result["predicted_overflow"] == [overflow[0]["label"]]
+    assert result["recycling_efficiency"].startswith("50%")
+
+
+def test_collection_window_avoids_active_hours():
+    result = compute_forecast(build_history(np.random.default_rng(2)), NOW, history_days=120)
+    window = result["details"]["collection_window"]
+    assert window["end_hour"] <= 9 or window["start_hour"] >= 20
+    assert result["optimal_collection_time"] == "05:00 AM - 07:00 AM"
+
+
+def test_empty_history():
+    result = compute_forecast(EventHistory().arrays(), NOW)
+    assert result["waste_generation_trend"] == "Not enough data"
+    assert result["predicted_overflow"] == [] and result["events"] == 0
+
+
+def test_reads_recompute_a_stale_result_without_the_background_run(monkeypatch):
+    loads = []
+
+    async def load_history(db, since):
+        loads.append(since)
+        if len(loads) == 3:
+            raise OSError("database gone")
+        return EventHistory().arrays()
+
+    monkeypatch.setattr(services.forecast, "load_history", load_history)
+
+    async def reads():
+        service = ForecastService(interval=60)
+        await asyncio.gather(*(service.insights(db=object()) for _ in range(3)))
+        fresh = await service.insights(db=object())
+        assert len(loads) == 1 and fresh["last_error"] is None
+        # An hour later, with no background task to refresh it
+        service.computed_at -= timedelta(hours=1)
+        stale = await service.insights(db=object())
+        assert len(loads) == 2 and stale["staleness_seconds"] < 60
+        # A failed recompute serves the old result and says why
+        service.computed_at -= timedelta(hours=1)
+        failed = await service.insights(db=object())
+        assert len(loads) == 3 and failed["staleness_seconds"] >= 3600
+        assert "database gone" in failed["last_error"]
+
+    asyncio.run(reads())
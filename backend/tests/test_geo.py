@@ -0,0 +1,36 @@
+import math
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.future import select
+from services.geo import coordinate_columns, radius_bbox, bbox_condition, distance_km_expression
+from services.routing import haversine_matrix
+from tables import PickupRequest
+
+
+def test_coordinate_columns():
+    assert coordinate_columns({"lat": "28.2", "lng": 83.9, "address": "x"}) == {"lat": 28.2, "lng": 83.9}
+    assert coordinate_columns({"address": "somewhere"}) == {"lat": None, "lng": None}
+    assert coordinate_columns(None) == {"lat": None, "lng": None}
+
+
+def test_radius_bbox_contains_circle():
+    lat, lng, radius = 28.2096, 83.9856, 2.0
+    min_lat, min_lng, max_lat, max_lng = radius_bbox(lat, lng, radius)
+    # Points exactly radius_km away due north/east must sit inside the box
+    for bearing in range(0, 360, 15):
+        dlat = radius / 111.32 * math.cos(math.radians(bearing)) * 0.999
+        dlng = radius / (111.32 * math.cos(math.radians(lat))) * math.sin(math.radians(bearing)) * 0.999
+        assert min_lat <= lat + dlat <= max_lat
+        assert min_lng <= lng + dlng <= max_lng
+    # and the box is not wildly larger than the circle
+    corner_km = haversine_matrix([(lat, lng)], [(max_lat, lng)])[0, 0]
+    assert corner_km == pytest.approx(radius, rel=0.01)
+
+
+def test_radius_query_uses_index_friendly_bbox():
+    distance = distance_km_expression(PickupRequest, 28.2, 83.9)
+    query = select(PickupRequest.id).filter(bbox_condition(PickupRequest, radius_bbox(28.2, 83.9, 1.0)), distance <= 1.0)
+    sql = str(query.compile(dialect=postgresql.dialect()))
+    assert "pickup_requests.lat BETWEEN" in sql
+    assert "pickup_requests.lng BETWEEN" in sql
+    assert "asin" in sql
@@ -0,0 +1,146 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from database import DATABASE_URL
+from services.hotspots import HotspotIndex, HotspotRefresher, gaussian_blur, KERNEL
+from tables import Base, PickupRequest, WasteReport
+
+SCHEMA = "hotspots_check"
+
+
+def cluster(rng, lat, lng, n, when, category, spread=0.001):
+    return [(lat + dy, lng + dx, when, category) for dy, dx in rng.normal(0, spread, (n, 2))]
+
+
+@pytest.fixture
+def index():
+    rng = np.random.default_rng(0)
+    now = datetime.utcnow()
+    index = HotspotIndex()
+    index.add_points(cluster(rng, 28.2096, 83.9856, 400, now, "overflow"))
+    index.add_points(cluster(rng, 28.2400, 84.0200, 100, now, "organic"))
+    index.add_points(cluster(rng, 28.1700, 84.0100, 300, now - timedelta(days=20), "overflow"))
+    return index
+
+
+def test_gaussian_blur_preserves_mass():
+    grid = np.zeros((20, 20), dtype=np.float32)
+    grid[10, 10] = 5.0
+    blurred = gaussian_blur(grid)
+    assert blurred.sum() == pytest.approx(5.0, rel=1e-5)
+    assert blurred.argmax() == 10 * 20 + 10
+    assert len(KERNEL) % 2 == 1
+
+
+def test_hottest_cell_is_densest_cluster(index):
+    hotspots = index.query(zoom=13, window="30d")
+    top = hotspots[0]
+    assert top["intensity"] == 10
+    assert abs(top["lat"] - 28.2096) < 0.005 and abs(top["lng"] - 83.9856) < 0.005
+    assert all(1 <= h["intensity"] <= 10 for h in hotspots)
+
+
+def test_window_and_waste_type_filter(index):
+    week = index.query(zoom=13, window="7d", limit=5000)
+    assert not any(abs(h["lat"] - 28.17) < 0.003 and abs(h["lng"] - 84.01) < 0.003 for h in week)
+
+    organic = index.query(zoom=13, window="30d", waste_type="organic")
+    assert abs(organic[0]["lat"] - 28.24) < 0.005
+    assert index.query(window="30d", waste_type="no-such-type") == []
+
+
+def test_bbox_only_returns_visible_cells(index):
+    bbox = (28.22, 84.00, 28.26, 84.04)
+    hotspots = index.query(bbox=bbox, zoom=15, limit=5000)
+    assert hotspots
+    assert all(bbox[0] <= h["lat"] <= bbox[2] and bbox[1] <= h["lng"] <= bbox[3] for h in hotspots)
+    assert len(index.query(bbox=bbox, zoom=15, limit=3)) == 3
+
+
+def test_incremental_update_matches_rebuild(index):
+    # Warm the cache, then add points: the cached aggregate is updated in
+    # place and must agree with a freshly built index
+    index.query(zoom=12, window="30d")
+    rng = np.random.default_rng(1)
+    extra = cluster(rng, 28.2400, 84.0200, 600, datetime.utcnow(), "organic")
+    index.add_points(extra)
+    incremental = index.query(zoom=12, window="30d", limit=50)
+
+    index._aggregates.clear()
+    rebuilt = index.query(zoom=12, window="30d", limit=50)
+    assert incremental == rebuilt
+    assert abs(incremental[0]["lat"] - 28.24) < 0.01
+
+
+def test_refresher_loads_in_the_background():
+    class RecordingIndex:
+        def __init__(self):
+            self.refreshes = []
+
+        async def refresh(self, db, force=False):
+            self.refreshes.append(force)
+
+    async def run():
+        index = RecordingIndex()
+        refresher = HotspotRefresher(index, interval=0.01)
+        refresher.start()
+        # The first load happens right away, not on the first request
+        await asyncio.sleep(0.05)
+        running = refresher.running
+        await refresher.stop()
+        return index.refreshes, running, refresher.running
+
+    refreshes, running, after_stop = asyncio.run(run())
+    assert running and not after_stop
+    assert len(refreshes) >= 2 and all(refreshes)
+
+
+async def run_refreshes() -> dict:
+    admin = create_async_engine(DATABASE_URL, poolclass=NullPool)
+    engine = create_async_engine(DATABASE_URL, poolclass=NullPool, connect_args={"server_settings": {"search_path": SCHEMA}})
+    now = datetime.utcnow()
+    try:
+        async with admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        index = HotspotIndex()
+        async with AsyncSession(engine) as db:
+            db.add_all([
+                WasteReport(id="r1", report_type="overflow", lat=28.2096, lng=83.9856, report_date=now),
+                # The coordinate columns are what gets indexed; the JSON is ignored
+                WasteReport(id="r2", report_type="overflow", location={"lat": 28.0, "lng": 84.0}, report_date=now),
+                PickupRequest(id="p1", waste_type="organic", lat=28.24, lng=84.02, request_date=now),
+            ])
+            await db.commit()
+            await index.refresh(db, force=True)
+            first = len(index)
+            db.add(WasteReport(id="r3", report_type="overflow", lat=28.2097, lng=83.9857, report_date=now + timedelta(seconds=1)))
+            await db.commit()
+            await index.refresh(db, force=True)
+            # Rows inside the overlap window aren't counted twice
+            await index.refresh(db, force=True)
+            second = len(index)
+        async with admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+        return {"first": first, "second": second, "categories": sorted(index.category_codes), "top": index.query(window="24h")[0]}
+    finally:
+        await engine.dispose()
+        await admin.dispose()
+
+
+def test_refresh_reads_coordinate_columns():
+    try:
+        result = asyncio.run(run_refreshes())
+    except (OSError, ConnectionError) as error:
+        pytest.skip(f"Postgres not reachable: {error}")
+    assert (result["first"], result["second"]) == (2, 3)
+    assert result["categories"] == ["organic", "overflow"]
+    assert abs(result["top"]["lat"] - 28.2096) < 0.005
@@ -0,0 +1,128 @@
+import asyncio
+import numpy as np
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+import services.leaderboard
+from database import DATABASE_URL
+from services.leaderboard import CreditIndex, Leaderboard, load_index
+from tables import Base, CreditTransaction, User
+
+SCHEMA = "leaderboard_check"
+
+
+def index():
+    # c ties with b; d has nothing earned yet
+    return CreditIndex.build(["a", "b", "c", "d"], [50, 20, 20, 0])
+
+
+def test_rank_counts_citizens_with_more_credits():
+    board = index()
+    assert len(board) == 3
+    assert [board.rank(user) for user in "abcd"] == [1, 2, 2, 4]
+    assert list(board.rank_of([100, 50, 21, 20, 0])) == [1, 1, 2, 2, 4]
+    assert board.rank("unknown") == 4
+
+
+def test_top_and_window():
+    board = index()
+    assert [(entry["id"], entry["rank"], entry["points"]) for entry in board.top(2)] == [("a", 1, 50), ("c", 2, 20)]
+    assert [entry["id"] for entry in board.around("a", window=1)] == ["a", "c"]
+    assert [entry["id"] for entry in board.around("d", window=2)] == ["c", "b"]
+
+
+def test_awards_move_keys():
+    board = index()
+    board.apply([("b", 40), ("d", 5), ("e", 1), ("d", 10)])
+    assert [(entry["id"], entry["points"]) for entry in board.top(10)] == [("b", 60), ("a", 50), ("c", 20), ("d", 15), ("e", 1)]
+    assert np.all(np.diff(board.keys) > 0)
+    board.apply([("a", -50)])
+    assert board.rank("a") == 5 and len(board) == 4
+
+
+def test_matches_sort_on_random_awards():
+    rng = np.random.default_rng(3)
+    users = [f"u{i}" for i in range(500)]
+    board = CreditIndex.build(users, rng.integers(0, 100, len(users)))
+    for _ in range(20):
+        board.apply([(users[i], int(amount)) for i, amount in zip(rng.integers(0, 600, 50) % 500, rng.integers(1, 30, 50))])
+    credits = np.array([board.credits_of(user) for user in users])
+    for user, points in zip(users[:50], credits[:50]):
+        assert board.rank(user) == 1 + int(np.sum(credits > points))
+
+
+def test_awards_during_rebuild_are_replayed():
+    leaderboard = Leaderboard()
+    leaderboard._pending = {}
+    leaderboard.record([("t1", "a", 5)])
+    assert leaderboard._pending == {"t1": ("a", 5)}
+    assert leaderboard.rank(5) == 1
+
+
+def test_single_awards_grow_front_room():
+    board = CreditIndex()
+    for i in range(3000):
+        board.apply([(f"u{i}", i % 7 + 1)])
+    assert len(board) == 3000
+    assert np.all(np.diff(board.keys) > 0)
+    credits = np.arange(3000) % 7 + 1
+    assert board.rank("u6") == 1
+    assert board.rank("u0") == 1 + int(np.sum(credits > 1))
+
+
+async def run_rebuild(monkeypatch):
+    admin = create_async_engine(DATABASE_URL, poolclass=NullPool)
+    engine = create_async_engine(DATABASE_URL, poolclass=NullPool, connect_args={"server_settings": {"search_path": SCHEMA}})
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    monkeypatch.setattr(services.leaderboard, "AsyncSessionLocal", sessions)
+    try:
+        async with admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with sessions() as db:
+            db.add_all([User(id="a", email="a@example.com", role="citizen"), User(id="b", email="b@example.com", role="citizen")])
+            await db.flush()
+            db.add_all([
+                CreditTransaction(id="t1", user_id="a", amount=10, type="earned"),
+                CreditTransaction(id="t2", user_id="b", amount=4, type="earned"),
+            ])
+            await db.commit()
+
+        # t2 reached this worker during the load but is already in the
+        # snapshot; t3 committed after it
+        pending = {"t2": ("b", 4), "t3": ("b", 8)}
+        index = await load_index(pending)
+        assert pending == {"t3": ("b", 8)}
+        assert index.credits_of("a") == 10 and index.credits_of("b") == 4
+
+        # Awards recorded from the session are keyed by transaction id
+        board = Leaderboard()
+        services.leaderboard.leaderboard, previous = board, services.leaderboard.leaderboard
+        try:
+            board._pending = {}
+            async with sessions() as db:
+                db.add(CreditTransaction(id="t5", user_id="a", amount=1, type="earned"))
+                await db.commit()
+            assert board._pending == {"t5": ("a", 1)}
+        finally:
+            services.leaderboard.leaderboard = previous
+            board._pending = None
+
+        await board.rebuild()
+        assert board.index.credits_of("a") == 11 and board.index.credits_of("b") == 4
+    finally:
+        async with admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+        await engine.dispose()
+        await admin.dispose()
+
+
+def test_rebuild_does_not_replay_awards_in_the_snapshot(monkeypatch):
+    try:
+        asyncio.run(run_rebuild(monkeypatch))
+    except (OSError, ConnectionError) as error:
+        pytest.skip(f"Postgres not reachable: {error}")
@@ -0,0 +1,118 @@
+# Migrations against scratch schemas: one shaped like a database from
+# before migrations existed (what the old create_all left, which is what
+# 0001 creates) and an empty one. Both must end up matching tables.py.
+# Needs Postgres (DATABASE_URL); the database tests skip when it can't
+# connect.
+import asyncio
+import importlib
+
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from database import DATABASE_URL
+from services.schema import latest_version, load_migrations, migrate, schema_version
+from tables import Base
+
+SCHEMA = "migration_check"
+baseline = importlib.import_module("migrations.0001_baseline")
+hot_indexes = importlib.import_module("migrations.0005_indexes")
+
+
+def test_versions_are_contiguous():
+    migrations = load_migrations()
+    assert [migration.version for migration in migrations] == list(range(1, latest_version() + 1))
+    # Concurrent index builds and batched backfills can't run in a transaction
+    assert [migration.name for migration in migrations if not migration.transactional] == ["backfill", "indexes"]
+
+
+def test_index_migration_matches_models():
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name in hot_indexes.INDEXES:
+                columns = ", ".join(column.name for column in index.columns)
+                assert f"ON {table.name} ({columns})" in hot_indexes.INDEXES[index.name]
+
+
+def _schema(sync_conn) -> dict:
+    inspector = inspect(sync_conn)
+    return {
+        table: (
+            sorted(column["name"] for column in inspector.get_columns(table)),
+            # Unique constraints show up as indexes too; only real ones count
+            sorted(index["name"] for index in inspector.get_indexes(table) if "duplicates_constraint" not in index),
+        )
+        for table in inspector.get_table_names()
+        if table != "schema_migrations"
+    }
+
+
+def _expected() -> dict:
+    return {
+        table.name: (sorted(table.columns.keys()), sorted(index.name for index in table.indexes))
+        for table in Base.metadata.sorted_tables
+    }
+
+
+async def _legacy_schema(engine):
+    # The old create_all's tables with data in them, no schema_migrations
+    async with engine.begin() as conn:
+        await baseline.upgrade(conn)
+        await conn.execute(text("INSERT INTO users (id, email, role) VALUES ('u1', 'u1@example.com', 'citizen')"))
+        await conn.execute(text(
+            "INSERT INTO credit_transactions (id, user_id, amount, type) "
+            "VALUES ('t1', 'u1', 30, 'earned'), ('t2', 'u1', 12, 'earned'), ('t3', 'u1', -20, 'spent')"
+        ))
+        await conn.execute(text(
+            "INSERT INTO pickup_requests (id, user_id, status, location) "
+            "VALUES ('p1', 'u1', 'pending', '{\"lat\": 12.97, \"lng\": 77.59}')"
+        ))
+
+
+async def run_migrations(legacy: bool) -> dict:
+    admin = create_async_engine(DATABASE_URL, poolclass=NullPool)
+    engine = create_async_engine(DATABASE_URL, poolclass=NullPool, connect_args={"server_settings": {"search_path": SCHEMA}})
+    try:
+        async with admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        if legacy:
+            await _legacy_schema(engine)
+        first = await migrate(bind=engine)
+        second = await migrate(bind=engine)
+        async with engine.connect() as conn:
+            schema = await conn.run_sync(_schema)
+            user = (await conn.execute(text("SELECT credits_earned FROM users WHERE id = 'u1'"))).first()
+            pickup = (await conn.execute(text("SELECT lat, lng FROM pickup_requests WHERE id = 'p1'"))).first()
+        version = await schema_version(engine)
+        async with admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+        return {"first": first, "second": second, "schema": schema, "user": user, "pickup": pickup, "version": version}
+    finally:
+        await engine.dispose()
+        await admin.dispose()
+
+
+def migrated(legacy: bool) -> dict:
+    try:
+        return asyncio.run(run_migrations(legacy))
+    except (OSError, ConnectionError) as error:
+        pytest.skip(f"Postgres not reachable: {error}")
+
+
+def test_legacy_database_is_brought_up_to_date():
+    result = migrated(legacy=True)
+    assert [step["version"] for step in result["first"]["applied"]] == list(range(1, latest_version() + 1))
+    assert result["second"]["applied"] == []
+    assert result["version"] == latest_version()
+    assert result["schema"] == _expected()
+    assert tuple(result["user"]) == (42,)
+    assert tuple(result["pickup"]) == (12.97, 77.59)
+
+
+def test_new_database_matches_models():
+    result = migrated(legacy=False)
+    assert result["first"]["version"] == latest_version()
+    assert result["schema"] == _expected()
+    assert result["user"] is None
@@ -0,0 +1,54 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.future import select
+from services.pagination import csv_lines, decode_cursor, encode_cursor, keyset_query, ndjson_lines
+from tables import AuditLog
+
+WHEN = datetime(2026, 4, 2, 8, 15, 30, 123456)
+
+
+async def batches(*groups):
+    for group in groups:
+        yield group
+
+
+async def collect(lines):
+    return "".join([chunk async for chunk in lines])
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(WHEN, "abc")
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (WHEN, "abc")
+    for bad in ("", "not-a-cursor", encode_cursor(WHEN, "x")[:-3]):
+        with pytest.raises(ValueError):
+            decode_cursor(bad)
+
+
+def test_keyset_query_continues_after_cursor():
+    query = keyset_query(select(AuditLog), AuditLog.timestamp, AuditLog.id, encode_cursor(WHEN, "abc"), 50)
+    sql = str(query.compile(dialect=postgresql.dialect()))
+    assert "(audit_logs.timestamp, audit_logs.id) < (" in sql
+    assert "ORDER BY audit_logs.timestamp DESC, audit_logs.id DESC" in sql
+    assert 51 in query.compile().params.values()
+
+
+@pytest.mark.asyncio
+async def test_ndjson_export():
+    text = await collect(ndjson_lines(["id", "timestamp"], batches([("a", WHEN)], [("b", None)])))
+    assert [json.loads(line) for line in text.splitlines()] == [
+        {"id": "a", "timestamp": WHEN.isoformat()},
+        {"id": "b", "timestamp": None},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_csv_export_writes_header_once():
+    text = await collect(csv_lines(["id", "location"], batches([("a", {"lat": 1.5})], [("b", None)])))
+    assert list(csv.reader(io.StringIO(text))) == [["id", "location"], ["a", '{"lat": 1.5}'], ["b", ""]]
+    assert await collect(csv_lines(["id"], batches())) == "id\r\n"
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import pytest
+from routes.realtime import ConnectionManager
+from services.pubsub import MAX_PAYLOAD_BYTES, LocalBroker, PubSub
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        self.sent.append(message)
+
+    async def close(self):
+        pass
+
+
+async def two_workers(**options):
+    broker = LocalBroker()
+    workers = [ConnectionManager(broker.backend()) for _ in range(2)]
+    for worker in workers:
+        worker.pubsub.batch_delay = options.get("batch_delay", 0.005)
+        await worker.start()
+    return workers
+
+
+@pytest.mark.asyncio
+async def test_broadcast_reaches_clients_on_other_worker():
+    first, second = await two_workers()
+    here, there = FakeSocket(), FakeSocket()
+    await first.connect(here, "collector_a")
+    await second.connect(there, "collector_b")
+    citizen = FakeSocket()
+    await second.connect(citizen, "citizen_1")
+
+    await first.broadcast_to_collectors("pickup")
+    await first.send_personal_message("hi", "citizen_1")
+    await asyncio.sleep(0.05)
+    assert here.sent == ["pickup"] and there.sent == ["pickup"]
+    assert citizen.sent == ["hi"]
+    for worker in (first, second):
+        await worker.stop()
+
+
+@pytest.mark.asyncio
+async def test_messages_are_batched_per_window():
+    payloads = []
+    broker = LocalBroker()
+    broker.handlers.append(payloads.append)
+    pubsub = PubSub(lambda target, message: None, broker.backend(), batch_ms=20)
+    await pubsub.start()
+    for i in range(50):
+        pubsub.publish("collectors", str(i))
+    await asyncio.sleep(0.05)
+    assert len(payloads) == 1
+    assert [message for _, message in json.loads(payloads[0])["messages"]] == [str(i) for i in range(50)]
+    await pubsub.stop()
+
+
+def test_payloads_fit_notify_limit():
+    pubsub = PubSub(lambda target, message: None)
+    envelopes = [("all", "x" * 1000) for _ in range(20)] + [("all", "y" * 10000)]
+    payloads = pubsub._payloads(envelopes)
+    assert all(len(payload.encode()) <= MAX_PAYLOAD_BYTES for payload, _ in payloads)
+    assert sum(count for _, count in payloads) == 20
+
+
+@pytest.mark.asyncio
+async def test_failed_delivery_does_not_drop_the_rest_of_the_batch():
+    delivered = []
+
+    def deliver(target, message):
+        if message == "bad":
+            raise ValueError(message)
+        delivered.append(message)
+
+    broker = LocalBroker()
+    sender = PubSub(lambda target, message: None, broker.backend(), batch_ms=1)
+    receiver = PubSub(deliver, broker.backend())
+    for pubsub in (sender, receiver):
+        await pubsub.start()
+    for message in ("one", "bad", "two"):
+        sender.publish("all", message)
+    await asyncio.sleep(0.02)
+    assert delivered == ["one", "two"]
+    for pubsub in (sender, receiver):
+        await pubsub.stop()
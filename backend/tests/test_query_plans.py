@@ -0,0 +1,194 @@
+# Query-plan regression suite: seeds a realistic volume into a scratch
+# schema, EXPLAINs the hot routes' queries and fails if any of them reads a
+# table with a sequential scan. Needs Postgres (DATABASE_URL); skipped when
+# it can't connect. QUERY_PLAN_SCALE multiplies the seeded row counts.
+import asyncio
+import json
+import os
+from datetime import datetime
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.pool import NullPool
+
+from database import DATABASE_URL
+from services.announcements import missed_announcements_query
+from services.carbon import user_footprint_query
+from services.dashboard import dashboard_query
+from services.pagination import encode_cursor, keyset_query
+from services.zones import assigned_pickups, pickups_to_assign
+from tables import Activity, Announcement, AuditLog, Base, Block, Notification, PickupRequest, User, WasteReport
+
+SCHEMA = "query_plans"
+SCALE = float(os.getenv("QUERY_PLAN_SCALE", "1"))
+USERS = int(20000 * SCALE)
+COLLECTORS = 100
+NOW = datetime(2026, 6, 1)
+CITIZEN = "u42"
+
+# table -> INSERT ... SELECT over generate_series(1, rows); ids are
+# prefix || i so the queries can name a real user
+SEED = {
+    "users": (USERS, """
+        INSERT INTO users (id, email, role, name, credit_points, credits_earned, created_at, is_verified, id_photo_url)
+        SELECT 'u' || i, 'u' || i || '@example.com',
+               CASE WHEN i <= {collectors} THEN 'collector' ELSE 'citizen' END, 'User ' || i,
+               (i * 37) % 500, (i * 53) % 2000, {now} - (i % 700) * interval '1 day', i % 50 <> 0,
+               CASE WHEN i % 25 = 0 THEN 'id/' || i || '.png' END
+        FROM generate_series(1, :rows) i
+    """),
+    "activities": (USERS * 20, """
+        INSERT INTO activities (id, user_id, type, description, date, impact_co2)
+        SELECT 'a' || i, 'u' || (1 + i % {users}), (ARRAY['pickup', 'report', 'purchase'])[1 + i % 3], 'Activity',
+               {now} - (i % 365) * interval '1 day' - (i % 1440) * interval '1 minute', (i % 7) * 0.5
+        FROM generate_series(1, :rows) i
+    """),
+    "notifications": (USERS * 10, """
+        INSERT INTO notifications (id, user_id, title, message, type, read, date)
+        SELECT 'n' || i, 'u' || (1 + i % {users}), 'Title', 'Message', 'info', i % 3 = 0,
+               {now} - (i % 365) * interval '1 day' - (i % 1440) * interval '1 minute'
+        FROM generate_series(1, :rows) i
+    """),
+    "credit_transactions": (USERS * 10, """
+        INSERT INTO credit_transactions (id, user_id, amount, type, description, date)
+        SELECT 't' || i, 'u' || (1 + i % {users}), CASE WHEN i % 4 = 0 THEN -20 ELSE 10 END,
+               CASE WHEN i % 4 = 0 THEN 'spent' ELSE 'earned' END, 'Credits', {now} - (i % 365) * interval '1 day'
+        FROM generate_series(1, :rows) i
+    """),
+    # Mostly history: 1% pending, 4% assigned
+    "pickup_requests": (USERS * 5, """
+        INSERT INTO pickup_requests (id, user_id, waste_type, amount_approx, location, lat, lng, scheduled_date, status, request_date, collector_id)
+        SELECT 'p' || i, 'u' || (1 + i % {users}), 'organic', '1 bag',
+               json_build_object('lat', 12.9 + (i % 1000) * 0.0001, 'lng', 77.5 + (i % 997) * 0.0001),
+               12.9 + (i % 1000) * 0.0001, 77.5 + (i % 997) * 0.0001, {now} + (i % 14) * interval '1 day',
+               CASE WHEN i % 100 = 0 THEN 'pending' WHEN i % 100 < 5 THEN 'assigned' ELSE 'completed' END,
+               {now} - (i % 365) * interval '1 day',
+               CASE WHEN i % 100 <> 0 THEN 'u' || (1 + i % {collectors}) END
+        FROM generate_series(1, :rows) i
+    """),
+    "audit_logs": (USERS * 10, """
+        INSERT INTO audit_logs (id, user_id, action, endpoint, ip_address, status_code, duration_ms, timestamp)
+        SELECT 'l' || i, 'u' || (1 + i % {users}), 'GET', '/api/citizen/stats', '127.0.0.1', 200, 3.5,
+               {now} - i * interval '1 second'
+        FROM generate_series(1, :rows) i
+    """),
+    "waste_reports": (USERS * 2, """
+        INSERT INTO waste_reports (id, user_id, report_type, description, location, status, report_date)
+        SELECT 'w' || i, 'u' || (1 + i % {users}), 'overflow', 'Bin full', '{{}}'::json,
+               CASE WHEN i % 10 = 0 THEN 'reported' ELSE 'resolved' END, {now} - i * interval '1 minute'
+        FROM generate_series(1, :rows) i
+    """),
+    "announcements": (max(USERS // 4, 1000), """
+        INSERT INTO announcements (id, title, message, priority, target_role, date)
+        SELECT 'an' || i, 'Notice', 'Message', 'normal', (ARRAY['all', 'citizen', 'collector'])[1 + i % 3],
+               {now} - i * interval '1 hour'
+        FROM generate_series(1, :rows) i
+    """),
+    "blockchain": (USERS, """
+        INSERT INTO blockchain (id, index, timestamp, transactions, previous_hash, hash)
+        SELECT 'b' || i, i, {now} - i * interval '1 minute', '[]'::json, md5((i - 1)::text), md5(i::text)
+        FROM generate_series(1, :rows) i
+    """),
+    "carbon_rollups": (None, """
+        INSERT INTO carbon_rollups (user_id, period, period_start, co2, activities, updated_at)
+        SELECT user_id, 'day', date_trunc('day', date), sum(impact_co2), count(*), {now}
+        FROM activities WHERE impact_co2 > 0 GROUP BY user_id, date_trunc('day', date)
+    """),
+}
+
+# Each hot route's query, built by the code that serves it
+QUERIES = {
+    "citizen activities": keyset_query(select(Activity).filter(Activity.user_id == CITIZEN), Activity.date, Activity.id, None, 5),
+    "citizen activities, next page": keyset_query(
+        select(Activity).filter(Activity.user_id == CITIZEN), Activity.date, Activity.id, encode_cursor(NOW, "a5000"), 5
+    ),
+    "citizen notifications": keyset_query(
+        select(Notification).filter(Notification.user_id == CITIZEN), Notification.date, Notification.id, None, 10
+    ),
+    "citizen dashboard": dashboard_query(f"{CITIZEN}@example.com", now=NOW, with_rank=False),
+    "citizen carbon footprint": user_footprint_query(CITIZEN, start=datetime(2026, 3, 1)),
+    "announcement catch-up": missed_announcements_query("citizen", (datetime(2026, 5, 1), "an100"), 50),
+    "admin audit logs": keyset_query(select(AuditLog), AuditLog.timestamp, AuditLog.id, None, 50),
+    "admin users": keyset_query(select(User), User.created_at, User.id, None, 50),
+    "admin pending verifications": keyset_query(
+        select(User).filter(User.id_photo_url.isnot(None), User.is_verified == False), User.created_at, User.id, None, 100
+    ),
+    "admin feedback": keyset_query(select(WasteReport), WasteReport.report_date, WasteReport.id, None, 50),
+    "admin announcements": keyset_query(select(Announcement), Announcement.date, Announcement.id, None, 50),
+    # Fallback until the in-memory leaderboard has loaded (routes/admin.py)
+    "admin leaderboard": (
+        select(User.id, User.name, User.credits_earned)
+        .filter(User.role == "citizen", User.credits_earned > 0)
+        .order_by(User.credits_earned.desc())
+        .limit(10)
+    ),
+    "zone assignment": pickups_to_assign(),
+    "zone centroids": assigned_pickups([f"u{i}" for i in range(1, 11)]),
+    # routes/collector.py optimized route
+    "collector route": (
+        select(PickupRequest)
+        .filter(PickupRequest.collector_id == "u7", PickupRequest.status == "assigned")
+        .order_by(PickupRequest.scheduled_date)
+        .limit(25)
+    ),
+    "latest blocks": select(Block).order_by(Block.index.desc()).limit(10),
+}
+
+
+def sql(query) -> str:
+    return str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def seq_scans(plan: dict) -> list:
+    # Relations read by a Seq Scan anywhere in an EXPLAIN (FORMAT JSON) plan
+    found = [plan["Relation Name"]] if plan.get("Node Type") == "Seq Scan" else []
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+async def collect_plans() -> dict:
+    engine = create_async_engine(DATABASE_URL, poolclass=NullPool)
+    try:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+            await conn.execute(text(f"SET LOCAL search_path TO {SCHEMA}"))
+            await conn.run_sync(Base.metadata.create_all)
+            for rows, statement in SEED.values():
+                statement = statement.format(now=f"TIMESTAMP '{NOW}'", users=USERS, collectors=COLLECTORS)
+                await conn.execute(text(statement), {} if rows is None else {"rows": rows})
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(text(f"SET search_path TO {SCHEMA}"))
+            await conn.execute(text("VACUUM ANALYZE"))
+            plans = {}
+            for name, query in QUERIES.items():
+                result = await conn.execute(text("EXPLAIN (FORMAT JSON) " + sql(query)))
+                plan = result.scalar()
+                plans[name] = (json.loads(plan) if isinstance(plan, str) else plan)[0]["Plan"]
+            await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+        return plans
+    finally:
+        await engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def plans():
+    try:
+        return asyncio.run(collect_plans())
+    except (OSError, ConnectionError) as error:
+        pytest.skip(f"Postgres not reachable: {error}")
+
+
+@pytest.mark.parametrize("name", list(QUERIES))
+def test_hot_query_uses_indexes(plans, name):
+    assert seq_scans(plans[name]) == [], json.dumps(plans[name], indent=1)
+
+
+def test_seq_scan_detection():
+    plan = {"Node Type": "Limit", "Plans": [{"Node Type": "Seq Scan", "Relation Name": "activities"}, {"Node Type": "Index Scan"}]}
+    assert seq_scans(plan) == ["activities"]
@@ -0,0 +1,98 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from database import DATABASE_URL
+from routes.realtime import ConnectionManager, LiveStats, LiveStatsLeader, WorkerCounts, report_connections
+from services.pubsub import LocalBroker
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        self.sent.append(message)
+
+    async def close(self):
+        pass
+
+
+def test_live_stats_only_reports_changed_fields():
+    stats = LiveStats()
+    first = {"active_users": 3, "co2_saved": 12.5, "waste_collected": 4}
+    assert stats.update(first) == first
+    assert stats.update(dict(first)) == {}
+    assert stats.update(dict(first, waste_collected=5, co2_saved=17.5)) == {"co2_saved": 17.5, "waste_collected": 5}
+    assert stats.current == {"active_users": 3, "co2_saved": 17.5, "waste_collected": 5}
+
+
+def test_worker_counts_drop_silent_workers():
+    counts = WorkerCounts(ttl=60)
+    counts.apply_message(json.dumps({"worker": "a", "connections": 2, "admins": 1}))
+    counts.apply_message(json.dumps({"worker": "b", "connections": 5, "admins": 0}))
+    # A newer report replaces the worker's previous one
+    counts.apply_message(json.dumps({"worker": "a", "connections": 3, "admins": 1}))
+    assert (counts.total("connections"), counts.total("admins")) == (8, 1)
+    counts.ttl = -1
+    assert counts.total("connections") == 0
+
+
+@pytest.mark.asyncio
+async def test_live_stats_cover_every_worker():
+    broker = LocalBroker()
+    workers = [ConnectionManager(broker.backend()) for _ in range(2)]
+    for worker in workers:
+        worker.pubsub.batch_delay = 0.005
+        await worker.start()
+    first, second = workers
+    admins = [FakeSocket(), FakeSocket()]
+    await first.connect(admins[0], "admin_a")
+    await second.connect(admins[1], "admin_b")
+    for client in ("citizen_1", "citizen_2"):
+        await second.connect(FakeSocket(), client)
+
+    for worker in workers:
+        report_connections(worker)
+    await asyncio.sleep(0.05)
+    assert [worker.worker_counts.total("connections") for worker in workers] == [4, 4]
+    assert [worker.worker_counts.total("admins") for worker in workers] == [2, 2]
+
+    # Only the leader reads the database; its snapshot reaches every admin
+    first.pubsub.publish("live_stats", json.dumps({"active_users": 4, "co2_saved": 1.5, "waste_collected": 2}))
+    await asyncio.sleep(0.05)
+    for socket in admins:
+        assert json.loads(socket.sent[-1]) == {"type": "analytics_update", "active_users": 4, "co2_saved": 1.5, "waste_collected": 2}
+    assert second.live_stats.current["active_users"] == 4
+    for worker in workers:
+        await worker.stop()
+
+
+async def run_leaders() -> dict:
+    engines = [create_async_engine(DATABASE_URL, poolclass=NullPool) for _ in range(2)]
+    leaders = [LiveStatsLeader(bind) for bind in engines]
+    try:
+        result = {"first": [await leader.is_leader() for leader in leaders]}
+        result["again"] = await leaders[0].is_leader()
+        await leaders[0].release()
+        result["after_release"] = await leaders[1].is_leader()
+        return result
+    finally:
+        for leader in leaders:
+            await leader.release()
+        for bind in engines:
+            await bind.dispose()
+
+
+def test_one_worker_leads_until_it_releases():
+    try:
+        result = asyncio.run(run_leaders())
+    except (OSError, ConnectionError) as error:
+        pytest.skip(f"Postgres not reachable: {error}")
+    assert result == {"first": [True, False], "again": True, "after_release": True}
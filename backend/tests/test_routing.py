@@ -0,0 +1,86 @@
+import random
+import time
+
+import numpy as np
+import pytest
+from routes.collector import MAX_ROUTE_STOPS
+from services.routing import _Distances, extract_coordinates, haversine_matrix, path_length, solve_route
+
+
+def random_points(n, seed=7):
+    rng = random.Random(seed)
+    # Roughly the Pokhara service area
+    return [(28.2096 + rng.uniform(-0.05, 0.05), 83.9856 + rng.uniform(-0.05, 0.05)) for _ in range(n)]
+
+
+def test_extract_coordinates():
+    assert extract_coordinates({"lat": 28.2, "lng": 83.9, "address": "Lakeside"}) == (28.2, 83.9)
+    assert extract_coordinates({"lat": "28.2", "lng": "83.9"}) == (28.2, 83.9)
+    assert extract_coordinates({"address": "Lakeside"}) is None
+    assert extract_coordinates({"lat": 128.0, "lng": 83.9}) is None
+    assert extract_coordinates(None) is None
+
+
+def test_haversine_matrix_known_distance():
+    # Kathmandu -> Pokhara is roughly 140 km as the crow flies
+    matrix = haversine_matrix([(27.7172, 85.3240), (28.2096, 83.9856)])
+    assert matrix.shape == (2, 2)
+    assert matrix[0, 0] == 0
+    assert matrix[0, 1] == pytest.approx(matrix[1, 0])
+    assert 135 < matrix[0, 1] < 150
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 3, 25, 300])
+def test_solve_route_visits_every_stop_once(n):
+    points = random_points(n)
+    solution = solve_route(points, time_budget=2.0)
+    assert sorted(solution.order) == list(range(n))
+    assert solution.distance_km == pytest.approx(path_length(points, solution.order), rel=1e-4)
+
+
+def test_solve_route_beats_schedule_order():
+    points = random_points(400)
+    solution = solve_route(points, time_budget=2.0)
+    assert solution.distance_km <= solution.initial_distance_km + 1e-6
+    assert solution.distance_km < path_length(points, list(range(len(points)))) / 3
+
+
+def test_solve_route_with_depot_starts_at_depot():
+    points = random_points(50)
+    depot = (28.30, 84.10)
+    solution = solve_route(points, start=depot, time_budget=1.0)
+    assert sorted(solution.order) == list(range(50))
+    # The depot leg is included in the reported distance
+    expected = path_length([depot] + points, [0] + [i + 1 for i in solution.order])
+    assert solution.distance_km == pytest.approx(expected, rel=1e-4)
+
+
+def test_solve_route_respects_time_budget():
+    points = random_points(1500)
+    solution = solve_route(points, time_budget=0.01)
+    assert sorted(solution.order) == list(range(1500))
+    assert solution.stats()["timed_out"]
+
+
+def test_grid_neighbours_match_full_scan():
+    # Two dense clusters far apart plus a few stragglers: most stops are
+    # served from their grid window, the stragglers need the full-row fallback
+    points = np.asarray(random_points(600) + [(28.9 + 0.01 * i, 84.5) for i in range(5)] + [(28.0, 83.5)])
+    dist = _Distances(points)
+    matrix = dist.matrix[:dist.n, :dist.n].astype(np.float64)
+    np.fill_diagonal(matrix, np.inf)
+    grid = dist.neighbours(10)
+    expected = np.sort(matrix, axis=1)[:, :10]
+    assert np.allclose(np.take_along_axis(matrix, grid, axis=1), expected)
+
+
+@pytest.mark.parametrize("budget", [0.2, 1.0])
+def test_time_budget_covers_setup_at_max_stops(budget):
+    points = random_points(MAX_ROUTE_STOPS)
+    started = time.perf_counter()
+    solution = solve_route(points, start=(28.30, 84.10), time_budget=budget)
+    elapsed = time.perf_counter() - started
+    assert elapsed <= budget + 0.15
+    assert sorted(solution.order) == list(range(MAX_ROUTE_STOPS))
+    # The budget leaves room for local search, not just the seed
+    assert solution.two_opt_moves > 0
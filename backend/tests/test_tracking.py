@@ -0,0 +1,114 @@
+import asyncio
+import json
+import pytest
+from routes.realtime import ConnectionManager
+from services.pubsub import LocalBroker
+from services.tracking import DriverTracker, clean_position, decode_position, encode_position
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        self.sent.append(json.loads(message))
+
+    async def send_bytes(self, message):
+        self.sent.append(decode_position(message))
+
+    async def close(self):
+        pass
+
+
+def position(i):
+    return {"lat": 12.9 + i * 0.001, "lng": 77.5, "timestamp": 1700000000 + i}
+
+
+def test_binary_frame_round_trip():
+    frame = encode_position("collector_7", position(0))
+    decoded = decode_position(frame)
+    assert decoded["driver_id"] == "collector_7"
+    assert decoded["lat"] == pytest.approx(12.9, abs=1e-5)
+    assert decoded["timestamp"] == 1700000000
+    assert len(frame) < len(json.dumps({"type": "tracking", "driver_id": "collector_7", "location": position(0)}))
+
+
+@pytest.mark.parametrize("location", [
+    None, {}, {"lat": "north", "lng": 77.5}, {"lat": 12.9}, {"lat": float("nan"), "lng": 77.5},
+    {"lat": 12.9, "lng": float("inf")}, {"lat": 91, "lng": 77.5}, {"lat": 12.9, "lng": -180.5}, {"lat": True, "lng": 77.5},
+])
+def test_invalid_positions_are_rejected(location):
+    assert clean_position(location) is None
+
+
+@pytest.mark.asyncio
+async def test_tracker_drops_invalid_positions_before_publishing():
+    published = []
+    tracker = DriverTracker(lambda driver_id, location: published.append(location), interval=0.05)
+    tracker.update("collector_1", {"lat": "north", "lng": 77.5})
+    tracker.update("collector_1", {"lat": 12.9, "lng": 77.5, "timestamp": "soon", "extra": "x"})
+    assert published == [{"lat": 12.9, "lng": 77.5}]
+    assert (tracker.received, tracker.rejected) == (1, 1)
+    tracker.stop()
+
+
+@pytest.mark.asyncio
+async def test_updates_are_coalesced_to_latest_position():
+    published = []
+    tracker = DriverTracker(lambda driver_id, location: published.append(location), interval=0.05)
+    for i in range(10):
+        tracker.update("collector_1", position(i))
+    assert published == [position(0)]
+    await asyncio.sleep(0.08)
+    assert published == [position(0), position(9)]
+    assert (tracker.received, tracker.published) == (10, 2)
+    tracker.stop()
+
+
+@pytest.mark.asyncio
+async def test_only_subscribers_receive_positions():
+    manager = ConnectionManager()
+    follower, bystander, binary = FakeSocket(), FakeSocket(), FakeSocket()
+    await manager.connect(follower, "citizen_1")
+    await manager.connect(bystander, "citizen_2")
+    connection = await manager.connect(binary, "citizen_3")
+    manager.subscribe(manager.active_connections["citizen_1"], "collector_1")
+    connection.binary = True
+    manager.subscribe(connection, "collector_1")
+
+    await manager.broadcast_tracking_update("collector_1", position(0))
+    await asyncio.sleep(0.01)
+    assert follower.sent == [{"type": "tracking", "driver_id": "collector_1", "location": position(0)}]
+    assert [frame["driver_id"] for frame in binary.sent] == ["collector_1"]
+    assert bystander.sent == []
+
+    # A late subscriber gets the last known position straight away
+    manager.subscribe(manager.active_connections["citizen_2"], "collector_1")
+    await asyncio.sleep(0.01)
+    assert bystander.sent == follower.sent
+
+    manager.disconnect(connection)
+    assert connection not in manager.driver_subscribers["collector_1"]
+    await manager.stop()
+
+
+@pytest.mark.asyncio
+async def test_positions_reach_subscribers_on_other_worker():
+    broker = LocalBroker()
+    first, second = ConnectionManager(broker.backend()), ConnectionManager(broker.backend())
+    for worker in (first, second):
+        worker.pubsub.batch_delay = 0.005
+        await worker.start()
+    follower, bystander = FakeSocket(), FakeSocket()
+    second.subscribe(await second.connect(follower, "citizen_1"), "collector_1")
+    await second.connect(bystander, "citizen_2")
+
+    await first.broadcast_tracking_update("collector_1", position(0))
+    await asyncio.sleep(0.05)
+    assert [message["location"] for message in follower.sent] == [position(0)]
+    assert bystander.sent == []
+    for worker in (first, second):
+        await worker.stop()
@@ -0,0 +1,162 @@
+import asyncio
+import math
+import random
+import numpy as np
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.pool import NullPool
+
+from database import DATABASE_URL, get_db
+from main import app
+from services.zones import ASSIGN_LOCK_KEY, assign_pending_pickups, extend_zones, fallback_labels, partition_zones
+from tables import Base, PickupRequest, User
+from utils import get_current_user
+
+SCHEMA = "zones_check"
+
+
+def clustered_points(centers, per_center, spread=0.004, seed=3):
+    rng = random.Random(seed)
+    points = []
+    for lat, lng in centers:
+        points += [(lat + rng.gauss(0, spread), lng + rng.gauss(0, spread)) for _ in range(per_center)]
+    return points
+
+
+def test_partition_zones_separates_neighbourhoods():
+    centers = [(28.20, 83.95), (28.24, 84.02), (28.17, 84.01)]
+    points = clustered_points(centers, 100)
+    labels = partition_zones(points, 3)
+    # Each neighbourhood should land in exactly one zone
+    for i in range(3):
+        assert len(set(labels[i * 100:(i + 1) * 100].tolist())) == 1
+    assert len(set(labels.tolist())) == 3
+
+
+def test_partition_zones_respects_capacity():
+    # Most pickups in one neighbourhood: zones must still be balanced
+    points = clustered_points([(28.20, 83.95)], 900) + clustered_points([(28.24, 84.02)], 100)
+    k, slack = 5, 0.1
+    labels = partition_zones(points, k, capacity_slack=slack)
+    counts = np.bincount(labels, minlength=k)
+    assert counts.sum() == len(points)
+    assert counts.max() <= math.ceil(len(points) / k * (1 + slack))
+
+
+def test_partition_zones_edge_cases():
+    assert len(partition_zones([], 4)) == 0
+    # More collectors than pickups: each pickup gets its own zone
+    labels = partition_zones([(28.2, 83.9), (28.3, 84.0)], 10)
+    assert sorted(labels.tolist()) == [0, 1]
+    with pytest.raises(ValueError):
+        partition_zones([(28.2, 83.9)], 0)
+
+
+def test_incremental_pickup_joins_nearest_existing_zone():
+    centers = [(28.20, 83.95), (28.24, 84.02), (28.17, 84.01)]
+    zones = [clustered_points([center], 20, seed=i) for i, center in enumerate(centers)]
+    new = [(28.241, 84.021), (28.169, 84.009), (28.201, 83.951)]
+    assert extend_zones(zones, new).tolist() == [1, 2, 0]
+
+
+def test_incremental_assignment_respects_capacity():
+    # Zone 0 is full, so the overflow goes to the next nearest zone
+    zones = [clustered_points([(28.20, 83.95)], 10), clustered_points([(28.24, 84.02)], 2)]
+    new = clustered_points([(28.20, 83.95)], 6, seed=9)
+    labels = extend_zones(zones, new, capacity_slack=0.0)
+    # ceil(18 / 2) = 9 per zone: nothing fits in zone 0 any more
+    assert labels.tolist() == [1] * 6
+
+
+def test_incremental_assignment_seeds_empty_zones():
+    zones = [clustered_points([(28.20, 83.95)], 10), []]
+    new = clustered_points([(28.20, 83.95)], 3, seed=5) + [(28.30, 84.10)]
+    labels = extend_zones(zones, new, capacity_slack=1.0)
+    # The new collector's zone starts on the pickup farthest from zone 0
+    assert labels.tolist() == [0, 0, 0, 1]
+    # No zones yet: same as a full partition
+    first = clustered_points([(28.20, 83.95), (28.24, 84.02)], 10)
+    assert extend_zones([[], []], first).tolist() == partition_zones(first, 2).tolist()
+
+
+def test_unlocated_pickups_go_to_least_loaded_collectors():
+    assert fallback_labels([3, 0, 1], 4).tolist() == [1, 1, 2, 1]
+    assert fallback_labels([2, 2], 0).tolist() == []
+
+
+async def run_assignment() -> dict:
+    admin = create_async_engine(DATABASE_URL, poolclass=NullPool)
+    engine = create_async_engine(DATABASE_URL, poolclass=NullPool, connect_args={"server_settings": {"search_path": SCHEMA}})
+
+    async def scratch_db():
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            yield session
+
+    try:
+        async with admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with AsyncSession(engine) as db:
+            db.add_all([
+                User(id="c1", email="c1@example.com", role="collector", is_verified=True),
+                User(id="c2", email="c2@example.com", role="collector", is_verified=True),
+                User(id="u1", email="u1@example.com", role="citizen"),
+            ])
+            await db.commit()
+            db.add_all([
+                PickupRequest(id="old1", user_id="u1", status="assigned", collector_id="c1", location={"lat": 28.20, "lng": 83.95}),
+                PickupRequest(id="old2", user_id="u1", status="assigned", collector_id="c2", location={"lat": 28.24, "lng": 84.02}),
+                PickupRequest(id="near1", user_id="u1", status="pending", location={"lat": 28.201, "lng": 83.951}),
+                PickupRequest(id="near2", user_id="u1", status="pending", location={"lat": 28.241, "lng": 84.021}),
+                PickupRequest(id="nowhere1", user_id="u1", status="pending", location={"address": "Ward 5"}),
+                PickupRequest(id="nowhere2", user_id="u1", status="pending", location=None),
+            ])
+            await db.commit()
+
+        result = {}
+        # Another run holds the lock: a non-waiting run steps aside
+        async with engine.connect() as other:
+            await other.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ASSIGN_LOCK_KEY})
+            async with AsyncSession(engine) as db:
+                result["busy"] = await assign_pending_pickups(db, wait=False)
+            await other.rollback()
+        async with AsyncSession(engine) as db:
+            result["run"] = await assign_pending_pickups(db, capacity_slack=1.0)
+            rows = (await db.execute(select(PickupRequest.id, PickupRequest.collector_id, PickupRequest.status))).all()
+        result["pickups"] = {pickup_id: (collector_id, status) for pickup_id, collector_id, status in rows}
+
+        app.dependency_overrides[get_db] = scratch_db
+        app.dependency_overrides[get_current_user] = lambda: User(id="c1", email="c1@example.com", role="collector")
+        try:
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+                route = (await client.get("/api/collector/routes/c1@example.com")).json()
+        finally:
+            app.dependency_overrides.clear()
+        result["route"] = [stop["id"] for stop in route["stops"]]
+        async with admin.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+        return result
+    finally:
+        await engine.dispose()
+        await admin.dispose()
+
+
+def test_assignment_places_new_and_unlocated_pickups():
+    try:
+        result = asyncio.run(run_assignment())
+    except (OSError, ConnectionError) as error:
+        pytest.skip(f"Postgres not reachable: {error}")
+    assert result["busy"] is None
+    assert result["run"]["assigned"] == 4 and result["run"]["unlocated"] == 2
+    pickups = result["pickups"]
+    assert pickups["near1"] == ("c1", "assigned") and pickups["near2"] == ("c2", "assigned")
+    # Both collectors hold two pickups, so the unlocated ones are split
+    assert sorted(pickups[pickup_id][0] for pickup_id in ("nowhere1", "nowhere2")) == ["c1", "c2"]
+    # Routable stops first, the unlocated one appended
+    unlocated = next(pickup_id for pickup_id in ("nowhere1", "nowhere2") if pickups[pickup_id][0] == "c1")
+    assert sorted(result["route"][:2]) == ["near1", "old1"] and result["route"][2:] == [unlocated]
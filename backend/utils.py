@@ -1,8 +1,13 @@
 from passlib.context import CryptContext
+from fastapi import Depends, HTTPException, Request, Response, status
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import jwt
+from concurrent.futures import ThreadPoolExecutor
+from prometheus_client import Counter, Gauge, Histogram
+import asyncio
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,12 +19,50 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+# bcrypt releases the GIL, so a small thread pool hashes in parallel while
+# the event loop keeps serving other requests.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Hashes allowed to wait or run at once before new ones are shed with 503
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", str(PASSWORD_HASH_WORKERS * 8)))
+
+password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_password_jobs = 0
+
+PASSWORD_HASH_IN_FLIGHT = Gauge("password_hash_in_flight", "bcrypt jobs queued or running")
+PASSWORD_HASH_REJECTED = Counter("password_hash_rejected_total", "bcrypt jobs shed because the pool was saturated")
+PASSWORD_HASH_SECONDS = Histogram("password_hash_seconds", "bcrypt job time including queueing", ["operation"])
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def _run_password_job(operation: str, func, *args):
+    global _password_jobs
+    if _password_jobs >= PASSWORD_HASH_QUEUE_LIMIT:
+        PASSWORD_HASH_REJECTED.inc()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication service busy, please retry",
+            headers={"Retry-After": "1"},
+        )
+    _password_jobs += 1
+    PASSWORD_HASH_IN_FLIGHT.set(_password_jobs)
+    started = time.perf_counter()
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_executor, func, *args)
+    finally:
+        _password_jobs -= 1
+        PASSWORD_HASH_IN_FLIGHT.set(_password_jobs)
+        PASSWORD_HASH_SECONDS.labels(operation=operation).observe(time.perf_counter() - started)
+
+async def verify_password_async(plain_password, hashed_password):
+    return await _run_password_job("verify", verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password):
+    return await _run_password_job("hash", get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -31,16 +74,18 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from tables import User
+from sqlalchemy import and_
+from tables import User, UserSession
 from database import get_db
+from services.auth_cache import user_cache, user_snapshot
+from services.pagination import fetch_page
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/login")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -54,9 +99,42 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
     except jwt.JWTError:
         raise credentials_exception
         
-    result = await db.execute(select(User).filter(User.email == email))
-    user = result.scalars().first()
-    
-    if user is None:
-        raise credentials_exception
+    cached = user_cache.get(email, token)
+    if cached is not None:
+        # Detached copy; routes only read from current_user
+        user = User(**cached)
+    else:
+        # The token must still belong to an active (non-revoked) session.
+        # A revocation landing during the read must not get cached.
+        generation = user_cache.generation
+        result = await db.execute(
+            select(User, UserSession.id)
+            .outerjoin(UserSession, and_(
+                UserSession.user_id == User.id,
+                UserSession.token == token,
+                UserSession.active == True
+            ))
+            .filter(User.email == email)
+        )
+        row = result.first()
+        if row is None or row[1] is None:
+            raise credentials_exception
+        user = row[0]
+        user_cache.put(email, token, user_snapshot(user), generation)
+
+    # Picked up by the audit log middleware
+    request.state.user_id = user.id
     return user
+
+# List endpoints keep returning a bare list; the cursor for the next page
+# (absent on the last one) travels in this header
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+async def paginate(db: AsyncSession, response: Response, query, sort_column, id_column, cursor: Optional[str], limit: int):
+    try:
+        rows, next_cursor = await fetch_page(db, query, sort_column, id_column, cursor, limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return rows
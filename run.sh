@@ -26,9 +26,15 @@ if [ $? -ne 0 ]; then
     exit 1
 fi
 
-# Initialize DB (if needed) - this is handled by startup event in main.py, 
-# but we need to make sure the DB exists first.
-# We assume the user has created 'waste_management' database.
+# Bring the schema up to date. We assume the user has created the
+# 'waste_management' database; the backend refuses to start on an
+# outdated schema.
+echo "Applying database migrations..."
+python3 manage.py migrate
+if [ $? -ne 0 ]; then
+    echo "Database migration failed."
+    exit 1
+fi
 
 # Start Backend
 echo "Starting Backend..."
@@ -3,17 +3,21 @@ import { Card, CardContent, CardHeader, CardTitle, CardDescription } from '@/com
 import { ResponsiveContainer, AreaChart, Area, XAxis, YAxis, CartesianGrid, Tooltip } from 'recharts';
 import { Leaf } from 'lucide-react';
 
-interface CarbonData {
+export interface CarbonData {
     date: string;
     co2: number;
     activities: number;
 }
 
-const CarbonFootprintChart = ({ userEmail }: { userEmail: string }) => {
-    const [data, setData] = useState<CarbonData[]>([]);
-    const [loading, setLoading] = useState(true);
+// Pass `data` when the parent already has it (the citizen dashboard
+// endpoint includes it); otherwise the chart fetches its own
+const CarbonFootprintChart = ({ userEmail, data: provided }: { userEmail: string; data?: CarbonData[] }) => {
+    const [fetched, setFetched] = useState<CarbonData[]>([]);
+    const [loading, setLoading] = useState(!provided);
+    const data = provided ?? fetched;
 
     useEffect(() => {
+        if (provided) return;
         const fetchCarbonData = async () => {
             try {
                 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
@@ -21,7 +25,7 @@ const CarbonFootprintChart = ({ userEmail }: { userEmail: string }) => {
 
                 if (res.ok) {
                     const carbonData = await res.json();
-                    setData(carbonData);
+                    setFetched(carbonData);
                 }
             } catch (error) {
                 console.error("Failed to fetch carbon footprint data", error);
@@ -31,7 +35,7 @@ const CarbonFootprintChart = ({ userEmail }: { userEmail: string }) => {
         };
 
         fetchCarbonData();
-    }, [userEmail]);
+    }, [userEmail, provided]);
 
     if (loading) return <div className="h-[200px] flex items-center justify-center text-sm text-gray-500">Loading chart...</div>;
 
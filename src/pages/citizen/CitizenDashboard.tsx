@@ -34,7 +34,7 @@ interface Notification {
 import RequestPickupModal from '@/components/citizen/RequestPickupModal';
 import ReportWasteModal from '@/components/citizen/ReportWasteModal';
 
-import CarbonFootprintChart from '@/components/citizen/CarbonFootprintChart';
+import CarbonFootprintChart, { type CarbonData } from '@/components/citizen/CarbonFootprintChart';
 
 const CitizenDashboard = () => {
     const navigate = useNavigate();
@@ -46,6 +46,7 @@ const CitizenDashboard = () => {
     });
     const [activities, setActivities] = useState<Activity[]>([]);
     const [notifications, setNotifications] = useState<Notification[]>([]);
+    const [carbonData, setCarbonData] = useState<CarbonData[]>([]);
     const [loading, setLoading] = useState(true);
     const [pickupModalOpen, setPickupModalOpen] = useState(false);
     const [reportModalOpen, setReportModalOpen] = useState(false);
@@ -57,15 +58,16 @@ const CitizenDashboard = () => {
                 const userEmail = "citizen@waste.com";
                 const API_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 
-                const [statsRes, activitiesRes, notifRes] = await Promise.all([
-                    fetch(`${API_URL}/api/citizen/stats/${userEmail}`),
-                    fetch(`${API_URL}/api/citizen/activities/${userEmail}`),
-                    fetch(`${API_URL}/api/citizen/notifications/${userEmail}`)
-                ]);
+                // Stats, activities, notifications and footprint in one call
+                const res = await fetch(`${API_URL}/api/citizen/dashboard/${userEmail}`);
 
-                if (statsRes.ok) setStats(await statsRes.json());
-                if (activitiesRes.ok) setActivities(await activitiesRes.json());
-                if (notifRes.ok) setNotifications(await notifRes.json());
+                if (res.ok) {
+                    const dashboard = await res.json();
+                    setStats(dashboard.stats);
+                    setActivities(dashboard.activities);
+                    setNotifications(dashboard.notifications);
+                    setCarbonData(dashboard.carbon_footprint);
+                }
 
             } catch (error) {
                 console.error("Failed to fetch dashboard data", error);
@@ -293,7 +295,7 @@ const CitizenDashboard = () => {
                 </Card>
             </div>
 
-            <CarbonFootprintChart userEmail="citizen@waste.com" />
+            <CarbonFootprintChart userEmail="citizen@waste.com" data={carbonData} />
         </div >
     );
 };